@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark wit's dependency resolution alone, on in-memory repositories.
+
+Builds the same kind of layered graph as wit_bench.py, but as MemoryRemote commit DAGs
+instead of git repositories, so graphs of thousands of packages resolve in seconds:
+
+    $ ./bench/resolve_bench.py --packages 10000 --depth 8 --fanout 4
+
+Each package gets a linear history, and each dependent pins a random commit of it,
+so the resolver has to check ancestry between the pins of shared dependencies.
+
+With --memory, allocations are traced as well, and each run also reports the peak traced
+memory of the resolve and what walking every edge of the resolved graph allocates:
+
+    $ ./bench/resolve_bench.py --packages 10000 --depth 8 --fanout 4 --memory
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from wit_bench import generate_graph, wit_root
+
+sys.path.insert(0, str(wit_root / 'lib'))
+
+from wit.backend import set_backend  # noqa: E402
+from wit.memrepo import MemoryBackend, MemoryRemote  # noqa: E402
+from wit.repo_entries import RepoEntry  # noqa: E402
+from wit.workspace import WorkSpace  # noqa: E402
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packages', type=int, default=1000, help='number of packages')
+    parser.add_argument('--depth', type=int, default=6, help='levels in the dependency graph')
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='dependencies per package on the next level')
+    parser.add_argument('--history', type=int, default=5, help='commits per repository')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the graph generator')
+    parser.add_argument('--repeat', type=int, default=3, help='resolves to time')
+    parser.add_argument('-j', '--jobs', type=int, default=64, help='parallel loads')
+    parser.add_argument('--memory', action='store_true',
+                        help='trace allocations of resolving and walking the graph')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    return parser.parse_args(argv)
+
+
+def source(name):
+    return 'mem://' + name
+
+
+def generate_remotes(args):
+    """One MemoryRemote per package, deepest level first so that dependees are older"""
+    rng = random.Random(args.seed)
+    levels, deps = generate_graph(args)
+    remotes = {}
+    history = {}
+    clock = 1500000000
+    for level in reversed(levels):
+        for name in level:
+            remote = MemoryRemote()
+            commits = []
+            for _ in range(max(1, args.history)):
+                clock += 60
+                entries = [RepoEntry(d, rng.choice(history[d]), source(d)) for d in deps[name]]
+                commits.append(remote.commit(clock, entries))
+            history[name] = commits
+            remotes[source(name)] = remote
+    top = [RepoEntry(name, history[name][-1], source(name)) for name in levels[0]]
+    return remotes, top
+
+
+def walk(packages):
+    """The dependencies of every resolved package, asked for the way 'wit inspect' does"""
+    return [pkg.get_dependencies() for pkg in packages.values() if pkg.repo is not None]
+
+
+def main(argv):
+    args = parse_args(argv)
+    start = time.monotonic()
+    remotes, top = generate_remotes(args)
+    print("Generated {} packages in {:.3f}s".format(len(remotes), time.monotonic() - start))
+
+    times = []
+    peaks = []
+    walks = []
+    for run in range(args.repeat):
+        with tempfile.TemporaryDirectory(prefix='wit-resolve-bench.') as tmp:
+            root = Path(tmp)
+            WorkSpace.create(str(root), [], args.jobs)
+            (root / WorkSpace.MANIFEST).write_text(json.dumps(
+                [{'name': e.checkout_path, 'commit': e.revision, 'source': e.remote_url}
+                 for e in top]))
+            set_backend(MemoryBackend(remotes))
+            try:
+                ws = WorkSpace(root, [], args.jobs)
+                if args.memory:
+                    tracemalloc.start()
+                start = time.monotonic()
+                packages, errors = ws.resolve(download=True)
+                times.append(time.monotonic() - start)
+                if args.memory:
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    # the first walk may fill caches, the second should allocate no new edges
+                    walk(packages)
+                    before = tracemalloc.get_traced_memory()[0]
+                    deps = walk(packages)
+                    walks.append(tracemalloc.get_traced_memory()[0] - before)
+                    edges = sum(len(d) for d in deps)
+                    tracemalloc.stop()
+            finally:
+                set_backend(None)
+        print("run {}/{}: resolved {} packages with {} errors in {:.3f}s".format(
+            run + 1, args.repeat, len(packages), len(errors), times[-1]))
+        if args.memory:
+            print("  peak {:.1f} MiB while resolving, a walk of {} edges allocated {} bytes"
+                  .format(peaks[-1] / 2**20, edges, walks[-1]))
+
+    results = {
+        'params': {key: getattr(args, key)
+                   for key in ['packages', 'depth', 'fanout', 'history', 'seed']},
+        'resolve': {'runs': [round(t, 4) for t in times], 'min': round(min(times), 4)},
+    }
+    if args.memory:
+        results['memory'] = {'peak': max(peaks), 'walk': max(walks)}
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, sort_keys=True, indent=4) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
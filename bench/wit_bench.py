@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark wit on synthetic workspaces.
+
+Generates a dependency graph of local bare repositories, then times wit commands on it
+and optionally compares the results against a previous run:
+
+    $ ./bench/wit_bench.py --packages 50 --depth 4 --fanout 3 -o new.json
+    $ ./bench/wit_bench.py --packages 50 --depth 4 --fanout 3 --baseline new.json
+
+The generated repositories are only a function of the graph parameters and --seed, so runs
+with the same parameters are comparable across wit versions.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+wit_root = Path(__file__).resolve().parent.parent
+
+# Commands in the order they are timed. Each is run in the workspace created by 'init',
+# except those that create their own workspace.
+COMMANDS = ['version', 'init', 'update', 'update-noop', 'status', 'inspect-tree', 'inspect-dot',
+            'restore']
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    graph = parser.add_argument_group('workspace shape')
+    graph.add_argument('--packages', type=int, default=20, help='number of packages')
+    graph.add_argument('--depth', type=int, default=3, help='levels in the dependency graph')
+    graph.add_argument('--fanout', type=int, default=3,
+                       help='dependencies per package on the next level')
+    graph.add_argument('--history', type=int, default=5, help='commits per repository')
+    graph.add_argument('--repo-size', type=int, default=64,
+                       help='KiB of incompressible data committed to each repository')
+    graph.add_argument('--submodule-share', type=float, default=0.2,
+                       help='share of packages declaring dependencies in .gitmodules only')
+    graph.add_argument('--seed', type=int, default=0, help='seed for the graph generator')
+
+    run = parser.add_argument_group('measurement')
+    run.add_argument('--wit', default=str(wit_root / 'wit'), help='wit executable to time')
+    run.add_argument('--repeat', type=int, default=3, help='runs per command')
+    run.add_argument('--commands', default=','.join(COMMANDS),
+                     help='comma separated subset of: {}'.format(', '.join(COMMANDS)))
+    run.add_argument('--workdir', help='keep repositories and workspaces here')
+    run.add_argument('-o', '--output', help='write results as JSON to this file')
+    run.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    run.add_argument('--threshold', type=float, default=0.10,
+                     help='relative slowdown over the baseline that fails the comparison')
+    return parser.parse_args(argv)
+
+
+def git_env(timestamp=None):
+    env = os.environ.copy()
+    env.update({
+        'GIT_AUTHOR_NAME': 'wit-bench',
+        'GIT_AUTHOR_EMAIL': 'wit-bench@localhost',
+        'GIT_COMMITTER_NAME': 'wit-bench',
+        'GIT_COMMITTER_EMAIL': 'wit-bench@localhost',
+    })
+    if timestamp is not None:
+        date = '@{} +0000'.format(timestamp)
+        env['GIT_AUTHOR_DATE'] = date
+        env['GIT_COMMITTER_DATE'] = date
+    return env
+
+
+def git(*args, cwd, env=None):
+    proc = subprocess.run(['git', *args], cwd=str(cwd), env=env or git_env(),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode:
+        raise Exception("git {} failed in {}:\n{}".format(' '.join(args), cwd, proc.stderr))
+    return proc.stdout.strip()
+
+
+def generate_graph(args):
+    """
+    Returns (levels, deps): the package names on each level, top level first,
+    and the names each package depends on. Every package below the top level
+    has at least one dependent.
+    """
+    rng = random.Random(args.seed)
+    depth = max(1, min(args.depth, args.packages))
+    names = ['pkg{:04d}'.format(i) for i in range(args.packages)]
+    levels = [names[i * len(names) // depth:(i + 1) * len(names) // depth]
+              for i in range(depth)]
+
+    deps = {name: [] for name in names}
+    for upper, lower in zip(levels, levels[1:]):
+        for name in upper:
+            deps[name] = rng.sample(lower, min(args.fanout, len(lower)))
+        chosen = {d for name in upper for d in deps[name]}
+        for orphan in lower:
+            if orphan not in chosen:
+                deps[rng.choice(upper)].append(orphan)
+    return levels, deps
+
+
+def generate_repos(args, repos_dir):
+    """Create one bare repository per package, deepest level first so dependees are older"""
+    rng = random.Random(args.seed)
+    levels, deps = generate_graph(args)
+    work_dir = repos_dir / 'work'
+    clock = [1500000000]
+    commits = {}
+
+    def commit(work, message, path):
+        clock[0] += 60
+        env = git_env(clock[0])
+        # not 'add -A', which would drop the gitlinks of submodules that are not checked out
+        git('add', path, cwd=work, env=env)
+        git('commit', '-q', '-m', message, cwd=work, env=env)
+
+    chunk = max(1, args.repo_size * 1024 // max(1, args.history))
+    for level in reversed(levels):
+        for name in level:
+            work = work_dir / name
+            work.mkdir(parents=True)
+            git('init', '-q', cwd=work)
+            for i in range(max(1, args.history)):
+                (work / 'data').write_bytes(rng.getrandbits(8 * chunk).to_bytes(chunk, 'little'))
+                commit(work, 'commit {}'.format(i), 'data')
+
+            if deps[name]:
+                if rng.random() < args.submodule_share:
+                    write_submodules(work, deps[name], repos_dir, commits)
+                    commit(work, 'add submodules', '.gitmodules')
+                else:
+                    manifest = [{'name': d, 'source': str(repos_dir / (d + '.git')),
+                                 'commit': commits[d]} for d in deps[name]]
+                    (work / 'wit-manifest.json').write_text(
+                        json.dumps(manifest, sort_keys=True, indent=4) + '\n')
+                    commit(work, 'add dependencies', 'wit-manifest.json')
+
+            commits[name] = git('rev-parse', 'HEAD', cwd=work)
+            git('clone', '-q', '--bare', str(work), str(repos_dir / (name + '.git')),
+                cwd=repos_dir)
+    shutil.rmtree(str(work_dir))
+    return levels[0]
+
+
+def write_submodules(work, names, repos_dir, commits):
+    lines = []
+    for d in names:
+        lines += ['[submodule "{}"]'.format(d),
+                  '\tpath = {}'.format(d),
+                  '\turl = {}'.format(repos_dir / (d + '.git'))]
+        git('update-index', '--add', '--cacheinfo', '160000,{},{}'.format(commits[d], d),
+            cwd=work)
+    (work / '.gitmodules').write_text('\n'.join(lines) + '\n')
+
+
+def run_wit(args, env, cwd, *wit_args):
+    start = time.monotonic()
+    proc = subprocess.run([args.wit, *wit_args], cwd=str(cwd), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True)
+    elapsed = time.monotonic() - start
+    if proc.returncode:
+        raise Exception("wit {} failed in {}:\n{}".format(' '.join(wit_args), cwd, proc.stdout))
+    return elapsed
+
+
+def measure(args, root_packages, repos_dir, runs_dir):
+    env = git_env()
+    # keep wit's clone history for these repositories out of the user's cache
+    env['WIT_CACHE_DIR'] = str(runs_dir / 'cache')
+    sources = [str(repos_dir / (name + '.git')) for name in root_packages]
+    add_pkgs = [arg for source in sources for arg in ('-a', source)]
+    wanted = args.commands.split(',')
+    timings = {command: [] for command in COMMANDS if command in wanted}
+
+    for run in range(args.repeat):
+        run_dir = runs_dir / 'run{}'.format(run)
+        run_dir.mkdir(parents=True)
+        ws = run_dir / 'ws'
+
+        def timed(command, cwd, *wit_args):
+            elapsed = run_wit(args, env, cwd, *wit_args)
+            if command in timings:
+                timings[command].append(elapsed)
+                print("  {:<14} {:8.3f}s".format(command, elapsed))
+
+        print("run {}/{}".format(run + 1, args.repeat))
+        timed('version', run_dir, '--version')
+        timed('init', run_dir, 'init', 'ws', *add_pkgs)
+        run_wit(args, env, run_dir, 'init', '--no-update', 'cold', *add_pkgs)
+        timed('update', run_dir / 'cold', 'update')
+        timed('update-noop', ws, 'update')
+        timed('status', ws, 'status')
+        timed('inspect-tree', ws, 'inspect', '--tree')
+        timed('inspect-dot', ws, 'inspect', '--dot')
+        timed('restore', run_dir, 'restore', '-n', 'restored', '-w', str(ws))
+        shutil.rmtree(str(run_dir))
+
+    return {command: summarize(times) for command, times in timings.items()}
+
+
+def summarize(times):
+    return {
+        'runs': [round(t, 4) for t in times],
+        'median': round(statistics.median(times), 4),
+        'min': round(min(times), 4),
+    }
+
+
+def wit_version(args):
+    proc = subprocess.run([args.wit, '--version'], stdout=subprocess.PIPE,
+                          universal_newlines=True)
+    return proc.stdout.strip()
+
+
+def compare(results, baseline, threshold):
+    """Print the median of each command against the baseline. Returns True if none regressed."""
+    ok = True
+    if baseline['params'] != results['params']:
+        print("warning: baseline was measured with different parameters")
+    print("{:<14} {:>10} {:>10} {:>8}".format('command', 'baseline', 'current', 'change'))
+    for command, current in results['commands'].items():
+        before = baseline['commands'].get(command)
+        if before is None:
+            continue
+        change = current['median'] / before['median'] - 1 if before['median'] else 0.0
+        regressed = change > threshold
+        ok = ok and not regressed
+        print("{:<14} {:>9.3f}s {:>9.3f}s {:>+7.1%}{}".format(
+            command, before['median'], current['median'], change,
+            "  REGRESSION" if regressed else ""))
+    return ok
+
+
+def main(argv):
+    args = parse_args(argv)
+    params = {key: getattr(args, key) for key in
+              ['packages', 'depth', 'fanout', 'history', 'repo_size', 'submodule_share',
+               'seed']}
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='wit-bench.')).resolve()
+    try:
+        repos_dir = workdir / 'repos'
+        repos_dir.mkdir(parents=True)
+        print("Generating {} packages in {}".format(args.packages, repos_dir))
+        root_packages = generate_repos(args, repos_dir)
+
+        results = {
+            'wit': wit_version(args),
+            'params': params,
+            'commands': measure(args, root_packages, repos_dir, workdir / 'runs'),
+        }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(str(workdir), ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, sort_keys=True, indent=4) + '\n')
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -5,18 +5,22 @@ _wit()
     cur="${COMP_WORDS[COMP_CWORD]}"
     prev="${COMP_WORDS[COMP_CWORD-1]}"
 
-    global_flags="-h --help -v -vv -vvv -vvvv --verbose --version -C --repo-path --prepend-repo-path"
+    global_flags="-h --help -v -vv -vvv -vvvv --verbose --version --list-commands -C --repo-path --prepend-repo-path --fail-fast --no-fail-fast --profile --trace-file"
 
     if [[ ${prev} == wit ]] ; then
         if [[ ${cur} == -* ]] ; then
             COMPREPLY=( $(compgen -W "${global_flags}" -- ${cur}) )
             return 0
         else
-            opts="init add-pkg update-pkg add-dep update-dep status update"
+            # 'wit --list-commands' is answered without loading the rest of wit
+            opts=$(wit --list-commands 2>/dev/null | cut -f1)
+            if [[ -z ${opts} ]] ; then
+                opts="init add-pkg update-pkg add-dep update-dep status update"
+            fi
             COMPREPLY=( $(compgen -W "${opts}" -- ${cur}) )
             return 0
         fi
-    elif [[ ${prev} == -C ]] || [[ ${prev} == --repo-path ]] || [[ ${prev} == --prepend-repo-path ]] ; then
+    elif [[ ${prev} == -C ]] || [[ ${prev} == --trace-file ]] || [[ ${prev} == --repo-path ]] || [[ ${prev} == --prepend-repo-path ]] ; then
         comptopt -o filenames 2>/dev/null
         COMPREPLY=( $(compgen -f -- ${cur}) )
         return 0
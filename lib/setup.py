@@ -1,8 +1,22 @@
+import os
 import setuptools
+from setuptools.command.build_py import build_py
 
-version = {}
+version = {'__file__': os.path.abspath("wit/version.py")}
 with open("wit/version.py") as fd:
     exec(fd.read(), version)
+git_version = version['get_git_version']()
+
+
+class BuildPy(build_py):
+    """Records the exact version in wit/_version.py so 'wit --version' needs no git command"""
+
+    def run(self):
+        super().run()
+        path = os.path.join(self.build_lib, 'wit', '_version.py')
+        with open(path, 'w') as fd:
+            fd.write('version = "{}"\n'.format(git_version or version['__version__']))
+
 
 setuptools.setup(
     name='wit-sifive',
@@ -16,4 +30,5 @@ setuptools.setup(
     entry_points={'console_scripts': ['wit=wit.main:main']},
     python_requires='>=3.5',
     classifiers=["License :: OSI Approved :: Apache Software License"],
+    cmdclass={'build_py': BuildPy},
 )
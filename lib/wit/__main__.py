@@ -7,5 +7,9 @@ if sys.version_info[0] < 3 or sys.version_info[1] < 5:
     sys.exit(1)
 
 if __name__ == '__main__':
+    # wrapper scripts call 'wit --version' and friends often; skip loading the CLI for them
+    from .commands import fast_path
+    if fast_path(sys.argv[1:], sys.stdout):
+        sys.exit(0)
     from .main import main
     main()
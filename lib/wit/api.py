@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""
+A Python interface to wit workspaces, for tools that would otherwise run wit over and over
+and read what it prints:
+
+    from wit.api import Workspace
+
+    ws = Workspace.open('path/to/workspace')
+    for package in ws.lock():
+        print(package.name, package.revision)
+    if ws.status().dirty:
+        ...
+
+A Workspace stays loaded between calls, the way 'wit daemon' keeps one: the manifest and
+lockfile, the resolved graph and the answers of read-only repository queries are reused until
+a file they were read from changes, which is checked at the start of every call.
+
+Calls return the named tuples defined here. Failures that 'wit' would report to the user are
+raised as WitUserError, and nothing here exits the process. Resolution errors, which 'wit'
+lists after its output, are returned in the 'errors' field of the results instead.
+
+A Workspace is not safe to use from several threads at once.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional  # noqa: F401
+from .backend import get_backend, set_backend
+from .common import WitUserError
+from .daemon import Snapshot, SnapshotBackend, SnapshotWorkSpace
+from .gitrepo import GitRepo
+from .inspect import GraphExporter, export_graph
+from .workspace import WorkSpace
+
+# A package at a commit, as resolved or locked
+PackageInfo = namedtuple('PackageInfo', ['name', 'revision', 'source'])
+
+# The packages the workspace resolves to, in the order they were found, and the resolution
+# errors
+Resolved = namedtuple('Resolved', ['packages', 'errors'])
+
+# What 'wit status' reports. clean, missing and staged (left in .wit/ by 'wit update --only')
+# are package names, dirty maps names to what is wrong ("new commits", "modified content",
+# "untracked content"), untracked lists the paths of unlocked git repositories relative to the
+# workspace, and pending maps names to what 'wit update' would do to them: 'checkout' another
+# commit, 'add' them to the workspace and lockfile, or add them to the 'lock' only
+Status = namedtuple('Status', ['clean', 'dirty', 'untracked', 'missing', 'staged', 'pending',
+                               'errors'])
+
+# The graph of 'wit inspect --json', see inspect.GraphExporter for the kinds of nodes and edges
+Graph = namedtuple('Graph', ['nodes', 'edges', 'errors'])
+Node = namedtuple('Node', ['id', 'label', 'kind'])
+Edge = namedtuple('Edge', ['source', 'target', 'kind'])
+
+
+class WorkspaceNotFound(WitUserError):
+    pass
+
+
+class Workspace:
+    def __init__(self, root: Path, repo_paths: List[str], jobs=None):
+        self.root = root
+        self.repo_paths = repo_paths
+        self.jobs = jobs
+        self._snapshot = None  # type: Optional[Snapshot]
+        self._backend = None  # type: Optional[SnapshotBackend]
+        self._ws = None  # type: Optional[SnapshotWorkSpace]
+
+    @classmethod
+    def open(cls, path='.', repo_paths=None, jobs=None) -> 'Workspace':
+        """
+        The workspace that path is in. repo_paths and jobs are --repo-path and
+        --max-parallel-clones.
+        """
+        try:
+            root = WorkSpace.find_root(Path(path))
+        except FileNotFoundError:
+            raise WorkspaceNotFound("[{}] is not in a wit workspace".format(path))
+        return cls(root, list(repo_paths or []), jobs)
+
+    @contextmanager
+    def _loaded(self):
+        """The loaded workspace, reloaded if it changed, with its repositories in use"""
+        snapshot = Snapshot(self.root)
+        if snapshot != self._snapshot:
+            for _, cache in GitRepo.caches():
+                cache.cache_clear()
+            self._backend = SnapshotBackend(get_backend())
+            self._ws = SnapshotWorkSpace(self.root, self.repo_paths, self.jobs)
+            self._snapshot = snapshot
+        backend = get_backend()
+        set_backend(self._backend)
+        try:
+            yield self._ws
+        except Exception:
+            # whatever went wrong may have left cached state half built
+            self._snapshot = None
+            raise
+        finally:
+            set_backend(backend)
+
+    def resolve(self) -> Resolved:
+        """Resolve the workspace from the commits on disk, as 'wit status' does"""
+        with self._loaded() as ws:
+            packages, errors = ws.resolve()
+            return Resolved([_info(p) for p in packages.values()], errors)
+
+    def status(self) -> Status:
+        with self._loaded() as ws:
+            st = ws.status()
+            packages, errors = ws.resolve()
+            pending = {}
+            for name, package in packages.items():
+                change = package.pending_change(ws.lock)
+                if change is not None:
+                    pending[name] = change
+            return Status(clean=[p.name for p in st.clean],
+                          dirty=dict((p.name, states) for p, states in st.dirty),
+                          untracked=[str(path.relative_to(self.root)) for path in st.untracked],
+                          missing=[p.name for p in st.missing],
+                          staged=[p.name for p in st.staged],
+                          pending=pending,
+                          errors=errors)
+
+    def graph(self) -> Graph:
+        """The resolved dependency graph, as 'wit inspect --json' exports it"""
+        with self._loaded() as ws:
+            packages, errors = ws.resolve()
+            collector = _GraphCollector()
+            export_graph(ws, packages, collector)
+            return Graph(collector.nodes, collector.edges, errors)
+
+    def lock(self) -> List[PackageInfo]:
+        """The packages in wit-lock.json, in its order"""
+        with self._loaded() as ws:
+            return [_info(p) for p in ws.lock.packages]
+
+    def update(self, only=None) -> Resolved:
+        """
+        Resolve, fetching what is missing, and check out the result as 'wit update' does,
+        unless there are resolution errors. only is a list of package names as for
+        'wit update --only'.
+        """
+        # fetches change what repository queries answer, so this runs without the snapshot
+        self._snapshot = None
+        ws = WorkSpace(self.root, self.repo_paths, self.jobs)
+        packages, errors = ws.resolve(download=True)
+        if not errors:
+            ws.checkout(packages, only)
+        return Resolved([_info(p) for p in packages.values()], errors)
+
+
+def _info(package) -> PackageInfo:
+    return PackageInfo(package.name, package.revision, package.source)
+
+
+class _GraphCollector(GraphExporter):
+    def __init__(self):
+        super().__init__(None)
+        self.nodes = []  # type: List[Node]
+        self.edges = []  # type: List[Edge]
+
+    def node(self, node_id, label, kind):
+        self.nodes.append(Node(node_id, label, kind))
+
+    def edge(self, source, target, kind):
+        self.edges.append(Edge(source, target, kind))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional  # noqa: F401
+from .repo_entries import RepoEntry  # noqa: F401
+
+
+class Repo(ABC):
+    """
+    The queries and operations that Package, Dependency and WorkSpace need from a repository.
+
+    GitRepo implements these by running git. Anything else that can answer them, such as
+    MemoryRepo for resolver benchmarks, can be swapped in through set_backend() without
+    touching the resolution logic.
+
+    Revisions are strings: full hashes, abbreviated hashes, tags or branch names.
+    """
+
+    def __init__(self, name, wsroot: Path):
+        self.name = name
+        self.path = wsroot / name
+        self.wsroot = wsroot
+        # set by offline.OfflineBackend: bring commits in from local copies only
+        self.offline = False
+
+    def exists(self) -> bool:
+        """Whether the repository has been downloaded to self.path"""
+        return self.path.exists()
+
+    # name is needed for generating error messages
+    @abstractmethod
+    def download(self, source, name):
+        """
+        Clone or fetch source into self.path. Returns a gitrepo.Transfer describing
+        the download, or None if there is nothing to learn from it.
+        """
+
+    def prefetch(self, source, name):
+        """
+        Bring in the commits of source ahead of time without changing what any of the
+        repository's own refs point at. Returns a gitrepo.Transfer, or None.
+        """
+        return self.download(source, name)
+
+    def ls_remote(self, source) -> Optional[Dict[str, str]]:
+        """The refs source advertises, by full name, or None if they cannot be listed"""
+        return None
+
+    @abstractmethod
+    def get_commit(self, commit) -> str:
+        """The full hash of a revision. Raises GitCommitNotFound if there is none."""
+
+    def get_head_commit(self) -> str:
+        return self.get_commit('HEAD')
+
+    @abstractmethod
+    def get_shortened_rev(self, commit) -> str:
+        pass
+
+    def is_hash(self, ref) -> bool:
+        return self.get_commit(ref) == ref
+
+    @abstractmethod
+    def is_tag(self, ref) -> bool:
+        pass
+
+    @abstractmethod
+    def has_commit(self, commit) -> bool:
+        pass
+
+    @abstractmethod
+    def commit_to_time(self, hash) -> str:
+        """Committer time of a revision, in seconds since the epoch"""
+
+    @abstractmethod
+    def is_ancestor(self, ancestor, current=None) -> bool:
+        """Whether ancestor is in the history of current, which defaults to HEAD"""
+
+    @abstractmethod
+    def have_common_ancestor(self, commits) -> bool:
+        pass
+
+    @abstractmethod
+    def repo_entries_from_commit(self, revision) -> List[RepoEntry]:
+        """The dependencies declared by the manifest (or .gitmodules) at revision"""
+
+    def tree_id(self, revision) -> Optional[str]:
+        """Id of the tree of revision, if the repository has such a thing"""
+        return None
+
+    def manifest_id(self, revision) -> Optional[str]:
+        """Id of the wit-manifest.json blob at revision, if there is one"""
+        return None
+
+    @abstractmethod
+    def checkout(self, revision, sparse=None, was_sparse=False):
+        """
+        Check out revision. sparse lists the directories to check out in cone-mode sparse
+        checkout. With None, a sparse checkout wit set up before (was_sparse) is undone, and
+        one the user set up is left alone.
+        """
+
+    @abstractmethod
+    def get_remote(self) -> str:
+        pass
+
+    @abstractmethod
+    def set_origin(self, source):
+        pass
+
+    @abstractmethod
+    def clean(self) -> bool:
+        pass
+
+    @abstractmethod
+    def modified(self) -> bool:
+        pass
+
+    @abstractmethod
+    def untracked(self) -> bool:
+        pass
+
+    @abstractmethod
+    def modified_manifest(self) -> bool:
+        pass
+
+
+class Backend(ABC):
+    """Opens repositories of one kind"""
+
+    @abstractmethod
+    def open(self, name, wsroot: Path) -> Repo:
+        """The repository named name under wsroot, whether or not it exists yet"""
+
+    @abstractmethod
+    def is_repo(self, path) -> bool:
+        """Whether path (or url) points at a repository this backend can clone from"""
+
+    def size_hint(self, name, wsroot: Path, source) -> Optional[int]:
+        """Bytes a download of source is expected to bring in, if known"""
+        return None
+
+
+_backend = None  # type: Optional[Backend]
+
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        from .gitrepo import GitBackend
+        _backend = GitBackend()
+    return _backend
+
+
+def set_backend(backend: Optional[Backend]):
+    """Use backend for all packages from now on. None restores the git backend."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Optional  # noqa: F401
+from .common import WitUserError, atomic_write_json
+
+
+class BundleIndex:
+    """
+    The git bundles in a directory written by 'wit bundle create', one per package, and
+    the lockfile commit and source each was written for, kept in wit-bundles.json beside them.
+    """
+    FILE = "wit-bundles.json"
+
+    def __init__(self, directory: Path, entries=None):
+        self.directory = directory
+        self.entries = entries or {}  # type: Dict[str, dict]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def read(cls, directory: Path) -> 'BundleIndex':
+        path = directory / cls.FILE
+        try:
+            return BundleIndex(directory, json.loads(path.read_text()))
+        except OSError as e:
+            raise WitUserError("Unable to read bundle index [{}]: {}".format(path, e))
+        except ValueError as e:
+            raise WitUserError("Bundle index [{}] is not valid JSON: {}".format(path, e))
+
+    def bundle_path(self, name) -> Path:
+        return self.directory / "{}.bundle".format(name)
+
+    def add(self, name, source, commit):
+        with self._lock:
+            self.entries[name] = {'source': source, 'commit': commit,
+                                  'bundle': self.bundle_path(name).name}
+
+    def lookup(self, name) -> Optional[Path]:
+        """The bundle of package name, if there is one"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        path = self.directory / entry['bundle']
+        return path if path.is_file() else None
+
+    def write(self):
+        atomic_write_json(self.directory / self.FILE, self.entries)
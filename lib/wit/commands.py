@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# Subcommands and their one line help, in the order 'wit -h' lists them.
+# Kept free of imports so that 'wit --list-commands' can print them without
+# loading argparse or the rest of wit.
+COMMANDS = [
+    ('init', 'create workspace'),
+    ('restore', 'restore previous workspace'),
+    ('add-pkg', 'add a package to the workspace'),
+    ('update-pkg', 'update the revision of a previously added package'),
+    ('add-dep', 'add a dependency to a package'),
+    ('update-dep', 'update revision of a dependency in a package'),
+    ('status', 'show status of workspace'),
+    ('update', 'update git repos'),
+    ('inspect', 'inspect lockfile'),
+    ('foreach', 'perform a command in each repository directory'),
+    ('prefetch', 'fetch package remotes in the background, ahead of update'),
+    ('bundle', "write git bundles of the locked packages for 'restore --from-bundles'"),
+    ('daemon', 'serve status and inspect for this workspace from memory'),
+]
+
+HELP = dict(COMMANDS)
+
+
+def list_commands(out) -> None:
+    """One subcommand per line, then a tab and its help, for shell completion"""
+    for name, help in COMMANDS:
+        out.write("{}\t{}\n".format(name, help))
+
+
+def fast_path(argv, out) -> bool:
+    """
+    Answers 'wit --version' and 'wit --list-commands' without building the parser or
+    importing the rest of wit. Returns False if argv is anything else.
+    """
+    if argv == ['--version']:
+        from .version import get_version
+        out.write("wit {}\n".format(get_version()))
+        return True
+    if argv == ['--list-commands']:
+        list_commands(out)
+        return True
+    return False
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
+import json
+import os
 import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
 from .witlogger import getLogger
 
 log = getLogger()
 
 
 def error(*args, **kwargs):
+    """For main only. Everything below it raises WitUserError, which wit.api relies on."""
     log.error(*args, **kwargs)
     sys.exit(1)
 
@@ -25,3 +31,40 @@ class WitUserError(Exception):
     Supertype of user-input errors that should be reported without stack traces
     """
     pass
+
+
+def load_json(path: Path) -> dict:
+    """The JSON object in path, or an empty one if path cannot be read or parsed"""
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def replacing(path: Path):
+    """
+    A temporary path beside path, renamed over path if the block finishes and removed if it
+    raises, so that concurrent readers never see a partial file. The name is unique to the
+    process and thread, as the daemon writes from several threads.
+    """
+    tmp = path.with_name("{}.{}.{}".format(path.name, os.getpid(), threading.get_ident()))
+    try:
+        yield tmp
+        os.replace(str(tmp), str(path))
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def atomic_write_text(path: Path, text: str):
+    """Replace path with text. Raises OSError."""
+    with replacing(path) as tmp:
+        tmp.write_text(text)
+
+
+def atomic_write_json(path: Path, data, indent=4) -> str:
+    """Replace path with data as JSON. Returns the text written. Raises OSError."""
+    text = json.dumps(data, sort_keys=True, indent=indent) + "\n"
+    atomic_write_text(path, text)
+    return text
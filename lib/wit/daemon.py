@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple  # noqa: F401
+from .backend import Backend, get_backend, set_backend
+from .common import WitUserError
+from .daemon_client import request, socket_path
+from .gitrepo import GitRepo
+from .workspace import WorkSpace
+from .witlogger import getLogger
+
+log = getLogger()
+
+# Repository queries whose answers only change when refs, HEAD or the repository's
+# manifest change, all of which are part of a Snapshot
+MEMOIZED = ['get_commit', 'get_shortened_rev', 'is_tag', 'has_commit', 'commit_to_time',
+            'is_ancestor', 'have_common_ancestor', 'repo_entries_from_commit']
+
+
+class DaemonError(WitUserError):
+    pass
+
+
+class Snapshot:
+    """
+    Modification stamps of everything the daemon's cached state is derived from: the
+    workspace manifest and lockfile, the workspace and .wit directories (packages coming
+    and going), and for each repository its HEAD, refs and dependency files.
+
+    Uncommitted changes to the working tree are not tracked; commands that report them,
+    such as GitRepo.clean(), are never memoized.
+    """
+
+    def __init__(self, root: Path):
+        self.stamps = {}  # type: Dict[str, Optional[Tuple[int, int, int]]]
+        self._stamp(root / WorkSpace.MANIFEST)
+        self._stamp(root / WorkSpace.LOCK)
+        for parent in (root, root / '.wit'):
+            self._stamp(parent)
+            try:
+                children = sorted(parent.iterdir())
+            except OSError:
+                continue
+            for repo in children:
+                if (repo / '.git').exists():
+                    self._stamp_repo(repo)
+
+    def _stamp(self, path: Path):
+        try:
+            st = path.stat()
+            self.stamps[str(path)] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            self.stamps[str(path)] = None
+
+    def _stamp_repo(self, repo: Path):
+        git = repo / '.git'
+        for path in [git / 'HEAD', git / 'packed-refs',
+                     repo / GitRepo.PKG_DEPENDENCY_FILE, repo / GitRepo.SUBMODULE_FILE]:
+            self._stamp(path)
+        # git updates refs by renaming a lock file over them, which also touches the directory,
+        # so stamping every directory catches nested refs such as refs/heads/feature/x
+        for refs in [git / 'refs' / 'heads', git / 'refs' / 'tags',
+                     git / 'refs' / 'remotes' / 'origin']:
+            self._stamp(refs)
+            for dirpath, _, _ in os.walk(str(refs)):
+                self._stamp(Path(dirpath))
+        # and the branch HEAD is on, for good measure
+        try:
+            head = (git / 'HEAD').read_text()
+        except OSError:
+            return
+        if head.startswith('ref: '):
+            self._stamp(git / head[len('ref: '):].strip())
+
+    def __eq__(self, other):
+        return isinstance(other, Snapshot) and self.stamps == other.stamps
+
+
+def _memoize(fn):
+    results = {}  # type: Dict[tuple, object]
+
+    def memoized(*args):
+        if args not in results:
+            results[args] = fn(*args)
+        return results[args]
+    return memoized
+
+
+class SnapshotBackend(Backend):
+    """
+    Hands out a single repository object per path, with its read-only queries memoized.
+    Only valid while the Snapshot it was created with is current.
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self._repos = {}  # type: Dict[Path, object]
+
+    def open(self, name, wsroot: Path):
+        path = wsroot / name
+        if path not in self._repos:
+            repo = self.backend.open(name, wsroot)
+            for method in MEMOIZED:
+                setattr(repo, method, _memoize(getattr(repo, method)))
+            self._repos[path] = repo
+        return self._repos[path]
+
+    def is_repo(self, path) -> bool:
+        return self.backend.is_repo(path)
+
+
+class SnapshotWorkSpace(WorkSpace):
+    """A WorkSpace that resolves its packages once, without downloading, and keeps the result"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._graph = None  # type: Optional[Tuple[dict, list]]
+
+    def resolve_graph(self, download=False):
+        if download:
+            return super().resolve_graph(download)
+        if self._graph is None:
+            self._graph = super().resolve_graph(download)
+        packages, errors = self._graph
+        return dict(packages), list(errors)
+
+
+# the thread 'wit daemon --prefetch-interval' runs prefetches on, whose parallel workers
+# are named after it
+PREFETCH_THREAD = 'wit-prefetch'
+
+
+def _in_prefetch() -> bool:
+    return threading.current_thread().name.startswith(PREFETCH_THREAD)
+
+
+class _RequestStream:
+    """Writes to out, except from the prefetch thread, which keeps writing to stream"""
+
+    def __init__(self, out, stream):
+        self.out = out
+        self.stream = stream
+
+    def write(self, s):
+        return (self.stream if _in_prefetch() else self.out).write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+
+@contextmanager
+def captured_output():
+    """Collect what a command prints and logs instead of writing it to the daemon's stdout"""
+    out = io.StringIO()
+    handlers = [h for h in logging.getLogger().handlers if isinstance(h, logging.StreamHandler)]
+    streams = [h.stream for h in handlers]
+    for h, stream in zip(handlers, streams):
+        h.stream = _RequestStream(out, stream)
+    try:
+        with redirect_stdout(out):
+            yield out
+    finally:
+        for h, stream in zip(handlers, streams):
+            h.stream = stream
+
+
+class Daemon:
+    """
+    Answers 'wit status' and 'wit inspect' for one workspace over a Unix socket in
+    .wit/, keeping the parsed manifest and lockfile, the resolved package graph and
+    repository queries in memory between requests.
+
+    Before each request the daemon takes a Snapshot of the files its state derives from
+    and starts over if anything changed, so answers are the same as running in-process.
+    Requests are handled one at a time.
+
+    Requests and responses are single lines of JSON. A request names a served command,
+    its arguments and the --repo-path it was run with; the response has the command's
+    output and exit status, or a 'fallback' reason when the client should run the command
+    itself.
+    """
+
+    def __init__(self, root: Path, repo_paths: List[str], jobs,
+                 commands: Dict[str, Callable]):
+        self.root = root
+        self.repo_paths = repo_paths
+        self.jobs = jobs
+        self.commands = commands
+        # the backend to wrap with a fresh SnapshotBackend on every reload
+        self.backend = get_backend()
+        self.snapshot = None  # type: Optional[Snapshot]
+        self.ws = None  # type: Optional[SnapshotWorkSpace]
+        self.stopping = False
+        self.requests = 0
+        self.reloads = 0
+        self.last_request = time.monotonic()
+        self.last_prefetch = None  # type: Optional[float]
+        self.prefetching = None  # type: Optional[threading.Thread]
+        self.prefetch_result = None  # type: Optional[Tuple[List[str], list]]
+
+    def _reload(self, snapshot: Snapshot):
+        for _, cache in GitRepo.caches():
+            cache.cache_clear()
+        set_backend(SnapshotBackend(self.backend))
+        self.ws = SnapshotWorkSpace(self.root, self.repo_paths, self.jobs)
+        self.snapshot = snapshot
+        self.reloads += 1
+
+    def handle(self, request: dict) -> dict:
+        command = request.get('command')
+        if command == 'stop':
+            self.stopping = True
+            return {'status': 0, 'output': "Stopped wit daemon for [{}]\n".format(self.root)}
+        if command not in self.commands:
+            return {'fallback': "'{}' is not served by the daemon".format(command)}
+        if request.get('repo_paths') != self.repo_paths:
+            return {'fallback': "daemon runs with a different --repo-path"}
+
+        self.requests += 1
+        self.last_request = time.monotonic()
+        snapshot = Snapshot(self.root)
+        if snapshot != self.snapshot:
+            log.debug("Workspace changed, reloading")
+            self._reload(snapshot)
+
+        args = argparse.Namespace(**request.get('args', {}))
+        level = log.level
+        log.setLevel(request.get('level', logging.INFO))
+        status = 0
+        with captured_output() as out:
+            try:
+                self.commands[command](self.ws, args)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except WitUserError as e:
+                log.error(e)
+                status = 1
+            except Exception:
+                log.exception("wit daemon failed to run '{}'".format(command))
+                status = 1
+                # whatever went wrong may have left cached state half built
+                self.snapshot = None
+            finally:
+                log.setLevel(level)
+        return {'status': status, 'output': out.getvalue()}
+
+    def serve(self, idle_timeout=None, prefetch_interval=None):
+        """
+        Answer requests until stopped, or until idle_timeout seconds pass without one.
+        With prefetch_interval, also run 'wit prefetch' in the background that often.
+        """
+        path = socket_path(self.root)
+        if path.exists():
+            if request(path, {'command': 'ping'}) is not None:
+                raise DaemonError("A wit daemon is already running for [{}]".format(self.root))
+            path.unlink()
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    req = json.loads(self.rfile.readline().decode('utf-8'))
+                    response = daemon.handle(req)
+                except ValueError as e:
+                    response = {'fallback': "bad request: {}".format(e)}
+                self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+
+        try:
+            server = socketserver.UnixStreamServer(str(path), Handler)
+        except OSError as e:
+            raise DaemonError("Unable to listen on [{}]: {}".format(path, e))
+        log.info("Serving [{}] on [{}]".format(self.root, path))
+        try:
+            while not self.stopping:
+                server.timeout = self._tick(idle_timeout, prefetch_interval)
+                if not self.stopping:
+                    server.handle_request()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if path.exists():
+                path.unlink()
+            set_backend(self.backend)
+        log.info("Answered {} requests, reloaded the workspace {} times".format(
+            self.requests, self.reloads))
+
+    def _tick(self, idle_timeout, prefetch_interval) -> Optional[float]:
+        """Start or finish background work. Returns how long to wait for a request."""
+        now = time.monotonic()
+        waits = []
+        if idle_timeout is not None:
+            if now - self.last_request >= idle_timeout:
+                log.info("No requests for {}s, exiting".format(idle_timeout))
+                self.stopping = True
+            waits.append(self.last_request + idle_timeout - now)
+
+        if self.prefetching is not None and not self.prefetching.is_alive():
+            self.prefetching = None
+            names, errors = self.prefetch_result or ([], [])
+            log.info("Prefetched {} packages with {} errors".format(len(names), len(errors)))
+            for e in errors:
+                log.info("  {}".format(e))
+            # has_commit and friends may have new answers
+            self.snapshot = None
+        if prefetch_interval is not None:
+            due = now if self.last_prefetch is None else self.last_prefetch + prefetch_interval
+            if self.prefetching is None and now >= due:
+                self.last_prefetch = now
+                self.prefetching = threading.Thread(target=self._prefetch,
+                                                    name=PREFETCH_THREAD, daemon=True)
+                self.prefetching.start()
+                due = now + prefetch_interval
+            # poll for the end of a running prefetch
+            waits.append(1.0 if self.prefetching is not None else due - now)
+        return max(0.0, min(waits)) if waits else None
+
+    def _prefetch(self):
+        # the backend in use is the SnapshotBackend of the requests, or resolve_graph's
+        # wrapper of it, whose repository objects must not be fetched into meanwhile
+        try:
+            ws = WorkSpace(self.root, self.repo_paths, self.jobs)
+            self.prefetch_result = ws.prefetch(backend=self.backend)
+        except Exception as e:
+            self.prefetch_result = ([], [e])
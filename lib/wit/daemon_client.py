@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+The client side of 'wit daemon', kept apart from the daemon itself so that forwarding a
+command does not import the resolver.
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import List, Optional  # noqa: F401
+from .witlogger import getLogger
+
+log = getLogger()
+
+SOCKET = "daemon.sock"
+
+# Commands a running daemon answers; everything else always runs in-process
+SERVED = ('status', 'inspect')
+
+
+def socket_path(root: Path) -> Path:
+    return root / '.wit' / SOCKET
+
+
+def find_root(start: Path) -> Optional[Path]:
+    """The workspace containing start, found the way WorkSpace.find does but without loading it"""
+    start = start.resolve()
+    for p in [start] + list(start.parents):
+        if (p / "wit-workspace.json").is_file():
+            return p
+    return None
+
+
+def request(path: Path, message: dict) -> Optional[dict]:
+    """Send message to the daemon listening at path. Returns None if there is none."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1)
+        sock.connect(str(path))
+        # answering a request can take as long as running the command
+        sock.settimeout(None)
+        sock.sendall((json.dumps(message) + "\n").encode('utf-8'))
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline().decode('utf-8'))
+    except (OSError, ValueError) as e:
+        log.debug("No wit daemon at [{}]: {}".format(path, e))
+        return None
+    finally:
+        sock.close()
+
+
+def forward(start: Path, command, args: dict, repo_paths: List[str]) -> Optional[int]:
+    """
+    Run command through the daemon of the workspace containing start, if one is running,
+    and print its output. Returns the exit status, or None to run the command in-process.
+    """
+    if os.getenv("WIT_DAEMON") == "0":
+        return None
+    root = find_root(start)
+    if root is None or not socket_path(root).exists():
+        return None
+    response = request(socket_path(root), {
+        'command': command,
+        'args': args,
+        'repo_paths': repo_paths,
+        'level': log.getEffectiveLevel(),
+    })
+    if response is None:
+        return None
+    if 'fallback' in response:
+        log.debug("Running in-process: {}".format(response['fallback']))
+        return None
+    log.debug("Answered by the wit daemon for [{}]".format(root))
+    sys.stdout.write(response['output'])
+    sys.stdout.flush()
+    return response['status']
+
+
+def stop(root: Path) -> bool:
+    response = request(socket_path(root), {'command': 'stop'})
+    if response is None:
+        return False
+    sys.stdout.write(response.get('output', ''))
+    return True
@@ -1,11 +1,14 @@
 import re
-import multiprocessing.dummy
+import sys
 from datetime import datetime
 from pathlib import Path
 from typing import List  # noqa: F401
 from .common import WitUserError
+from .history import history
 from .package import Package
+from .profile import profiler
 from .repo_entries import RepoEntry
+from .scheduler import run_parallel
 from .witlogger import getLogger
 
 log = getLogger()
@@ -27,23 +30,26 @@ class DependeeNewerThanDepender(WitUserError):
 
 class Dependency:
     """ A dependency that a Package specifies. From wit-manifest.json and wit-workspace.js """
+    __slots__ = ('source', 'specified_revision', 'name', 'package', 'dependents', 'message',
+                 'sparse')
 
-    def __init__(self, name, source, specified_revision, message):
+    def __init__(self, name, source, specified_revision, message, sparse=None):
         self.source = source
         self.specified_revision = specified_revision or "HEAD"
         self.name = name or Dependency.infer_name(source)
         self.package = None  # type: Package
         self.dependents = []  # type: List[Package]
         self.message = message
+        self.sparse = sparse
 
-    def resolve_deps(self, wsroot, repo_paths, download, source_map, packages, queue, jobs):
-        source_map = source_map.copy()
-        packages = packages.copy()
-        queue = queue.copy()
+    # NB: extends source_map, packages and queue in place rather than copying them for each
+    # of the thousands of dependencies a large workspace resolves
+    def resolve_deps(self, wsroot, repo_paths, download, source_map, packages, queue, limit,
+                     fail_fast=False):
         subdeps = self.package.get_dependencies()
         log.debug("Dependencies for [{}]: [{}]".format(self.name, subdeps))
 
-        errors = self._parallel_clone(subdeps, wsroot, repo_paths, download, jobs)
+        errors = self._parallel_clone(subdeps, wsroot, repo_paths, download, limit, fail_fast)
         if len(errors) > 0:
             return {}, [], [], errors
 
@@ -66,20 +72,17 @@ class Dependency:
 
         return source_map, packages, queue, errors
 
-    def _parallel_clone(self, deps, wsroot, repo_paths, download, jobs):
-        errors = []
-
+    @profiler.operation('clone')
+    def _parallel_clone(self, deps, wsroot, repo_paths, download, limit, fail_fast=False):
         def do(dep):
-            try:
-                p = Package(dep.name, repo_paths)
-                p.load(wsroot, download, dep.source, dep.specified_revision)
-            except Exception as e:
-                errors.append(e)
-
-        with multiprocessing.dummy.Pool(jobs) as pool:
-            pool.map(do, deps)
+            p = Package(dep.name, repo_paths)
+            p.load(wsroot, download, dep.source, dep.specified_revision)
 
-        return errors
+        costs = None
+        if download:
+            jobs = [Package(dep.name, repo_paths).transfer_job(wsroot, dep.source) for dep in deps]
+            costs = history.estimate(jobs)
+        return run_parallel(do, deps, limit, fail_fast, costs)
 
     def __key(self):
         return (self.source, self.specified_revision, self.name)
@@ -92,7 +95,7 @@ class Dependency:
 
     @staticmethod
     def infer_name(source):
-        return Path(source).name.replace('.git', '')
+        return sys.intern(Path(source).name.replace('.git', ''))
 
     # NB: mutates packages[self.name]
     def load(self, packages, repo_paths, wsroot, download):
@@ -114,15 +117,17 @@ class Dependency:
             self.specified_revision)))
 
     def to_repo_entry(self):
-        return RepoEntry(self.name, self.specified_revision, self.source, message=self.message)
+        return RepoEntry(self.name, self.specified_revision, self.source, message=self.message,
+                         sparse=self.sparse)
 
     @staticmethod
     def from_repo_entry(entry):
-        return Dependency(entry.checkout_path, entry.remote_url, entry.revision, entry.message)
+        return Dependency(entry.checkout_path, entry.remote_url, entry.revision, entry.message,
+                          entry.sparse)
 
     # used before saving to manifests/lockfiles
     def resolved(self):
-        return Dependency(self.name, self.source, self.resolved_rev(), self.message)
+        return Dependency(self.name, self.source, self.resolved_rev(), self.message, self.sparse)
 
     # Check if the Dependency has a Package and repo on disk
     def _is_bound(self) -> bool:
@@ -149,21 +154,6 @@ class Dependency:
     def get_id(self):
         return "dep_"+re.sub(r"([^\w\d])", "_", self.id())
 
-    def crawl_dep_tree(self, wsroot, repo_paths, packages):
-        fancy_tag = self.id()
-        self.load(packages, repo_paths, wsroot, False)
-        if self.package.repo is None:
-            return {'': "{} \033[91m(missing)\033[m".format(fancy_tag)}
-        if self.package.revision != self.resolved_rev():
-            fancy_tag += "->{}".format(self.package.short_revision())
-            return {'': fancy_tag}
-
-        tree = {'': fancy_tag}
-        subdeps = self.package.get_dependencies()
-        for subdep in subdeps:
-            tree[subdep.get_id()] = subdep.crawl_dep_tree(wsroot, repo_paths, packages)
-        return tree
-
 
 def sources_conflict_check(dep, source_map):
     if dep.name in source_map:
@@ -3,3 +3,31 @@ import os
 
 # Directory to find repositories to be used with 'git clone --reference'
 git_reference_workspace = os.getenv("WIT_WORKSPACE_REFERENCE")
+
+# How to clone a source that is a directory on this machine: 'hardlink' lets git hardlink its
+# objects when they are on the same filesystem, 'shared' borrows them through alternates until
+# checkout, 'copy' clones it like any other source
+local_clone = os.getenv("WIT_LOCAL_CLONE", "hardlink")
+LOCAL_CLONE_MODES = ('hardlink', 'shared', 'copy')
+
+# Lockfile version to write, overriding the version of the lockfile being replaced
+lock_version = os.getenv("WIT_LOCK_VERSION")
+
+# Most CI services set $CI; wit stops at the first resolution error there by default
+ci = os.getenv("CI", "").lower() not in ("", "0", "false")
+
+# Directory for data wit keeps between runs and workspaces, such as clone timings
+cache_dir = os.getenv("WIT_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "wit")
+
+# Seconds a listing of a remote's refs stays valid across runs, see RemoteRefCache
+try:
+    remote_refs_ttl = float(os.getenv("WIT_REMOTE_REFS_TTL", "0"))
+except ValueError:
+    remote_refs_ttl = 0.0
+
+# Keep what resolution learns about commit hashes in .wit/; WIT_RESOLVE_CACHE=0 opts out
+use_resolve_cache = os.getenv("WIT_RESOLVE_CACHE", "1") != "0"
+
+# Answer read-only git queries in-process with pygit2 when it is installed; WIT_PYGIT2=0 opts out
+use_pygit2 = os.getenv("WIT_PYGIT2", "1") != "0"
@@ -2,21 +2,28 @@
 
 import subprocess
 from pathlib import Path
-from pprint import pformat
 import re
 import os
-import sys
+import shutil
+import time
 from .common import WitUserError
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from .witlogger import getLogger
-from typing import List, Set  # noqa: F401
+from typing import List, Optional, Set  # noqa: F401
 from functools import lru_cache
-from .env import git_reference_workspace
+from .env import git_reference_workspace, local_clone, use_pygit2
+from .backend import Backend, Repo
 from .repo_entries import RepoEntry, RepoEntries
+from .scheduler import current_scope, JobCancelled
+from .profile import profiler
 
 log = getLogger()
 
 
+# What GitRepo.download did: 'clone' or 'fetch', the seconds it took and the bytes it added
+Transfer = namedtuple('Transfer', ['kind', 'seconds', 'size'])
+
+
 class GitError(Exception):
     pass
 
@@ -36,13 +43,18 @@ class BadSource(WitUserError):
 
 verbose_prefix = re.compile(r"^refs/(?:heads/)?")
 
+# Where 'wit prefetch' keeps the branches and tags of each package's remote
+PREFETCH_REFS = "refs/wit-prefetch"
+# the single ref of the bundles 'wit bundle create' writes
+BUNDLE_REF = "refs/wit-bundle"
+
 
 # TODO Could speed up validation
 #   - use git ls-remote to validate remote exists
-#   - use git ls-remote to validate revision for tags and branches
 #   - if github repo, check if page exists (or if you get 404)
+# Branch names are checked against 'git ls-remote' before fetching, see RemoteRefCache
 
-class GitRepo:
+class GitRepo(Repo):
     """
     In memory data structure representing a Git repo package
     It may not be in sync with data structures on the file system
@@ -52,9 +64,7 @@ class GitRepo:
     SUBMODULE_FILE = ".gitmodules"
 
     def __init__(self, name, wsroot: Path):
-        self.name = name
-        self.path = wsroot / name
-        self.wsroot = wsroot
+        super().__init__(name, wsroot)
         # Cache known hashes for quick lookup
         self._known_hashes = set()  # type: Set[str]
 
@@ -74,17 +84,31 @@ class GitRepo:
 
     # name is needed for generating error messages
     def download(self, source, name):
+        """Clone or fetch source. Returns how long that took and how much it brought in."""
+        start = time.monotonic()
         if not GitRepo.is_git_repo(self.path):
+            kind, before = 'clone', 0
             self.clone(source, name)
+        else:
+            kind, before = 'fetch', object_size(self.path)
         self.fetch(source, name)
+        return Transfer(kind, time.monotonic() - start, max(0, object_size(self.path) - before))
 
     # name is needed for generating error messages
     def clone(self, source, name):
         assert not GitRepo.is_git_repo(self.path), \
             "Trying to clone and checkout into existing git repo!"
 
-        cmd = ["clone", *self._git_reference_options(), "--no-checkout", source, str(self.path)]
-        proc = self._git_command(*cmd, working_dir=str(self.path.parent))
+        cmd = ["clone", *self._clone_options(source), "--no-checkout", source, str(self.path)]
+        existed = self.path.exists()
+        try:
+            proc = self._git_command(*cmd, working_dir=str(self.path.parent))
+        except JobCancelled:
+            # don't leave a half-written clone behind for the next run to trip over
+            if not existed and self.path.exists():
+                log.debug("Removing partial clone [{}]".format(self.path))
+                shutil.rmtree(str(self.path), ignore_errors=True)
+            raise
         try:
             self._git_check(proc)
         except GitError:
@@ -94,27 +118,75 @@ class GitRepo:
                 raise
         log.info('Cloned {}'.format(self.name))
 
+    def _clone_options(self, source):
+        mode = self.local_clone_mode(source)
+        if mode is not None:
+            log.verbose("Cloning {} from [{}] ({})".format(self.name, source, mode))
+        if mode == 'hardlink':
+            # git hardlinks the objects of a local path by itself; '--reference' would only
+            # have '--dissociate' copy them all again
+            return []
+        if mode == 'shared':
+            return ['--shared']
+        return self._git_reference_options()
+
+    def local_clone_mode(self, source) -> Optional[str]:
+        """
+        'hardlink' or 'shared' if source is a directory whose objects a clone can use
+        without copying them, following $WIT_LOCAL_CLONE
+        """
+        if local_clone == 'copy' or not Path(source).is_dir():
+            return None
+        if local_clone == 'shared':
+            return 'shared'
+        try:
+            same_filesystem = os.stat(source).st_dev == os.stat(str(self.path.parent)).st_dev
+        except OSError:
+            return None
+        return 'hardlink' if same_filesystem else None
+
+    def dissociate(self):
+        """
+        Copy in the objects borrowed from a 'git clone --shared' source, so that pruning the
+        source can no longer corrupt this repository
+        """
+        alternates = self.path / '.git' / 'objects' / 'info' / 'alternates'
+        if not alternates.exists():
+            return
+        log.verbose("Repacking {} to stop borrowing objects".format(self.name))
+        proc = self._git_command('repack', '-a', '-d')
+        self._git_check(proc)
+        alternates.unlink()
+
     def _git_reference_options(self):
         """
         Use git clone's '--reference' to point at a local repository cache to copy objects/commits
         to save network traffic. Any missing objects/commits are downloaded from the true remote.
         Only newer git versions can use '--reference-if-able', so we emulate the 'if-able' bit.
         """
-        if not git_reference_workspace:
+        path = self.reference_path()
+        if path is None:
             return []
+        return ["--reference", str(path), "--dissociate"]
+
+    def reference_path(self):
+        """The copy of this repo in $WIT_WORKSPACE_REFERENCE, if there is one"""
+        if not git_reference_workspace:
+            return None
         paths = [Path(git_reference_workspace) / self.name,
                  Path(git_reference_workspace) / (self.name+'.git')]
         for path in paths:
             if path.is_dir():
-                return ["--reference", str(path), "--dissociate"]
-        return []
+                return path
+        return None
 
     # name is needed for generating error messages
     def fetch(self, source, name):
         # in case source is a remote and we want a commit
         proc = self._git_command('fetch', source)
         # in case source is a file path and we want, for example, origin/master
-        self._git_command('fetch', '--all')
+        if not self.offline:
+            self._git_command('fetch', '--all')
         try:
             self._git_check(proc)
         except GitError:
@@ -124,8 +196,64 @@ class GitRepo:
                 raise
         return proc.returncode == 0
 
-    def get_head_commit(self) -> str:
-        return self.get_commit('HEAD')
+    # name is needed for generating error messages
+    def prefetch(self, source, name):
+        """
+        Fetch the branches and tags of source into refs/wit-prefetch/ so that later loads
+        find their commits locally. Local branches, tags and origin/* are left alone.
+        """
+        start = time.monotonic()
+        before = object_size(self.path)
+        proc = self._git_command('fetch', '--no-tags', '--prune', source,
+                                 '+refs/heads/*:{}/heads/*'.format(PREFETCH_REFS),
+                                 '+refs/tags/*:{}/tags/*'.format(PREFETCH_REFS))
+        try:
+            self._git_check(proc)
+        except GitError:
+            if self.is_bad_source(source):
+                raise BadSource(name, source)
+            else:
+                raise
+        return Transfer('fetch', time.monotonic() - start, max(0, object_size(self.path) - before))
+
+    def bundle(self, path: Path, revision):
+        """Write everything reachable from revision to a git bundle at path"""
+        # a bundle only holds what its refs reach, so point a ref at the commit while writing
+        proc = self._git_command('update-ref', '--no-deref', BUNDLE_REF, self.get_commit(revision))
+        self._git_check(proc)
+        try:
+            proc = self._git_command('bundle', 'create', str(path), BUNDLE_REF)
+            self._git_check(proc)
+        finally:
+            self._git_command('update-ref', '-d', BUNDLE_REF)
+
+    def unbundle(self, bundle: Path, source):
+        """
+        Create the repository from a bundle written by bundle(), keeping its commit under
+        BUNDLE_REF, with source as origin for anything the bundle lacks.
+        """
+        assert not GitRepo.is_git_repo(self.path), \
+            "Trying to unbundle into existing git repo!"
+        proc = self._git_command('init', '--quiet', str(self.path),
+                                 working_dir=str(self.path.parent))
+        self._git_check(proc)
+        proc = self._git_command('remote', 'add', 'origin', source)
+        self._git_check(proc)
+        proc = self._git_command('fetch', str(bundle), '{0}:{0}'.format(BUNDLE_REF))
+        self._git_check(proc)
+        # like a clone, start with HEAD at the commit, detached
+        proc = self._git_command('update-ref', '--no-deref', 'HEAD', BUNDLE_REF)
+        self._git_check(proc)
+
+    def ls_remote(self, source):
+        proc = self._git_command('ls-remote', source)
+        if proc.returncode != 0:
+            return None
+        refs = {}
+        for line in proc.stdout.splitlines():
+            sha, _, ref = line.partition('\t')
+            refs[ref] = sha
+        return refs
 
     @lru_cache(maxsize=None)
     def _get_commit_cached(self, commit):
@@ -169,9 +297,6 @@ class GitRepo:
         else:
             return self._get_shortened_rev_impl(commit)
 
-    def is_hash(self, ref):
-        return self.get_commit(ref) == ref
-
     def is_tag(self, ref):
         proc = self._git_command('tag', '--list', ref)
         self._git_check(proc)
@@ -252,17 +377,34 @@ class GitRepo:
             manifest_entries = self._read_submodules_from_commit(revision)
         return manifest_entries
 
-    def _read_manifest_from_commit(self, revision) -> List[RepoEntry]:
-        proc = self._git_command("show", "{}:{}".format(revision, GitRepo.PKG_DEPENDENCY_FILE))
+    def tree_id(self, revision) -> Optional[str]:
+        proc = self._git_command('rev-parse', '{}^{{tree}}'.format(revision))
+        self._git_check(proc)
+        return proc.stdout.rstrip()
+
+    def manifest_id(self, revision) -> Optional[str]:
+        proc = self._git_command('rev-parse', '--verify', '--quiet',
+                                 '{}:{}'.format(revision, GitRepo.PKG_DEPENDENCY_FILE))
+        return proc.stdout.rstrip() if proc.returncode == 0 else None
+
+    def _show_file(self, revision, path) -> Optional[str]:
+        """The contents of path at revision, or None if it is not there"""
+        proc = self._git_command("show", "{}:{}".format(revision, path))
         if proc.returncode:
+            return None
+        return proc.stdout
+
+    def _read_manifest_from_commit(self, revision) -> List[RepoEntry]:
+        text = self._show_file(revision, GitRepo.PKG_DEPENDENCY_FILE)
+        if text is None:
             log.debug("No wit dependency file found in repo [{}:{}]".format(revision,
                       self.path))
             return []
-        return RepoEntries.parse(proc.stdout, Path(GitRepo.PKG_DEPENDENCY_FILE), revision)
+        return RepoEntries.parse(text, Path(GitRepo.PKG_DEPENDENCY_FILE), revision)
 
     def _read_submodules_from_commit(self, revision) -> List[RepoEntry]:
-        proc = self._git_command("show", "{}:{}".format(revision, GitRepo.SUBMODULE_FILE))
-        if proc.returncode:
+        gitmodules = self._show_file(revision, GitRepo.SUBMODULE_FILE)
+        if gitmodules is None:
             log.debug("No .gitmodules file found in repo [{}:{}]".format(revision, self.path))
             return []
 
@@ -275,7 +417,7 @@ class GitRepo:
         #     submodule.$NAME.path $PATH
         #     submodule.$NAME.url  $REMOTE
         proc = self._git_command("config", "-f-", "--get-regex", r"submodule\..*",
-                                 input=proc.stdout)
+                                 input=gitmodules)
         self._git_check(proc)
 
         paths_by_name = OrderedDict()  # type: OrderedDict
@@ -294,9 +436,8 @@ class GitRepo:
                 urls_by_name[m.group(1)] = m.group(2)
 
         if len(paths_by_name) != len(urls_by_name):
-            log.error("Error matching paths with urls in {}/{}"
-                      .format(self.name, GitRepo.SUBMODULE_FILE))
-            sys.exit(1)
+            raise WitUserError("Error matching paths with urls in {}/{}"
+                               .format(self.name, GitRepo.SUBMODULE_FILE))
 
         submodules = []
         for name_key, path in paths_by_name.items():
@@ -346,7 +487,10 @@ class GitRepo:
         no_tab = first_line.split("\t")[0]
         return no_tab.split(" ")[2]
 
-    def checkout(self, revision):
+    def checkout(self, revision, sparse=None, was_sparse=False):
+        if local_clone == 'shared':
+            self.dissociate()
+        self._set_sparse(sparse, was_sparse)
         wanted_hash = self.get_commit(revision)
         if self.get_commit('HEAD') != wanted_hash:
             proc_ref = self._git_command("show-ref")
@@ -377,6 +521,24 @@ class GitRepo:
         # If our revision was a branch or tag, get the actual commit
         self.revision = self.get_head_commit()
 
+    def _set_sparse(self, paths, was_sparse):
+        """
+        Check out only paths from now on. If paths is None, check out everything again if wit
+        made the checkout sparse, and otherwise leave the user's settings alone.
+        """
+        if paths is None:
+            if was_sparse:
+                log.info("Checking out all of '{}'".format(self.name))
+                proc = self._git_command('sparse-checkout', 'disable')
+                self._git_check(proc)
+            return
+        if not was_sparse:
+            proc = self._git_command('sparse-checkout', 'init', '--cone')
+            self._git_check(proc)
+        log.verbose("Checking out {} of '{}'".format(', '.join(paths), self.name))
+        proc = self._git_command('sparse-checkout', 'set', *paths)
+        self._git_check(proc)
+
     def manifest(self, source, revision):
         return {
             'name': self.name,
@@ -387,12 +549,28 @@ class GitRepo:
     def _git_command(self, *args, working_dir=None, input=None):
         cwd = str(self.path) if working_dir is None else str(working_dir)
         log.debug("Executing [{}] in [{}]".format(' '.join(['git', *args]), cwd))
-        proc = subprocess.run(['git', *args],
+        scope = current_scope()
+        if scope:
+            scope.check()
+        start = time.monotonic()
+        with subprocess.Popen(['git', *args],
+                              stdin=None if input is None else subprocess.PIPE,
                               stdout=subprocess.PIPE,
                               stderr=subprocess.PIPE,
                               universal_newlines=True,
-                              input=input,
-                              cwd=cwd)
+                              cwd=cwd) as popen:
+            if scope:
+                scope.register(popen)
+            try:
+                stdout, stderr = popen.communicate(input)
+            finally:
+                if scope:
+                    scope.unregister(popen)
+        proc = subprocess.CompletedProcess(popen.args, popen.returncode, stdout, stderr)
+        profiler.record(proc.args, self.name, start, proc.returncode, stdout)
+        if scope:
+            # a terminated git leaves nothing worth checking
+            scope.check()
         log.spam("   stderr: [{}]".format(proc.stderr.rstrip()))
         log.spam("   stdout: [{}]".format(proc.stdout.rstrip()))
         return proc
@@ -422,15 +600,69 @@ class GitRepo:
     @staticmethod
     def is_git_repo(path):
         cmd = ['git', 'ls-remote', '--exit-code', str(path)]
+        start = time.monotonic()
         proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        profiler.record(cmd, Path(str(path)).name, start, proc.returncode, proc.stdout)
         ret = proc.returncode
         return ret == 0
 
+    @staticmethod
+    def caches():
+        """The memoized queries, for reporting their hit rates"""
+        return [('GitRepo.get_commit', GitRepo._get_commit_cached),
+                ('GitRepo.get_shortened_rev', GitRepo._get_shortened_rev_cached),
+                ('GitRepo.commit_to_time', GitRepo._commit_to_time_cached)]
+
     # Enable prettyish-printing of the class
     def __repr__(self):
+        from pprint import pformat
         return pformat(vars(self), indent=4, width=1)
 
 
+class GitBackend(Backend):
+    """Repositories on disk, queried with the git command line"""
+
+    def open(self, name, wsroot: Path) -> GitRepo:
+        if use_pygit2:
+            from .pygit2repo import Pygit2Repo, available
+            if available():
+                return Pygit2Repo(name, wsroot)
+        return GitRepo(name, wsroot)
+
+    def is_repo(self, path) -> bool:
+        return GitRepo.is_git_repo(path)
+
+    def size_hint(self, name, wsroot: Path, source):
+        # a reference or local mirror is about as big as what we are about to download
+        local = GitRepo(name, wsroot).reference_path()
+        if local is None and Path(source).is_dir():
+            local = Path(source)
+        if local is None:
+            return None
+        return object_size(local) or None
+
+
+def object_size(path: Path) -> int:
+    """
+    Bytes in the object store of the repository at path, bare or not, loose and packed. Found
+    with a stat of each pack and loose object file rather than with 'git count-objects'.
+    """
+    objects = path / '.git' / 'objects'
+    if not objects.is_dir():
+        objects = path / 'objects'
+    size = 0
+    try:
+        for d in os.scandir(str(objects)):
+            if d.name == 'pack':
+                size += sum(e.stat().st_size for e in os.scandir(d.path)
+                            if e.name.endswith('.pack'))
+            elif len(d.name) == 2 and d.is_dir():
+                size += sum(e.stat().st_size for e in os.scandir(d.path))
+    except OSError:
+        pass
+    return size
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
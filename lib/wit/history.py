@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple  # noqa: F401
+from .common import atomic_write_json, load_json
+from .env import cache_dir
+from .witlogger import getLogger
+
+log = getLogger()
+
+
+class CloneHistory:
+    """
+    Durations and sizes of past clones and fetches, keyed by source.
+
+    Stored in the user cache rather than in a workspace so that new workspaces, for example
+    from 'wit restore', can be scheduled from what other workspaces have seen. Used to start
+    the longest transfers first (LPT scheduling) so that one huge repository started last
+    does not set the wall time of the whole run.
+    """
+    FILE = "clone-history.json"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None  # type: Optional[Dict[str, dict]]
+        # what this process recorded since the last save, by source and kind
+        self._recorded = {}  # type: Dict[Tuple[str, str], dict]
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = load_json(self.path)
+        return self._data
+
+    def record(self, source, kind, seconds, size):
+        """
+        Remember that a 'clone' or 'fetch' of source took seconds and moved size bytes. Kept in
+        memory until save().
+        """
+        entry = {'seconds': round(seconds, 3), 'bytes': size}
+        with self._lock:
+            self._load().setdefault(source, {})[kind] = entry
+            self._recorded[(source, kind)] = entry
+
+    def save(self):
+        """Write what was recorded since the last save, on top of what other processes wrote"""
+        with self._lock:
+            if not self._recorded:
+                return
+            data = load_json(self.path)
+            for (source, kind), entry in self._recorded.items():
+                data.setdefault(source, {})[kind] = entry
+            self._recorded = {}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self.path, data)
+        except OSError as e:
+            log.debug("Unable to write clone history [{}]: {}".format(self.path, e))
+
+    def knows(self, source, kind) -> bool:
+        with self._lock:
+            return kind in self._load().get(source, {})
+
+    def estimate(self, jobs) -> List[float]:
+        """
+        Estimate the duration of each (source, kind, size_hint) job, where size_hint is the
+        size in bytes of a local copy of the repository, or None.
+
+        Jobs with history use their last duration. Jobs without history are converted from
+        their size hint at the transfer rate seen so far, or else given the average of the
+        known estimates, so that they are neither started first nor last by default.
+
+        >>> h = CloneHistory(Path('/nonexistent'))
+        >>> h._data = {'a': {'clone': {'seconds': 10.0, 'bytes': 1000}}}
+        >>> h.estimate([('a', 'clone', None), ('b', 'clone', 5000), ('c', 'clone', None)])
+        [10.0, 50.0, 30.0]
+        >>> h._data = {}
+        >>> h.estimate([('x', 'fetch', 10), ('y', 'fetch', 20), ('z', 'fetch', None)])
+        [10.0, 20.0, 15.0]
+        """
+        with self._lock:
+            data = self._load()
+            known = [data.get(source, {}).get(kind) for source, kind, _ in jobs]
+            total_seconds = sum(e['seconds'] for d in data.values() for e in d.values())
+            total_bytes = sum(e['bytes'] for d in data.values() for e in d.values())
+
+        rate = total_bytes / total_seconds if total_seconds and total_bytes else None
+        estimates = []  # type: List[Optional[float]]
+        for entry, (_, _, size_hint) in zip(known, jobs):
+            if entry is not None:
+                estimates.append(float(entry['seconds']))
+            elif size_hint is not None and (rate or not any(known)):
+                # without any history, sizes alone still rank the jobs
+                estimates.append(size_hint / rate if rate else float(size_hint))
+            else:
+                estimates.append(None)
+
+        seen = [e for e in estimates if e is not None]
+        default = sum(seen) / len(seen) if seen else 0.0
+        return [default if e is None else e for e in estimates]
+
+
+history = CloneHistory(Path(cache_dir) / CloneHistory.FILE)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
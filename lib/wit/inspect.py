@@ -1,5 +1,12 @@
+from abc import ABC, abstractmethod
+import json
 import sys
-from .common import print_errors
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple  # noqa: F401
+from xml.sax.saxutils import escape, quoteattr
+from .common import print_errors, replacing, WitUserError
+from .dependency import Dependency  # noqa: F401
 from .witlogger import getLogger
 
 log = getLogger()
@@ -9,114 +16,234 @@ def inspect_tree(ws, args):
     packages, errors = ws.resolve()
 
     if args.tree:
-        tree = {}
+        graph = TreeGraph(ws, packages)
         for dep in ws.manifest.dependencies:
-            tree[dep.get_id()] = dep.crawl_dep_tree(ws.root, ws.repo_paths, packages)
-        for key in tree:
-            top_dep = tree[key]
-            x, _ = _deduplicate_tree(top_dep)
-            _print_generic_tree(x)
+            graph.print_tree(dep)
 
-    if args.dot:
-        _print_dot_tree(ws, packages)
+    for flag, exporter in EXPORTERS.items():
+        if getattr(args, flag):
+            with _output(args.output) as out:
+                export_graph(ws, packages, exporter(out))
 
     print_errors(errors)
 
 
+class TreeGraph:
+    """
+    The graph 'wit inspect --tree' prints. Each dependency is labelled and each package
+    revision expanded once, however many paths lead to it, and the trees printed from it
+    are streamed to stdout rather than built first.
+    """
+
+    def __init__(self, ws, packages):
+        self.ws = ws
+        self.packages = packages
+        # dependency -> (label, (name, revision) of the package it expands to, or None)
+        self._edges = {}  # type: Dict[Dependency, Tuple[str, Optional[Tuple[str, str]]]]
+        # (name, revision) -> the dependencies of that package revision
+        self._children = {}  # type: Dict[Tuple[str, str], List[Dependency]]
+
+    def edge(self, dep):
+        if dep not in self._edges:
+            dep.load(self.packages, self.ws.repo_paths, self.ws.root, False)
+            tag = dep.id()
+            pkg = dep.package
+            node = None
+            if pkg.repo is None:
+                tag = "{} \033[91m(missing)\033[m".format(tag)
+            elif pkg.revision != dep.resolved_rev():
+                tag = "{}->{}".format(tag, pkg.short_revision())
+            else:
+                node = (pkg.name, pkg.revision)
+                if node not in self._children:
+                    self._children[node] = pkg.get_dependencies()
+            self._edges[dep] = (tag, node)
+        return self._edges[dep]
+
+    def print_tree(self, dep):
+        """Print the tree below dep, expanding each package revision where it first appears"""
+        tag, node = self.edge(dep)
+        print(tag)
+        seen = set()  # type: Set[Tuple[str, str]]
+        if node is not None:
+            seen.add(node)
+            self._print_children(node, "", seen)
+
+    def _print_children(self, node, indent, seen):
+        children = self._children[node]
+        for i, dep in enumerate(children):
+            last = i == len(children) - 1
+            tag, child = self.edge(dep)
+            print("{}{}{}".format(indent, "└─" if last else "├─", tag))
+            if child is not None and child not in seen:
+                seen.add(child)
+                self._print_children(child, indent + ("   " if last else "│  "), seen)
+
+
 BOXED_DEPS = False
 VERBOSE_GRAPH = False
 
 
-def _deduplicate_tree(tree, seen=None):
-    tree = tree.copy()
-    seen = seen or []
-    tag = tree.pop('')
-    ident = tag[-8:]
-    out = {'': tag}
-
-    if ident in seen:
-        return out, seen
-    else:
-        seen.append(ident)
-        for key in tree:
-            out[key], seen = _deduplicate_tree(tree[key], seen)
-        return out, seen
-
-
-def _print_dot_tree(ws, packages_dict):
-    packages = list(packages_dict.values())
-
-    log.output('digraph dependencies {')
-    log.output('root [label="[root]"]')
-
-    pkg_ids = []
-    for pkg in packages:
-        pkg_id = pkg.get_id()
-        pkg_ids.append(pkg_id)
-        log.output('{} [label="{}"]'.format(pkg_id, pkg.id()))
-
-    drawn_connections = []
-
-    def draw_connection(from_id, to_id, dotted=False):
-        if from_id == to_id:
-            return
-        pair = (from_id, to_id)
-        if pair not in drawn_connections:
-            log.output("{} -> {}{}".format(from_id, to_id, " [style=dotted]" if dotted else ""))
-            drawn_connections.append(pair)
-
-    def print_dep(pkg, dep):
-        pkg_id = pkg.get_id()
-        dep_id = dep.get_id()
-        dep.load(packages_dict, ws.repo_paths, ws.root, False)
-        if dep.package.repo is None:
-            log.error("Cannot generate graph with missing repo '{}'".format(dep.name))
-            sys.exit(1)
-        dep_pkg_id = dep.package.get_id()
-        if dep.id() != dep.package.id() or VERBOSE_GRAPH:
-            draw_connection(dep_id, dep_pkg_id, dotted=True)
-            log.output('{} [label="{}"]{}'.format(dep_id, dep.id(),
-                                                  " [shape=box]" if BOXED_DEPS else ""))
-            draw_connection(pkg_id, dep_id)
-        else:
-            draw_connection(pkg_id, dep_pkg_id)
-
-    for dep in ws.manifest.dependencies:
-        print_dep(ws, dep)
-
-    for pkg in packages:
-        for dep in pkg.get_dependencies():
-            print_dep(pkg, dep)
-
-    log.output('}')
-
-
-def _print_generic_tree(data):
-    tag = data.pop('')
-    print(tag)
-    return _recur_print_generic_tree(0, data, [])
-
-
-def _recur_print_generic_tree(depth, data, done_cols):
-
-    def print_indent(depth):
-        for i in range(0, depth):
-            if i in done_cols:
-                print("   ", end="")
+class GraphExporter(ABC):
+    """
+    Writes the resolved dependency graph to out as it is walked, every node before any edge.
+
+    Nodes are the 'root' of the workspace, each resolved 'package', and each 'dependency'
+    that asks for a different revision than its package resolved to. Edges are 'depends',
+    from a node to what it depends on, or 'resolves', from a dependency to its package.
+    """
+
+    def __init__(self, out):
+        self.out = out
+
+    def begin(self):
+        pass
+
+    @abstractmethod
+    def node(self, node_id, label, kind):
+        pass
+
+    @abstractmethod
+    def edge(self, source, target, kind):
+        pass
+
+    def end(self):
+        pass
+
+
+class DotExporter(GraphExporter):
+    def begin(self):
+        self.out.write('digraph dependencies {\n')
+
+    def node(self, node_id, label, kind):
+        shape = " [shape=box]" if kind == 'dependency' and BOXED_DEPS else ""
+        self.out.write('{} [label="{}"]{}\n'.format(node_id, label, shape))
+
+    def edge(self, source, target, kind):
+        style = " [style=dotted]" if kind == 'resolves' else ""
+        self.out.write("{} -> {}{}\n".format(source, target, style))
+
+    def end(self):
+        self.out.write('}\n')
+
+
+class JsonExporter(GraphExporter):
+    """{"nodes": [{"id", "label", "kind"}, ...], "edges": [{"source", "target", "kind"}, ...]}"""
+
+    def __init__(self, out):
+        super().__init__(out)
+        self._section = 'nodes'
+        self._first = True
+
+    def begin(self):
+        self.out.write('{"nodes": [')
+
+    def _item(self, item):
+        self.out.write('{}\n    {}'.format('' if self._first else ',',
+                                           json.dumps(item, sort_keys=True)))
+        self._first = False
+
+    def _edges(self):
+        if self._section == 'nodes':
+            self.out.write('\n], "edges": [')
+            self._section = 'edges'
+            self._first = True
+
+    def node(self, node_id, label, kind):
+        self._item({'id': node_id, 'label': label, 'kind': kind})
+
+    def edge(self, source, target, kind):
+        self._edges()
+        self._item({'source': source, 'target': target, 'kind': kind})
+
+    def end(self):
+        self._edges()
+        self.out.write('\n]}\n')
+
+
+class GraphMLExporter(GraphExporter):
+    def begin(self):
+        self.out.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="label" for="node" attr.name="label" attr.type="string"/>\n'
+            '  <key id="kind" for="node" attr.name="kind" attr.type="string"/>\n'
+            '  <key id="edge_kind" for="edge" attr.name="kind" attr.type="string"/>\n'
+            '  <graph id="dependencies" edgedefault="directed">\n')
+
+    def node(self, node_id, label, kind):
+        self.out.write('    <node id={}><data key="label">{}</data>'
+                       '<data key="kind">{}</data></node>\n'.format(
+                           quoteattr(node_id), escape(label), kind))
+
+    def edge(self, source, target, kind):
+        self.out.write('    <edge source={} target={}><data key="edge_kind">{}</data></edge>\n'
+                       .format(quoteattr(source), quoteattr(target), kind))
+
+    def end(self):
+        self.out.write('  </graph>\n</graphml>\n')
+
+
+# 'wit inspect' flag -> exporter
+EXPORTERS = {
+    'dot': DotExporter,
+    'json': JsonExporter,
+    'graphml': GraphMLExporter,
+}
+
+
+@contextmanager
+def _output(path):
+    """stdout, or a file that only replaces path once it has been written completely"""
+    if path is None:
+        yield sys.stdout
+        return
+    with replacing(Path(path)) as tmp:
+        with tmp.open('w') as out:
+            yield out
+
+
+def export_graph(ws, packages, exporter):
+    """Walk the graph resolved into packages, writing it through exporter"""
+    # the dependencies of each node with any, memoized by Package.get_dependencies
+    sources = [(ws.get_id(), ws.manifest.dependencies)]
+    sources.extend((pkg.get_id(), pkg.get_dependencies()) for pkg in packages.values())
+
+    # dependency -> (its own node id, or None when drawn as its package, its package's id)
+    targets = {}  # type: Dict[Dependency, Tuple[Optional[str], str]]
+    exporter.begin()
+    exporter.node(ws.get_id(), ws.id(), 'root')
+    for pkg in packages.values():
+        exporter.node(pkg.get_id(), pkg.id(), 'package')
+    dep_nodes = set()  # type: Set[str]
+    for _, deps in sources:
+        for dep in deps:
+            if dep in targets:
+                continue
+            dep.load(packages, ws.repo_paths, ws.root, False)
+            if dep.package.repo is None:
+                raise WitUserError("Cannot generate graph with missing repo '{}'".format(dep.name))
+            dep_id = None
+            if dep.id() != dep.package.id() or VERBOSE_GRAPH:
+                dep_id = dep.get_id()
+                if dep_id not in dep_nodes:
+                    dep_nodes.add(dep_id)
+                    exporter.node(dep_id, dep.id(), 'dependency')
+            targets[dep] = (dep_id, dep.package.get_id())
+
+    drawn = set()  # type: Set[Tuple[str, str]]
+
+    def draw(source, target, kind='depends'):
+        if source != target and (source, target) not in drawn:
+            drawn.add((source, target))
+            exporter.edge(source, target, kind)
+
+    for source, deps in sources:
+        for dep in deps:
+            dep_id, pkg_id = targets[dep]
+            if dep_id is None:
+                draw(source, pkg_id)
             else:
-                print("│  ", end="")
-
-    done_cols_copy = done_cols[:]
-
-    keys = list(data.keys())
-    for i, key in enumerate(keys):
-        subdata = data[key]
-        subtag = subdata.pop('')
-        print_indent(depth)
-        if i == len(keys)-1:
-            print("└─", end="")
-            done_cols_copy.append(depth)
-        else:
-            print("├─", end="")
-        print(subtag)
-        _recur_print_generic_tree(depth+1, subdata, done_cols_copy)
+                draw(dep_id, pkg_id, 'resolves')
+                draw(source, dep_id)
+    exporter.end()
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 from .gitrepo import GitRepo
-from typing import Optional
+from typing import Dict, List, Optional  # noqa: F401
+from .env import lock_version
 from .witlogger import getLogger
-from .repo_entries import RepoEntries
+from .repo_entries import LOCK_VERSION_2, LOCK_VERSIONS, RepoEntries
+from .common import WitUserError
+from .profile import profiler
 
 log = getLogger()
 
@@ -13,31 +16,90 @@ class LockFile:
     Common class for the description of package dependencies and a workspace
     """
 
-    def __init__(self, packages=[]):
-        self.packages = packages
+    def __init__(self, packages=None, version=LOCK_VERSION_2):
+        self.packages = []  # type: list
+        # position of each package in self.packages, by name
+        self._index = {}  # type: Dict[str, int]
+        for package in packages or []:
+            self.add_package(package)
+        self.version = version
+
+    @staticmethod
+    def version_to_write(old=None) -> int:
+        """$WIT_LOCK_VERSION if set, otherwise the version of old, the lockfile being replaced"""
+        if lock_version is None:
+            return old.version if old else LOCK_VERSION_2
+        try:
+            version = int(lock_version)
+        except ValueError:
+            version = None
+        if version not in LOCK_VERSIONS:
+            raise WitUserError("$WIT_LOCK_VERSION must be one of {}, not '{}'".format(
+                ", ".join(str(v) for v in LOCK_VERSIONS), lock_version))
+        return version
 
     def get_package(self, name: str) -> Optional[GitRepo]:
-        for p in self.packages:
-            if p.name == name:
-                return p
-        return None
+        i = self._index.get(name)
+        return None if i is None else self.packages[i]
 
     def contains_package(self, name: str) -> bool:
-        return self.get_package(name) is not None
+        return name in self._index
 
     def add_package(self, package):
-        self.packages.append(package)
+        """Add package after the others, or in the place of the package of the same name"""
+        i = self._index.get(package.name)
+        if i is None:
+            self._index[package.name] = len(self.packages)
+            self.packages.append(package)
+        else:
+            self.packages[i] = package
 
+    @profiler.operation('write lock')
     def write(self, path):
         log.debug("Writing lock file to {}".format(path))
-        contents = [p.to_repo_entry() for p in self.packages]
-        RepoEntries.write(path, contents)
+        resolution = self.version > LOCK_VERSION_2
+        contents = [p.to_repo_entry(resolution) for p in self.packages]
+        RepoEntries.write(path, contents, self.version)
 
     @staticmethod
     def read(path):
         log.debug("Reading lock file from {}".format(path))
         from .package import Package
-        return LockFile([Package.from_repo_entry(x) for x in RepoEntries.read(path)])
+        version, entries = RepoEntries.read_lock(path)
+        return LockFile([Package.from_repo_entry(x) for x in entries], version)
+
+    def dependencies_of(self, package, wsroot) -> List[str]:
+        """
+        Names of the locked packages that package declares as dependencies. Version 3
+        lockfiles record them; otherwise they are read from package's repository.
+        """
+        if package.resolution is not None:
+            entries = package.resolution.dependencies
+        else:
+            package.load(wsroot, False)
+            entries = [] if package.repo is None else \
+                package.repo.repo_entries_from_commit(package.revision)
+        return [e.checkout_path for e in entries if self.contains_package(e.checkout_path)]
+
+    def topological(self, wsroot) -> list:
+        """The packages, each after the packages it depends on, otherwise in lockfile order"""
+        ordered = []  # type: list
+        state = {}  # type: Dict[str, bool]
+
+        def visit(name):
+            # state is False while visiting, True when done; a cycle is cut where it closes
+            if name in state:
+                return
+            state[name] = False
+            package = self.get_package(name)
+            for dep in self.dependencies_of(package, wsroot):
+                visit(dep)
+            state[name] = True
+            ordered.append(package)
+
+        for package in self.packages:
+            visit(package.name)
+        return ordered
 
 
 if __name__ == '__main__':
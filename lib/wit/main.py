@@ -10,24 +10,18 @@
 # * Use a real logger
 # * Handle partial sha1s correctly
 
-import subprocess
+# Only what every invocation needs is imported here. Subcommands import the rest
+# when they run, so that 'wit --version' and 'wit --list-commands' start quickly.
+import atexit
 import sys
-import shutil
 import os
 from .witlogger import getLogger
-from .workspace import WorkSpace, PackageNotInWorkspaceError
-from .dependency import Dependency
-from .inspect import inspect_tree
 from pathlib import Path
 from typing import cast, List, Tuple  # noqa: F401
+from .commands import fast_path, list_commands
 from .common import error, WitUserError, print_errors
-from .env import git_reference_workspace
-from .gitrepo import GitRepo, GitCommitNotFound
-from .manifest import Manifest
-from .package import WitBug
-from .parser import parser, add_dep_parser
-from .version import __version__
-import re
+from .env import git_reference_workspace, local_clone, LOCAL_CLONE_MODES
+from .version import get_version
 
 log = getLogger()
 
@@ -38,11 +32,19 @@ class NotAPackageError(WitUserError):
 
 def main() -> None:
 
+    if fast_path(sys.argv[1:], sys.stdout):
+        sys.exit(0)
+
     if git_reference_workspace and not Path(git_reference_workspace).is_absolute():
         log.error("Environment variable $WIT_WORKSPACE_REFERENCE contains a relative path: "
                   "'{}'. Please use an absolute path.".format(git_reference_workspace))
         sys.exit(1)
+    if local_clone not in LOCAL_CLONE_MODES:
+        log.error("Environment variable $WIT_LOCAL_CLONE must be one of {}, not '{}'".format(
+            ', '.join(LOCAL_CLONE_MODES), local_clone))
+        sys.exit(1)
 
+    from .parser import parser
     args = parser.parse_args()
     if args.verbose >= 4:
         log.setLevel('SPAM')
@@ -65,6 +67,35 @@ def main() -> None:
     if args.version:
         version()
         sys.exit(0)
+    if args.list_commands:
+        list_commands(sys.stdout)
+        sys.exit(0)
+
+    if getattr(args, 'offline', False):
+        from .backend import get_backend, set_backend
+        from .offline import OfflineBackend
+        set_backend(OfflineBackend(get_backend()))
+
+    from .daemon_client import SERVED
+    if args.command in SERVED and not (args.profile or args.trace_file):
+        exit_code = forward_to_daemon(args)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    from .gitrepo import GitRepo
+    from .history import history
+    from .package import WitBug
+    from .profile import profiler
+    from .workspace import WorkSpace
+
+    profiler.command = args.command or '-'
+    if args.profile:
+        profiler.enabled = True
+        atexit.register(profiler.report, sys.stderr, GitRepo.caches())
+
+    if args.trace_file:
+        profiler.start_trace()
+        atexit.register(profiler.write_trace, Path(args.trace_file).resolve())
 
     try:
         # FIXME: This big switch statement... no good.
@@ -77,7 +108,8 @@ def main() -> None:
             # These commands assume the workspace already exists. Error out if the
             # workspace cannot be found.
             try:
-                ws = WorkSpace.find(Path.cwd(), parse_repo_path(args), args.jobs)
+                ws = WorkSpace.find(Path.cwd(), parse_repo_path(args), args.jobs,
+                                    args.fail_fast)
 
             except FileNotFoundError as e:
                 log.error("Unable to find workspace root [{}]. Cannot continue.".format(e))
@@ -104,9 +136,18 @@ def main() -> None:
             elif args.command == 'foreach':
                 foreach(ws, args)
 
+            elif args.command == 'prefetch':
+                prefetch(ws, args)
+
+            elif args.command == 'bundle':
+                bundle(ws, args)
+
+            elif args.command == 'daemon':
+                daemon(ws, args)
+
             elif args.command == 'inspect':
-                if args.dot or args.tree:
-                    inspect_tree(ws, args)
+                if args.tree or args.dot or args.json or args.graphml:
+                    inspect(ws, args)
                 else:
                     log.error('`wit inspect` must be run with a flag')
                     print(parser.parse_args('inspect -h'.split()))
@@ -115,11 +156,69 @@ def main() -> None:
         error(e)
     except AssertionError as e:
         raise WitBug(e)
+    finally:
+        # clones and fetches outside of a resolve, as by add-pkg, are only recorded in memory
+        history.save()
+
+
+def inspect(ws, args):
+    from .inspect import inspect_tree
+    inspect_tree(ws, args)
+
+
+def forward_to_daemon(args):
+    """Exit status of the command as run by this workspace's daemon, or None if there is none"""
+    if args.command == 'inspect':
+        if not (args.tree or args.dot or args.json or args.graphml):
+            return None
+        # the daemon runs elsewhere, so it gets the file to write as an absolute path
+        output = str(Path(args.output).resolve()) if args.output else None
+        forwarded = {'tree': args.tree, 'dot': args.dot, 'json': args.json,
+                     'graphml': args.graphml, 'output': output}
+    else:
+        forwarded = {}
+    from .daemon_client import forward
+    return forward(Path.cwd(), args.command, forwarded, parse_repo_path(args))
+
+
+def daemon(ws, args):
+    from .daemon import Daemon
+    from .daemon_client import stop
+    if args.stop:
+        if not stop(ws.root):
+            log.info("No wit daemon is running for [{}]".format(ws.root))
+        return
+    commands = {'status': status, 'inspect': inspect}
+    server = Daemon(ws.root, ws.repo_paths, ws.jobs, commands)
+    server.serve(args.idle_timeout, args.prefetch_interval)
+
+
+def prefetch(ws, args) -> None:
+    names, errors = ws.prefetch(args.max_age)
+    if errors:
+        print_errors(errors)
+        sys.exit(1)
+    log.info("Prefetched {} packages".format(len(names)))
+
+
+def bundle(ws, args) -> None:
+    if not ws.lock:
+        error("{} is empty. Run 'wit update' before bundling.".format(ws.LOCK))
+    names, errors = ws.bundle(Path(args.directory).resolve())
+    if errors:
+        print_errors(errors)
+        sys.exit(1)
+    log.info("Bundled {} packages into [{}]".format(len(names), args.directory))
 
 
 def foreach(ws, args):
+    import subprocess
     has_fail = False
-    for pkg in ws.lock.packages:
+    packages = ws.lock.topological(ws.root) if args.topo else ws.lock.packages
+    for pkg in packages:
+        if not pkg.materialized:
+            log.verbose("Skipping '{}', which is not checked out".format(pkg.name))
+            continue
         env = os.environ.copy()
         env["WIT_REPO_NAME"] = pkg.name
         env["WIT_REPO_PATH"] = str(ws.root / pkg.name)
@@ -149,12 +248,13 @@ def parse_repo_path(args):
 
 
 def create(args) -> None:
+    from .workspace import WorkSpace
     if args.add_pkg is None:
         dependencies = []  # type: List[Tuple[str, str]]
     else:
         dependencies = args.add_pkg
 
-    ws = WorkSpace.create(args.workspace_name, parse_repo_path(args), args.jobs)
+    ws = WorkSpace.create(args.workspace_name, parse_repo_path(args), args.jobs, args.fail_fast)
     for dep in dependencies:
         ws.add_dependency(dep)
 
@@ -199,10 +299,14 @@ def restore_from_lock(args) -> None:
         sys.exit(1)
 
     if args.from_workspace or args.workspace_name:
+        import shutil
         shutil.copy(str(lock_dir/ws), str(dest_ws/ws))
         shutil.copy(str(lock_dir/lock), str(dest_ws/lock))
 
-    WorkSpace.restore(dest_ws)
+    bundles = Path(args.from_bundles).resolve() if args.from_bundles else None
+
+    from .workspace import WorkSpace
+    WorkSpace.restore(dest_ws, args.jobs, args.fail_fast, bundles)
 
 
 def add_pkg(ws, args) -> None:
@@ -215,6 +319,8 @@ def update_pkg(ws, args) -> None:
 
 
 def dependency_from_tag(wsroot, tag, message=None):
+    from .dependency import Dependency
+    from .gitrepo import GitRepo
     source, revision = tag
 
     dotwit = wsroot / ".wit"
@@ -234,6 +340,7 @@ def dependency_from_tag(wsroot, tag, message=None):
 
 def check_submodule_only(repo_path):
     """ Refuse to modify dependencies on repositories that only use git submodules"""
+    from .gitrepo import GitRepo
     dirname = os.path.basename(str(repo_path))
     manifest_path = repo_path/GitRepo.PKG_DEPENDENCY_FILE
     submodule_path = repo_path/GitRepo.SUBMODULE_FILE
@@ -244,6 +351,9 @@ def check_submodule_only(repo_path):
 
 def add_dep(ws, args) -> None:
     """ Resolve a Dependency then add it to the cwd's wit-manifest.json """
+    from .gitrepo import GitRepo, GitCommitNotFound
+    from .manifest import Manifest
+    from .parser import add_dep_parser
     packages = {pkg.name: pkg for pkg in ws.lock.packages}
     req_dep = dependency_from_tag(ws.root, args.pkg, message=args.message)
 
@@ -285,6 +395,9 @@ def add_dep(ws, args) -> None:
 
 
 def update_dep(ws, args) -> None:
+    from .gitrepo import GitRepo, GitCommitNotFound
+    from .manifest import Manifest
+    from .workspace import PackageNotInWorkspaceError
     packages = {pkg.name: pkg for pkg in ws.lock.packages}
     req_dep = dependency_from_tag(ws.root, args.pkg, message=args.message)
 
@@ -331,55 +444,26 @@ def status(ws, args) -> None:
         log.info("{} is empty. Have you run `wit update`?".format(ws.LOCK))
         return
 
-    clean = []
-    dirty = []
-    untracked = []
-    missing = []
-    seen_paths = {}
-    for package in ws.lock.packages:
-        package.load(ws.root, False)
-        if package.repo is None:
-            missing.append(package)
-            continue
-        seen_paths[package.repo.path] = True
-
-        lock_commit = package.revision
-        latest_commit = package.repo.get_head_commit()
-
-        new_commits = lock_commit != latest_commit
-
-        if new_commits or not package.repo.clean():
-            status = []
-            if new_commits:
-                status.append("new commits")
-            if package.repo.modified():
-                status.append("modified content")
-            if package.repo.untracked():
-                status.append("untracked content")
-            dirty.append((package, status))
-        else:
-            clean.append(package)
-
-    for path in ws.root.iterdir():
-        if path not in seen_paths and path.is_dir() and GitRepo.is_git_repo(path):
-            untracked.append(path)
-        seen_paths[path] = True
-
+    st = ws.status()
     log.info("Clean packages:")
-    for package in clean:
+    for package in st.clean:
         log.info("    {}".format(package.name))
     log.info("Dirty packages:")
-    for package, content in dirty:
+    for package, content in st.dirty:
         msg = ", ".join(content)
         log.info("    {} ({})".format(package.name, msg))
-    if len(untracked) > 0:
+    if len(st.untracked) > 0:
         log.info("Untracked packages:")
-        for path in untracked:
+        for path in st.untracked:
             relpath = path.relative_to(ws.root)
             log.info("    {}".format(relpath))
-    if len(missing) > 0:
+    if len(st.missing) > 0:
         log.info("Missing packages:")
-        for package in missing:
+        for package in st.missing:
+            log.info("    {}".format(package.name))
+    if len(st.staged) > 0:
+        log.info("Packages only in .wit/ (not checked out by 'wit update --only'):")
+        for package in st.staged:
             log.info("    {}".format(package.name))
 
     packages, errors = ws.resolve()
@@ -395,29 +479,11 @@ def status(ws, args) -> None:
 def update(ws, args) -> None:
     packages, errors = ws.resolve(download=True)
     if len(errors) == 0:
-        ws.checkout(packages)
+        ws.checkout(packages, getattr(args, 'only', None))
     else:
         print_errors(errors)
         sys.exit(1)
 
 
 def version() -> None:
-    version = get_git_version()
-    if not version:
-        version = get_dist_version()
-    print("wit {}".format(version))
-
-
-def get_git_version():
-    # not an official release, use git to get an explicit version
-    path = Path(__file__).resolve().parent.parent.parent
-    log.spam("Running [git -C {} describe --tags --dirty]".format(str(path)))
-    proc = subprocess.run(['git', '-C', str(path), 'describe', '--tags', '--dirty'],
-                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-    version = proc.stdout.decode('utf-8').rstrip()
-    log.spam("Output: [{}]".format(version))
-    return re.sub(r"^v", "", version)
-
-
-def get_dist_version():
-    return __version__
+    print("wit {}".format(get_version()))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from pathlib import Path
+from typing import Dict  # noqa: F401
 from .witlogger import getLogger
 from .repo_entries import RepoEntries
 
@@ -16,36 +17,35 @@ class Manifest:
     """
 
     def __init__(self, dependencies):
-        self.dependencies = dependencies
+        self.dependencies = []  # type: list
+        # position of each dependency in self.dependencies, by name
+        self._index = {}  # type: Dict[str, int]
+        for dep in dependencies:
+            self._index.setdefault(dep.name, len(self.dependencies))
+            self.dependencies.append(dep)
 
     def get_dependency(self, name: str):
-        for d in self.dependencies:
-            if d.name == name:
-                return d
-        return None
+        i = self._index.get(name)
+        return None if i is None else self.dependencies[i]
 
     def contains_dependency(self, name: str) -> bool:
-        return self.get_dependency(name) is not None
+        return name in self._index
 
     def add_dependency(self, dep):
         resolved = dep.resolved()
         log.debug("Adding to manifest: {}".format(resolved))
+        self._index.setdefault(resolved.name, len(self.dependencies))
         self.dependencies.append(resolved)
 
     def replace_dependency(self, dep) -> None:
-        newdeps = []
-        found = False
-        for d in self.dependencies:
-            if d.name == dep.name:
-                resolved = dep.resolved()
-                log.debug("New replace dep: {}".format(resolved))
-                newdeps.append(resolved)
-                found = True
-            else:
-                newdeps.append(d)
-        assert found, \
+        assert dep.name in self._index, \
             "Trying to update '{}' but it doesn't exist in manifest!".format(dep.name)
-        self.dependencies = newdeps
+        i = self._index[dep.name]
+        resolved = dep.resolved()
+        if resolved.sparse is None:
+            resolved.sparse = self.dependencies[i].sparse
+        log.debug("New replace dep: {}".format(resolved))
+        self.dependencies[i] = resolved
 
     def write(self, path):
         contents = [d.to_repo_entry() for d in self.dependencies]
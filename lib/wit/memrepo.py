@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set  # noqa: F401
+from .backend import Backend, Repo
+from .gitrepo import BadSource, GitCommitNotFound
+from .repo_entries import RepoEntry
+
+
+class MemoryCommit:
+    __slots__ = ('hash', 'parents', 'time', 'entries')
+
+    def __init__(self, hash, parents, time, entries):
+        self.hash = hash
+        self.parents = parents  # type: List[str]
+        self.time = time  # type: int
+        # dependencies declared at this commit
+        self.entries = entries  # type: List[RepoEntry]
+
+
+class MemoryRemote:
+    """
+    A commit DAG and its refs, standing in for a remote repository
+
+    >>> r = MemoryRemote()
+    >>> a = r.commit(100)
+    >>> b = r.commit(200, entries=[RepoEntry('dep', 'HEAD', 'mem://dep')])
+    >>> r.refs['HEAD'] == b and r.commits[b].parents == [a]
+    True
+    """
+
+    def __init__(self):
+        self.commits = {}  # type: Dict[str, MemoryCommit]
+        self.refs = {}  # type: Dict[str, str]
+        self.tags = set()  # type: Set[str]
+
+    def commit(self, time, entries=None, parents=None, ref='HEAD'):
+        """Add a commit on top of ref (or of the given parents) and move ref to it"""
+        if parents is None:
+            parents = [self.refs[ref]] if ref in self.refs else []
+        key = "{}:{}:{}".format(time, ','.join(parents), len(self.commits))
+        hash = hashlib.sha1(key.encode()).hexdigest()
+        self.commits[hash] = MemoryCommit(hash, parents, time, entries or [])
+        if ref is not None:
+            self.refs[ref] = hash
+        return hash
+
+    def tag(self, name, commit):
+        self.refs[name] = commit
+        self.tags.add(name)
+
+
+class MemoryBackend(Backend):
+    """
+    Repositories that live in memory, for exercising the resolver on large synthetic
+    graphs without git. Sources are looked up in 'remotes'; anything else is a bad source.
+    """
+
+    def __init__(self, remotes=None):
+        self.remotes = remotes or {}  # type: Dict[str, MemoryRemote]
+        # what has been "downloaded", by path
+        self._repos = {}  # type: Dict[Path, MemoryRepo]
+        self._lock = threading.Lock()
+
+    def open(self, name, wsroot: Path) -> 'MemoryRepo':
+        with self._lock:
+            path = wsroot / name
+            if path not in self._repos:
+                self._repos[path] = MemoryRepo(self, name, wsroot)
+            return self._repos[path]
+
+    def is_repo(self, path) -> bool:
+        return str(path) in self.remotes
+
+
+class MemoryRepo(Repo):
+    def __init__(self, backend, name, wsroot):
+        super().__init__(name, wsroot)
+        self.backend = backend
+        self.remote = None  # type: Optional[MemoryRemote]
+        self.source = None  # type: Optional[str]
+        self.head = None  # type: Optional[str]
+        self._ancestors = {}  # type: Dict[str, Set[str]]
+
+    def exists(self) -> bool:
+        return self.remote is not None
+
+    def download(self, source, name):
+        if source not in self.backend.remotes:
+            raise BadSource(name, source)
+        self.remote = self.backend.remotes[source]
+        if self.source is None:
+            self.source = source
+        return None
+
+    def _commit(self, rev) -> MemoryCommit:
+        if self.remote is None:
+            raise GitCommitNotFound
+        if rev == 'HEAD' and self.head is not None:
+            rev = self.head
+        rev = self.remote.refs.get(rev, rev)
+        commit = self.remote.commits.get(rev)
+        if commit is None:
+            matches = [h for h in self.remote.commits if h.startswith(rev)] if rev else []
+            if len(matches) != 1:
+                raise GitCommitNotFound
+            commit = self.remote.commits[matches[0]]
+        return commit
+
+    def get_commit(self, commit) -> str:
+        return self._commit(commit).hash
+
+    def get_shortened_rev(self, commit) -> str:
+        return self.get_commit(commit)[:7]
+
+    def is_tag(self, ref) -> bool:
+        return self.remote is not None and ref in self.remote.tags
+
+    def has_commit(self, commit) -> bool:
+        try:
+            self._commit(commit)
+            return True
+        except GitCommitNotFound:
+            return False
+
+    def commit_to_time(self, hash) -> str:
+        return str(self._commit(hash).time)
+
+    def _ancestry(self, hash) -> Set[str]:
+        """hash and every commit in its history"""
+        assert self.remote is not None
+        if hash not in self._ancestors:
+            seen = set()  # type: Set[str]
+            todo = [hash]
+            while todo:
+                h = todo.pop()
+                if h not in seen:
+                    seen.add(h)
+                    todo.extend(self.remote.commits[h].parents)
+            self._ancestors[hash] = seen
+        return self._ancestors[hash]
+
+    def is_ancestor(self, ancestor, current=None) -> bool:
+        try:
+            ancestor = self.get_commit(ancestor)
+            current = self.get_commit(current or 'HEAD')
+        except GitCommitNotFound:
+            return False
+        return ancestor in self._ancestry(current)
+
+    def have_common_ancestor(self, commits) -> bool:
+        try:
+            histories = [self._ancestry(self.get_commit(c)) for c in commits]
+        except GitCommitNotFound:
+            return False
+        return bool(set.intersection(*histories)) if histories else False
+
+    def repo_entries_from_commit(self, revision) -> List[RepoEntry]:
+        return list(self._commit(revision).entries)
+
+    def checkout(self, revision, sparse=None, was_sparse=False):
+        self.head = self.get_commit(revision)
+        self.revision = self.head
+
+    def get_remote(self) -> str:
+        return self.source or ''
+
+    def set_origin(self, source):
+        self.source = source
+
+    def clean(self) -> bool:
+        return True
+
+    def modified(self) -> bool:
+        return False
+
+    def untracked(self) -> bool:
+        return False
+
+    def modified_manifest(self) -> bool:
+        return False
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+from pathlib import Path
+from typing import Optional  # noqa: F401
+from .backend import Backend, Repo  # noqa: F401
+from .common import WitUserError
+
+
+class NotAvailableOffline(WitUserError):
+    def __init__(self, name, source, revision):
+        self.name = name
+        self.source = source
+        self.revision = revision
+
+    def __str__(self):
+        return ("'{}' needs '{}' from [{}], which is not in the workspace, .wit/, "
+                "the repo paths or $WIT_WORKSPACE_REFERENCE".format(
+                    self.name, self.revision, self.source))
+
+
+class OfflineBackend(Backend):
+    """
+    Opens repositories that must not touch the network. Package brings missing commits
+    in only from local_copy(), and GitRepo leaves remotes other than that copy alone.
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+
+    def open(self, name, wsroot: Path) -> Repo:
+        repo = self.backend.open(name, wsroot)
+        repo.offline = True
+        return repo
+
+    def is_repo(self, path) -> bool:
+        return self.backend.is_repo(path)
+
+    def size_hint(self, name, wsroot: Path, source):
+        return self.backend.size_hint(name, wsroot, source)
+
+
+def local_copy(repo, source) -> Optional[str]:
+    """
+    A directory on this machine to bring the commits of source in from: source itself
+    when it is a path (as --repo-path sources are), or else the repo's copy in
+    $WIT_WORKSPACE_REFERENCE.
+    """
+    if Path(source).is_dir():
+        return source
+    reference = getattr(repo, 'reference_path', lambda: None)()
+    return str(reference) if reference is not None else None
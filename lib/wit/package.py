@@ -4,8 +4,13 @@ from pathlib import Path
 import re
 import os
 import shutil
-from .gitrepo import GitRepo, BadSource
-from .repo_entries import RepoEntry
+from .backend import get_backend
+from .gitrepo import BadSource, GitCommitNotFound
+from .history import history
+from .offline import NotAvailableOffline, local_copy
+from .profile import profiler
+from .remoterefs import remote_refs
+from .repo_entries import RepoEntry, Resolution
 from .witlogger import getLogger
 
 log = getLogger()
@@ -19,6 +24,8 @@ class Package:
     """ Packages are the "winner" of several dependencies of the same name.
     These "winner" Packages are determined by WorkSpace.resolve and stored in the wit-lock.json
     """
+    __slots__ = ('name', 'source', 'revision', 'repo_paths', 'repo', 'dependents', 'sparse',
+                 'materialized', 'resolution', 'in_root', '_dependencies')
 
     def __init__(self, name, repo_paths):
         """ Before we know which dependency "won," we need a Package object to
@@ -37,6 +44,16 @@ class Package:
 
         self.repo = None
         self.dependents = []
+        # sparse-checkout paths read from a lockfile, used when there are no dependents
+        self.sparse = None
+        # False for packages 'wit update --only' left in .wit/
+        self.materialized = True
+        # what a version 3 lockfile recorded about the locked commit, see lock_resolution
+        self.resolution = None
+        # whether load() found the package checked out rather than in .wit/
+        self.in_root = False
+        # (revision, get_dependencies() at that revision)
+        self._dependencies = None
 
     def set_source(self, source):
         self.source = self.resolve_source(source)
@@ -66,7 +83,10 @@ class Package:
 
         If found, self.repo will be updated.
         """
+        with profiler.operation('load', package=self.name):
+            self._load(wsroot, download, source, revision)
 
+    def _load(self, wsroot, download, source, revision):
         source = self.resolve_source(source) or self.resolve_source(self.source)
         revision = revision or self.revision
 
@@ -82,21 +102,79 @@ class Package:
             if not repo_root.exists():
                 os.mkdir(str(repo_root))
 
-        self.repo = GitRepo(self.name, repo_root)
+        self.repo = get_backend().open(self.name, repo_root)
 
         # we carefully use Python's boolean expression evalution short-circuiting
         # to avoid calling has_commit if the repo does not exist
-        if (not self.repo.path.exists()
+        if (not self.repo.exists()
                 or not self.repo.has_commit(revision)
                 or not (self.repo.is_hash(revision) or self.repo.is_tag(revision))):
             if not download:
                 self.repo = None
                 return
+            if self.repo.offline:
+                self._load_offline(source, revision)
+                return
+            if self.repo.exists() and self._matches_remote(wsroot, source, revision):
+                log.debug("{}::{} matches its remote, not fetching".format(self.name, revision))
+                return
             try:
-                self.repo.download(source, self.name)
+                transfer = self.repo.download(source, self.name)
             except BadSource:
                 self.repo = None
                 raise
+            if transfer is not None:
+                history.record(source, transfer.kind, transfer.seconds, transfer.size)
+
+    def unbundle(self, wsroot, bundle):
+        """Start the repository in .wit/ from a bundle instead of cloning it"""
+        repo = get_backend().open(self.name, wsroot/'.wit')
+        if repo.exists():
+            return
+        repo.unbundle(bundle, self.resolve_source(self.source))
+        log.info("Unbundled {}".format(self.name))
+
+    def _load_offline(self, source, revision):
+        """Bring revision in from a copy on this machine, or raise NotAvailableOffline"""
+        # without the network, what a branch name resolves to locally is all there is
+        if self.repo.exists() and self.repo.has_commit(revision):
+            return
+        local = local_copy(self.repo, source)
+        if local is not None:
+            log.verbose("Bringing {}::{} in from [{}]".format(self.name, revision, local))
+            cloned = not self.repo.exists()
+            self.repo.download(local, self.name)
+            if cloned and local != source:
+                self.repo.set_origin(source)
+        if not (self.repo.exists() and self.repo.has_commit(revision)):
+            self.repo = None
+            raise NotAvailableOffline(self.name, source, revision)
+
+    def _matches_remote(self, wsroot, source, revision) -> bool:
+        """
+        Whether revision, HEAD or a branch or tag name, already resolves locally to the commit
+        source advertises for it. A fetch would not change what it resolves to then.
+        """
+        advertised = remote_refs(wsroot).lookup(self.repo, source, revision)
+        if advertised is None:
+            return False
+        try:
+            return self.repo.get_commit(revision) == advertised
+        except GitCommitNotFound:
+            return False
+
+    def transfer_job(self, wsroot, source):
+        """
+        Describe the download that loading this package from source may need as
+        (source, 'clone' or 'fetch', size hint), for ordering with CloneHistory.estimate
+        """
+        source = self.resolve_source(source)
+        on_disk = (wsroot/self.name).exists() or (wsroot/'.wit'/self.name).exists()
+        kind = 'fetch' if on_disk else 'clone'
+        size_hint = None
+        if not history.knows(source, kind):
+            size_hint = get_backend().size_hint(self.name, wsroot, source)
+        return source, kind, size_hint
 
     def is_ancestor(self, other_commit):
         return self.repo.is_ancestor(other_commit, self.revision)
@@ -104,26 +182,59 @@ class Package:
     def resolve_source(self, source):
         for path in self.repo_paths:
             tmp_path = str(Path(path) / self.name)
-            if GitRepo.is_git_repo(tmp_path):
+            if get_backend().is_repo(tmp_path):
                 return tmp_path
         return source
 
     def get_dependencies(self):
-        from .dependency import Dependency
-        entries = self.repo.repo_entries_from_commit(self.revision)
-        deps = [Dependency.from_repo_entry(e) for e in entries]
-        for dep in deps:
-            dep.add_dependent(self)
-        return deps
-
-    def to_repo_entry(self):
-        return RepoEntry(self.name, self.revision, self.source)
+        """
+        The dependencies the package declares at its revision. Built once per revision, so
+        that walking the graph again, as 'wit inspect' does, allocates nothing.
+        """
+        if self._dependencies is None or self._dependencies[0] != self.revision:
+            from .dependency import Dependency
+            entries = self.repo.repo_entries_from_commit(self.revision)
+            deps = [Dependency.from_repo_entry(e) for e in entries]
+            for dep in deps:
+                dep.add_dependent(self)
+            self._dependencies = (self.revision, deps)
+        return self._dependencies[1]
+
+    def sparse_paths(self):
+        """
+        The union of the sparse-checkout paths of every dependent, or None for the whole
+        tree, which is what any dependent without paths gets.
+        """
+        if not self.dependents:
+            return self.sparse
+        paths = set()
+        for dep in self.dependents:
+            if dep.sparse is None:
+                return None
+            paths.update(dep.sparse)
+        return sorted(paths)
+
+    def lock_resolution(self):
+        """What to record about the locked commit in a version 3 lockfile"""
+        if self.repo is None:
+            return self.resolution
+        rev = self.revision
+        return Resolution(int(self.repo.commit_to_time(rev)), self.repo.tree_id(rev),
+                          self.repo.manifest_id(rev), self.repo.repo_entries_from_commit(rev))
+
+    def to_repo_entry(self, resolution=False):
+        return RepoEntry(self.name, self.revision, self.source, sparse=self.sparse_paths(),
+                         materialized=self.materialized,
+                         resolution=self.lock_resolution() if resolution else None)
 
     @staticmethod
     def from_repo_entry(entry):
         pkg = Package(entry.checkout_path, [])
         pkg.set_source(entry.remote_url)
         pkg.revision = entry.revision
+        pkg.sparse = entry.sparse
+        pkg.materialized = entry.materialized
+        pkg.resolution = entry.resolution
         return pkg
 
     # this is in Package because update_dependency is in Package
@@ -132,8 +243,12 @@ class Package:
         """Change the wit-manifest.json to add a dependency."""
         pass
 
-    def checkout(self, wsroot):
-        """Move to root directory and checkout"""
+    @profiler.operation('checkout package')
+    def checkout(self, wsroot, was_sparse=False):
+        """
+        Move to root directory and checkout. was_sparse says whether wit checked out only part
+        of the package last time, as recorded in the lockfile.
+        """
         current_origin = self.repo.get_remote()
         wanted_origin = self.source
         if current_origin != wanted_origin:
@@ -150,7 +265,7 @@ class Package:
         assert self.repo.name == self.name
         shutil.move(str(self.repo.path), str(wsroot/self.repo.name))
         self.move_to_root(wsroot)
-        self.repo.checkout(self.revision)
+        self.repo.checkout(self.revision, self.sparse_paths(), was_sparse)
 
     def find_matching_dependent(self):
         """
@@ -180,13 +295,24 @@ class Package:
     def get_id(self):
         return "pkg_"+re.sub(r"([^\w\d])", "_", self.id())
 
-    def status(self, lock):
+    def pending_change(self, lock):
+        """
+        What 'wit update' would do to this resolved package, given the current lock: 'checkout'
+        a different commit, 'add' it to the workspace and lockfile, add it to the 'lock' only,
+        or None
+        """
         if lock.contains_package(self.name):
             if self.repo and self.revision != self.repo.get_head_commit():
-                return "\033[35m(will be checked out to {})\033[m".format(
-                    self.short_revision())
-        else:
-            if not self.in_root:
-                return "\033[92m(will be added to workspace and lockfile)\033[m"
-            else:
-                return "\033[31m(will be added to lockfile)\033[m"
+                return 'checkout'
+            return None
+        return 'lock' if self.in_root else 'add'
+
+    def status(self, lock):
+        change = self.pending_change(lock)
+        if change == 'checkout':
+            return "\033[35m(will be checked out to {})\033[m".format(self.short_revision())
+        if change == 'add':
+            return "\033[92m(will be added to workspace and lockfile)\033[m"
+        if change == 'lock':
+            return "\033[31m(will be added to lockfile)\033[m"
+        return None
@@ -1,6 +1,7 @@
 import argparse
 import os
-from .dependency import parse_dependency_tag
+from .commands import HELP
+from .env import ci
 
 # default max parallel git clones possible by 'init' or 'update'
 _max_clone_jobs = 64
@@ -17,6 +18,12 @@ def chdir(s) -> None:
         err("'{}' is not a directory!".format(s))
 
 
+def parse_dependency_tag(s):
+    # imported here so that building the parser does not load the resolver
+    from .dependency import parse_dependency_tag
+    return parse_dependency_tag(s)
+
+
 # ********** top-level parser **********
 parser = argparse.ArgumentParser(
     prog='wit',
@@ -32,14 +39,27 @@ parser.add_argument('-v', '--verbose', action='count', default=0,
 -vvvv: spam
 ''')
 parser.add_argument('--version', action='store_true', help='Print wit version')
+parser.add_argument('--list-commands', action='store_true',
+                    help='Print the subcommands, one per line, for shell completion')
 parser.add_argument('-C', dest='cwd', type=chdir, metavar='path', help='Run in given path')
 parser.add_argument('--repo-path', default=os.environ.get('WIT_REPO_PATH'),
                     help='Specify alternative paths to look for packages')
 parser.add_argument('--prepend-repo-path', default=None,
                     help='Prepend paths to the default repo search path.')
 parser.add_argument('-j', '--max-parallel-clones', dest='jobs', default=_max_clone_jobs, type=int,
-                    help="Max quantity of 'git clone' to run in parallel. "
+                    help="Max quantity of 'git clone' to run in parallel. Wit starts with\n"
+                    "fewer and adapts to the observed throughput and failures.\n"
                     "Default is '{}'. Set to '1' for serial cloning.".format(_max_clone_jobs))
+parser.add_argument('--fail-fast', dest='fail_fast', action='store_true', default=ci,
+                    help="Stop outstanding clones and report the first resolution error\n"
+                    "immediately. Default is on when $CI is set.")
+parser.add_argument('--no-fail-fast', dest='fail_fast', action='store_false',
+                    help="Finish outstanding clones before reporting errors.")
+parser.add_argument('--profile', action='store_true',
+                    help="Print a summary of the git commands wit ran when it exits.")
+parser.add_argument('--trace-file', metavar='path',
+                    help="Write a timeline of the run in Chrome trace event format,\n"
+                    "for viewing in Perfetto or chrome://tracing.")
 
 # ********** command subparser aggregator **********
 subparsers = parser.add_subparsers(
@@ -49,7 +69,7 @@ subparsers = parser.add_subparsers(
                help='<description>')
 
 # ********** init subparser **********
-init_parser = subparsers.add_parser('init', help='create workspace')
+init_parser = subparsers.add_parser('init', help=HELP['init'])
 init_parser.add_argument('--no-update', dest='update', action='store_false',
                          help='don\'t run update upon creating the workspace')
 init_parser.add_argument('-a', '--add-pkg', metavar='repo[::revision]', action='append',
@@ -59,7 +79,7 @@ init_parser.add_argument('workspace_name')
 # ********** restore subparser **********
 restore_parser = subparsers.add_parser(
     'restore',
-    help='restore previous workspace',
+    help=HELP['restore'],
     description='Create a workspace in the current directory from the metadata of a previous '
                 'workspace. The wit-workspace.json and wit-lock.json files are required to be '
                 'provided but are assumed to be in the current directory.')
@@ -68,14 +88,16 @@ restore_parser.add_argument(
     help='new directory to create workspace in. Default is $PWD.')
 restore_parser.add_argument('-w', '--from-workspace', dest='from_workspace',
                             help="directory containing wit-lock.json and wit-workspace.json")
+restore_parser.add_argument('--from-bundles', dest='from_bundles', metavar='DIR',
+                            help="start packages from the git bundles 'wit bundle create' wrote "
+                            "to DIR, fetching only commits they lack")
 
 # ********** add-pkg subparser **********
-add_pkg_parser = subparsers.add_parser('add-pkg', help='add a package to the workspace')
+add_pkg_parser = subparsers.add_parser('add-pkg', help=HELP['add-pkg'])
 add_pkg_parser.add_argument('repo', metavar='repo[::revision]', type=parse_dependency_tag)
 
 # ********** update-pkg subparser **********
-update_pkg_parser = subparsers.add_parser('update-pkg', help='update the revision of a '
-                                          'previously added package')
+update_pkg_parser = subparsers.add_parser('update-pkg', help=HELP['update-pkg'])
 update_pkg_parser.add_argument('repo', metavar='repo[::revision]', type=parse_dependency_tag)
 
 # ********** add-dep subparser **********
@@ -83,7 +105,7 @@ add_dep_parser = subparsers.add_parser(
     name='add-dep',
     description='Adds <pkg> as a dependency to a target package determined by the current working '
                 'directory (which can be set by -C)',
-    help='add a dependency to a package')
+    help=HELP['add-dep'])
 add_dep_parser.add_argument(
     dest='pkg',
     metavar='pkg[::revision]',
@@ -96,8 +118,7 @@ add_dep_parser.add_argument(
     help="Comment message to be added to the dependency's entry in the manifest.")
 
 # ********** update-dep subparser **********
-update_dep_parser = subparsers.add_parser('update-dep', help='update revision of a dependency '
-                                          'in a package')
+update_dep_parser = subparsers.add_parser('update-dep', help=HELP['update-dep'])
 update_dep_parser.add_argument('pkg', metavar='pkg[::revision]', type=parse_dependency_tag)
 update_dep_parser.add_argument(
     '-m',
@@ -107,21 +128,34 @@ update_dep_parser.add_argument(
          ' overwrite a previous message.')
 
 # ********** status subparser **********
-subparsers.add_parser('status', help='show status of workspace')
+status_parser = subparsers.add_parser('status', help=HELP['status'])
+status_parser.add_argument('--offline', action='store_true',
+                           help="never contact a remote (status does not fetch anyway)")
 
 # ********** update subparser **********
-subparsers.add_parser('update', help='update git repos')
+update_parser = subparsers.add_parser('update', help=HELP['update'])
+update_parser.add_argument('--only', nargs='+', metavar='pkg',
+                           help="resolve everything but only check out these packages and "
+                           "their dependencies, leaving the rest in .wit/")
+update_parser.add_argument('--offline', action='store_true',
+                           help="resolve from commits already on this machine only, listing "
+                           "the ones that are missing instead of fetching them")
 
 # ********** inspect subparser **********
-inspect_parser = subparsers.add_parser('inspect', help='inspect lockfile')
+inspect_parser = subparsers.add_parser('inspect', help=HELP['inspect'])
 inspect_group = inspect_parser.add_mutually_exclusive_group()
 inspect_group.add_argument('--tree', action="store_true")
 inspect_group.add_argument('--dot', action="store_true")
+inspect_group.add_argument('--json', action="store_true",
+                           help="print the graph as JSON lists of nodes and edges")
+inspect_group.add_argument('--graphml', action="store_true", help="print the graph as GraphML")
+inspect_parser.add_argument('-o', '--output', metavar='FILE',
+                            help="write --dot, --json or --graphml to FILE instead of stdout")
 
 # ********** foreach subparser **********
 foreach_parser = subparsers.add_parser(
     'foreach',
-    help='perform a command in each repository directory',
+    help=HELP['foreach'],
     formatter_class=argparse.RawDescriptionHelpFormatter,
     description="""
 Perform a command in each repository directory.
@@ -138,7 +172,50 @@ Wit sets the following environment variables for each invocation of the command:
 
 foreach_parser.add_argument('--continue-on-fail', action='store_true',
                             help='run the command in each repository regardless of failures')
+foreach_parser.add_argument('--topo', action='store_true',
+                            help='visit each repository after the repositories it depends on')
 
 # 'cmd' and 'args' eventually become one list, but this forces at least one input string
 foreach_parser.add_argument('cmd', help='command to run in each repository')
 foreach_parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the command')
+
+# ********** prefetch subparser **********
+prefetch_parser = subparsers.add_parser(
+    'prefetch',
+    help=HELP['prefetch'],
+    description="Fetch the branches and tags of every package's remote into\n"
+                "refs/wit-prefetch/ in its repository, without changing local branches or\n"
+                "origin/*, so that a later 'wit update' finds the commits it needs locally.\n"
+                "Only packages already on disk are fetched. Run it from cron, or let\n"
+                "'wit daemon --prefetch-interval' run it.",
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+prefetch_parser.add_argument('--max-age', type=float, metavar='seconds',
+                             help='skip packages prefetched less than this long ago')
+
+# ********** bundle subparser **********
+bundle_parser = subparsers.add_parser(
+    'bundle',
+    help=HELP['bundle'],
+    description="'wit bundle create DIR' writes one git bundle per package in wit-lock.json,\n"
+                "holding the locked commit and everything it reaches, and an index of them,\n"
+                "wit-bundles.json. 'wit restore --from-bundles DIR' starts each package from\n"
+                "its bundle and only fetches from the remote what the bundle lacks.",
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+bundle_parser.add_argument('action', choices=['create'])
+bundle_parser.add_argument('directory', help='where to write the bundles and their index')
+
+# ********** daemon subparser **********
+daemon_parser = subparsers.add_parser(
+    'daemon',
+    help=HELP['daemon'],
+    description="Keep this workspace's manifests, lockfile and resolved dependency graph in\n"
+                "memory and answer 'wit status' and 'wit inspect' from there. The daemon\n"
+                "listens on .wit/daemon.sock and runs in the foreground until stopped; wit\n"
+                "commands use it automatically while it runs. Set WIT_DAEMON=0 to bypass it.",
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+daemon_parser.add_argument('--stop', action='store_true',
+                           help='stop the daemon running for this workspace')
+daemon_parser.add_argument('--idle-timeout', type=float, metavar='seconds',
+                           help='exit after this long without a request')
+daemon_parser.add_argument('--prefetch-interval', type=float, metavar='seconds',
+                           help="run 'wit prefetch' in the background this often")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import threading
+from pathlib import Path
+from typing import Dict, Optional  # noqa: F401
+from .common import atomic_write_json, load_json
+from .witlogger import getLogger
+
+log = getLogger()
+
+
+class PrefetchLog:
+    """
+    When each package of a workspace was last prefetched, and from where.
+
+    Kept in .wit/ because it describes the repositories of one workspace, unlike
+    CloneHistory which describes sources.
+    """
+    FILE = "prefetch.json"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None  # type: Optional[Dict[str, dict]]
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = load_json(self.path)
+        return self._data
+
+    def last(self, name) -> Optional[float]:
+        """Seconds since the epoch of the last successful prefetch of name, if any"""
+        with self._lock:
+            entry = self._load().get(name)
+        return entry['time'] if entry else None
+
+    def record(self, name, source, when):
+        with self._lock:
+            data = self._load()
+            data[name] = {'source': source, 'time': round(when, 3)}
+            try:
+                atomic_write_json(self.path, data)
+            except OSError as e:
+                log.debug("Unable to write prefetch times [{}]: {}".format(self.path, e))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from typing import List, Optional, Set  # noqa: F401
+
+# One git invocation, as seen by 'wit --profile'
+GitCall = namedtuple('GitCall', ['subcommand', 'repo', 'seconds', 'returncode',
+                                 'stdout_chars', 'operation'])
+
+
+class Profiler:
+    """
+    Records every git command wit runs, tagged with the wit operation that ran it,
+    and summarizes them for 'wit --profile'.
+
+    It can also collect a timeline of operations and git commands per thread in the
+    Chrome trace event format for 'wit --trace-file', to be viewed in Perfetto or
+    chrome://tracing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # the wit subcommand, for git commands run outside of any operation()
+        self.command = '-'
+        self.calls = []  # type: List[GitCall]
+        # trace events, or None when not tracing
+        self.trace_events = None  # type: Optional[List[dict]]
+        self._epoch = time.monotonic()
+        self._named_threads = set()  # type: Set[int]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_trace(self):
+        self.trace_events = []
+        self._epoch = time.monotonic()
+
+    def current_stack(self) -> tuple:
+        return tuple(getattr(self._local, 'operations', ()))
+
+    def current_operation(self) -> str:
+        return '/'.join(self.current_stack()) or self.command
+
+    @contextmanager
+    def operation(self, name, **args):
+        """
+        Attribute the git commands run on this thread inside the block to 'name'.
+        When tracing, the block also becomes a span with 'args' attached.
+        Can also be used as a method decorator.
+        """
+        saved = self.current_stack()
+        self._local.operations = saved + (name,)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._local.operations = saved
+            if self.trace_events is not None:
+                self._trace(name, 'wit', start, args)
+
+    @contextmanager
+    def inherit(self, stack):
+        """Continue another thread's current_stack() on this thread"""
+        saved = self.current_stack()
+        self._local.operations = stack
+        try:
+            yield
+        finally:
+            self._local.operations = saved
+
+    def record(self, args, repo, start, returncode, stdout):
+        if not self.enabled and self.trace_events is None:
+            return
+        subcommand = next((a for a in args[1:] if not a.startswith('-')), '')
+        call = GitCall(subcommand, repo, time.monotonic() - start, returncode,
+                       len(stdout or ''), self.current_operation())
+        if self.enabled:
+            with self._lock:
+                self.calls.append(call)
+        if self.trace_events is not None:
+            self._trace("git " + subcommand, 'git', start, {
+                'repo': repo,
+                'command': ' '.join(args),
+                'returncode': returncode,
+                'stdout_chars': call.stdout_chars,
+                'operation': call.operation,
+            })
+
+    def _trace(self, name, category, start, args):
+        end = time.monotonic()
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self._epoch) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': args,
+        }
+        with self._lock:
+            if thread.ident not in self._named_threads:
+                self._named_threads.add(thread.ident)
+                self.trace_events.append({'name': 'thread_name', 'ph': 'M',
+                                          'pid': event['pid'], 'tid': thread.ident,
+                                          'args': {'name': thread.name}})
+            self.trace_events.append(event)
+
+    def write_trace(self, path):
+        """Write the trace, with one span for the whole run, as Chrome trace event JSON"""
+        self._trace('wit ' + self.command, 'wit', self._epoch, {})
+        with self._lock:
+            data = {'traceEvents': self.trace_events, 'displayTimeUnit': 'ms'}
+        with open(str(path), 'w') as f:
+            json.dump(data, f)
+
+    def report(self, out, caches=()):
+        """Write the aggregated tables. caches are (name, functools.lru_cache function)."""
+        with self._lock:
+            calls = list(self.calls)
+        total = sum(c.seconds for c in calls)
+        failed = sum(1 for c in calls if c.returncode != 0)
+        print("", file=out)
+        print("git profile: {} commands ({} failed), {:.3f}s total, {} characters of output"
+              "".format(len(calls), failed, total, sum(c.stdout_chars for c in calls)),
+              file=out)
+        for title, key in [('subcommand', lambda c: c.subcommand),
+                           ('package', lambda c: c.repo),
+                           ('operation', lambda c: c.operation)]:
+            _print_table(out, title, calls, key)
+
+        if caches:
+            print("", file=out)
+            print("{:<32} {:>8} {:>8} {:>8}".format('cache', 'hits', 'misses', 'hit rate'),
+                  file=out)
+            for name, cached in caches:
+                info = cached.cache_info()
+                lookups = info.hits + info.misses
+                rate = "{:.1%}".format(info.hits / lookups) if lookups else '-'
+                print("{:<32} {:>8} {:>8} {:>8}".format(name, info.hits, info.misses, rate),
+                      file=out)
+
+
+def _print_table(out, title, calls, key):
+    groups = OrderedDict()  # type: OrderedDict
+    for call in calls:
+        groups.setdefault(key(call), []).append(call.seconds)
+    width = max([len(title)] + [len(str(k)) for k in groups])
+    row = "{:<" + str(width) + "} {:>6} {:>10} {:>10} {:>10}"
+    print("", file=out)
+    print(row.format(title, 'count', 'total', 'p50', 'p99'), file=out)
+    by_total = sorted(groups.items(), key=lambda kv: -sum(kv[1]))
+    for name, seconds in by_total:
+        seconds = sorted(seconds)
+        print(row.format(name, len(seconds),
+                         "{:.3f}s".format(sum(seconds)),
+                         "{:.3f}s".format(percentile(seconds, 50)),
+                         "{:.3f}s".format(percentile(seconds, 99))), file=out)
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile([1, 2, 3, 4], 99)
+    4
+    >>> percentile([7], 50)
+    7
+    """
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+profiler = Profiler()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
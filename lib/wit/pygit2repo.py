@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import re
+from typing import Optional  # noqa: F401
+from .gitrepo import GitRepo
+from .witlogger import getLogger
+
+try:
+    import pygit2  # type: ignore
+except ImportError:
+    pygit2 = None
+
+log = getLogger()
+
+full_hash = re.compile(r'^[0-9a-f]{40}$')
+
+
+def available() -> bool:
+    return pygit2 is not None
+
+
+class Pygit2Repo(GitRepo):
+    """
+    A GitRepo that answers read-only queries (revision lookup, commit times, ancestry,
+    tags, files and submodule pointers at a revision) in-process with libgit2 instead of
+    starting a git process for each.
+
+    Network transfer, checkout and working tree status still go through the git command
+    line. Whenever libgit2 cannot give a definite answer, the query falls back to the
+    GitRepo implementation, so results are the same as with git alone.
+    """
+
+    def __init__(self, name, wsroot):
+        super().__init__(name, wsroot)
+        self._handle = None
+        self._handle_path = None
+
+    def _repo(self):
+        """The libgit2 repository at self.path, or None if it cannot be opened"""
+        # self.path changes when the package is moved into the workspace
+        if self._handle is None or self._handle_path != self.path:
+            self._handle = None
+            self._handle_path = self.path
+            try:
+                self._handle = pygit2.Repository(str(self.path))
+            except (pygit2.GitError, KeyError, ValueError) as e:
+                log.debug("libgit2 cannot open [{}]: {}".format(self.path, e))
+        return self._handle
+
+    def _lookup(self, rev):
+        repo = self._repo()
+        if repo is None:
+            return None
+        try:
+            return repo.revparse_single(rev)
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+
+    def _commit(self, rev):
+        obj = self._lookup(rev)
+        if obj is None:
+            return None
+        try:
+            return obj.peel(pygit2.Commit)
+        except (ValueError, pygit2.GitError):
+            return None
+
+    def download(self, source, name):
+        # new objects and refs are picked up by a fresh handle
+        self._handle = None
+        return super().download(source, name)
+
+    def prefetch(self, source, name):
+        self._handle = None
+        return super().prefetch(source, name)
+
+    def unbundle(self, bundle, source):
+        self._handle = None
+        super().unbundle(bundle, source)
+
+    def checkout(self, revision, sparse=None, was_sparse=False):
+        super().checkout(revision, sparse, was_sparse)
+        self._handle = None
+
+    def _get_commit_impl(self, commit):
+        for rev in (commit, 'origin/{}'.format(commit)):
+            obj = self._lookup(rev)
+            if obj is not None:
+                return str(obj.id)
+        return super()._get_commit_impl(commit)
+
+    def is_tag(self, ref):
+        repo = self._repo()
+        if repo is None:
+            return super().is_tag(ref)
+        return 'refs/tags/{}'.format(ref) in repo.references
+
+    def has_commit(self, commit) -> bool:
+        repo = self._repo()
+        if repo is not None and full_hash.match(commit):
+            return commit in repo
+        if self._lookup(commit) is not None:
+            return True
+        return super().has_commit(commit)
+
+    def _commit_to_time_impl(self, hash):
+        commit = self._commit(hash)
+        if commit is None:
+            return super()._commit_to_time_impl(hash)
+        return str(commit.commit_time)
+
+    def is_ancestor(self, ancestor, current=None):
+        repo = self._repo()
+        a = self._commit(ancestor)
+        c = self._commit(current or 'HEAD')
+        if repo is None or a is None or c is None:
+            return super().is_ancestor(ancestor, current)
+        return a.id == c.id or repo.descendant_of(c.id, a.id)
+
+    def have_common_ancestor(self, commits):
+        repo = self._repo()
+        resolved = [self._commit(c) for c in commits]
+        if (repo is None or None in resolved or len(resolved) < 2
+                or not hasattr(repo, 'merge_base_octopus')):
+            return super().have_common_ancestor(commits)
+        return repo.merge_base_octopus([c.id for c in resolved]) is not None
+
+    def _tree_entry(self, revision, path):
+        """Returns (found, entry); found is False if libgit2 could not tell"""
+        commit = self._commit(revision)
+        if commit is None:
+            return False, None
+        try:
+            return True, commit.tree[path]
+        except KeyError:
+            return True, None
+
+    def tree_id(self, revision) -> Optional[str]:
+        commit = self._commit(revision)
+        if commit is None:
+            return super().tree_id(revision)
+        return str(commit.tree_id)
+
+    def manifest_id(self, revision) -> Optional[str]:
+        found, entry = self._tree_entry(revision, self.PKG_DEPENDENCY_FILE)
+        if not found:
+            return super().manifest_id(revision)
+        return None if entry is None else str(entry.id)
+
+    def _show_file(self, revision, path) -> Optional[str]:
+        found, entry = self._tree_entry(revision, path)
+        if not found:
+            return super()._show_file(revision, path)
+        if entry is None or not isinstance(entry, pygit2.Blob):
+            return None
+        return entry.data.decode('utf-8')
+
+    def _get_submodule_pointer(self, revision, path):
+        found, entry = self._tree_entry(revision, path)
+        if not found or entry is None:
+            return super()._get_submodule_pointer(revision, path)
+        return str(entry.id)
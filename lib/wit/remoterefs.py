@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional  # noqa: F401
+from .common import atomic_write_json, load_json
+from .env import remote_refs_ttl
+from .witlogger import getLogger
+
+log = getLogger()
+
+
+class RemoteRefCache:
+    """
+    The refs each remote advertises, from one 'git ls-remote' per remote, so that a branch
+    name can be checked against its remote without fetching.
+
+    Listings are shared by every package with the same source for the rest of the run, and
+    kept in .wit/remote-refs.json for ttl seconds ($WIT_REMOTE_REFS_TTL, default 0) for the
+    runs that follow. A listing older than that is never used, so with the default every run
+    asks each remote once.
+    """
+    FILE = "remote-refs.json"
+
+    def __init__(self, path: Path, ttl=0.0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None  # type: Optional[Dict[str, dict]]
+        # sources listed by this run, and a lock per source so each is listed once
+        self._fresh = set()  # type: set
+        self._source_locks = {}  # type: Dict[str, threading.Lock]
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = load_json(self.path)
+        return self._data
+
+    def refs(self, repo, source) -> Optional[Dict[str, str]]:
+        """The refs source advertises, listed through repo, or None if it cannot be listed"""
+        with self._lock:
+            lock = self._source_locks.setdefault(source, threading.Lock())
+        with lock:
+            with self._lock:
+                entry = self._load().get(source)
+                fresh = source in self._fresh
+            if entry is not None and (fresh or time.time() - entry['time'] < self.ttl):
+                return entry['refs']
+
+            refs = repo.ls_remote(source)
+            if refs is None:
+                return None
+            with self._lock:
+                data = self._load()
+                data[source] = {'time': round(time.time(), 3), 'refs': refs}
+                self._fresh.add(source)
+                self._save(data)
+            return refs
+
+    def _save(self, data):
+        try:
+            atomic_write_json(self.path, data)
+        except OSError as e:
+            log.debug("Unable to write remote refs [{}]: {}".format(self.path, e))
+
+    def lookup(self, repo, source, revision) -> Optional[str]:
+        """
+        The commit source advertises for revision, if revision is HEAD or one of its
+        branch or tag names.
+
+        >>> class Repo:
+        ...     def ls_remote(self, source):
+        ...         return {'HEAD': 'a1', 'refs/heads/main': 'a1', 'refs/tags/v1': 'b2'}
+        >>> cache = RemoteRefCache(Path('/nonexistent/remote-refs.json'))
+        >>> [cache.lookup(Repo(), 'src', rev) for rev in ['HEAD', 'main', 'v1', 'a1']]
+        ['a1', 'a1', 'b2', None]
+        """
+        refs = self.refs(repo, source)
+        if refs is None:
+            return None
+        names = ['HEAD'] if revision == 'HEAD' else \
+            ['refs/heads/{}'.format(revision), 'refs/tags/{}'.format(revision)]
+        for name in names:
+            if name in refs:
+                return refs[name]
+        return None
+
+
+_caches = {}  # type: Dict[Path, RemoteRefCache]
+_caches_lock = threading.Lock()
+
+
+def remote_refs(wsroot: Path) -> RemoteRefCache:
+    """The cache of the workspace at wsroot"""
+    with _caches_lock:
+        if wsroot not in _caches:
+            _caches[wsroot] = RemoteRefCache(wsroot / '.wit' / RemoteRefCache.FILE,
+                                             remote_refs_ttl)
+        return _caches[wsroot]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
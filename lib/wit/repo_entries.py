@@ -2,7 +2,8 @@ import json
 import sys
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple  # noqa: F401
+from .common import WitUserError
 
 
 # The intent of Format, RepoEntry and List[RepoEntry] is that no other
@@ -10,6 +11,17 @@ from typing import List
 # any of the field names.
 
 # Version numbers will be encoded in the format from '3' onwards.
+# Lockfiles without a version are version 2: a map from package name to entry. From version 3
+# on, lockfiles are {"version": N, "packages": <that map>}, and entries carry a Resolution.
+LOCK_VERSION_2 = 2
+LOCK_VERSION_3 = 3
+LOCK_VERSIONS = (LOCK_VERSION_2, LOCK_VERSION_3)
+
+
+class FormatError(WitUserError):
+    pass
+
+
 class Format(Enum):
     Lock = 1
     Manifest = 2
@@ -23,26 +35,75 @@ class Format(Enum):
         raise Exception("Unknown format for {}".format(str(path)))
 
 
+class Resolution:
+    """What resolution found out about a locked commit, so readers need not ask git again"""
+    __slots__ = ('time', 'tree', 'manifest', 'dependencies')
+
+    def __init__(self, time, tree, manifest, dependencies):
+        # Committer time in seconds since the epoch. JSON field name is 'time'
+        self.time = time
+
+        # Id of the commit's tree. JSON field name is 'tree'
+        self.tree = tree
+
+        # Id of the commit's wit-manifest.json blob, or None without one.
+        # JSON field name is 'manifest'
+        self.manifest = manifest
+
+        # The dependencies the commit declares, as List[RepoEntry].
+        # JSON field name is 'dependencies'
+        self.dependencies = dependencies
+
+    def __repr__(self):
+        return _slots_repr(self)
+
+
 class RepoEntry:
-    def __init__(self, checkout_path, revision, remote_url, message=None):
+    # Workspaces of thousands of packages hold an entry per dependency edge, so entries have no
+    # __dict__, and the strings that repeat across manifests are interned
+    __slots__ = ('checkout_path', 'revision', 'remote_url', 'message', 'sparse', 'materialized',
+                 'resolution')
+
+    def __init__(self, checkout_path, revision, remote_url, message=None, sparse=None,
+                 materialized=True, resolution=None):
         # The path to checkout at within the workspace.
         # JSON field name is 'name'.
-        self.checkout_path = checkout_path
+        self.checkout_path = _intern(checkout_path)
 
         # Desired revision that exists in the history of the below remote.
         # JSON field name is 'commit'
-        self.revision = revision
+        self.revision = _intern(revision)
 
         # Url (or local fs path) for git to clone/fetch/push.
         # JSON field name is 'source'
-        self.remote_url = remote_url
+        self.remote_url = _intern(remote_url)
 
         # A comment to leave in any serialized artifacts.
         # Optional. JSON field name is '//'
         self.message = message
 
+        # Directories to check out in cone-mode sparse checkout, or None for everything.
+        # Optional. JSON field name is 'sparse'
+        self.sparse = sparse
+
+        # Whether the package is checked out in the workspace, rather than only kept in .wit/.
+        # Lockfiles only. Optional, true when absent. JSON field name is 'materialized'
+        self.materialized = materialized
+
+        # What resolution found out about the commit, or None.
+        # Lockfiles from version 3 on only, see Resolution for its fields
+        self.resolution = resolution
+
     def __repr__(self):
-        return str(self.__dict__)
+        return _slots_repr(self)
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+def _slots_repr(obj):
+    return str(dict((name, getattr(obj, name)) for name in obj.__slots__))
 
 
 # OriginalEntry encodes the RepoEntry for both Lock and Manifest formats.
@@ -56,26 +117,51 @@ class OriginalEntry():
         }
         if entry.message:
             d["//"] = entry.message
+        if entry.sparse is not None:
+            d["sparse"] = entry.sparse
+        if not entry.materialized:
+            d["materialized"] = False
+        r = entry.resolution
+        if r is not None:
+            d["time"] = r.time
+            d["tree"] = r.tree
+            d["manifest"] = r.manifest
+            d["dependencies"] = [OriginalEntry.to_dict(e) for e in r.dependencies]
         return d
 
     @staticmethod
     def from_dict(data: dict) -> RepoEntry:
+        sparse = data.get("sparse")
+        if sparse is not None and not (isinstance(sparse, list)
+                                       and all(isinstance(p, str) for p in sparse)):
+            raise FormatError("'sparse' of '{}' must be a list of paths, not {}".format(
+                data["name"], json.dumps(sparse)))
+        resolution = None
+        if "dependencies" in data:
+            resolution = Resolution(data.get("time"), data.get("tree"), data.get("manifest"),
+                                    [OriginalEntry.from_dict(d) for d in data["dependencies"]])
         return RepoEntry(data["name"],
                          data["commit"],
                          data.get("source"),  # 'repo path' cli option needs this optional
-                         data.get("//"))  # optional
+                         data.get("//"),  # optional
+                         sparse,  # optional
+                         data.get("materialized", True),  # optional
+                         resolution)  # optional
 
 
 # Utilities for List[RepoEntry]
 class RepoEntries:
     @staticmethod
-    def write(path: Path, entries: List[RepoEntry]):
+    def write(path: Path, entries: List[RepoEntry], version=LOCK_VERSION_2):
+        """Write entries to path. version only applies to lockfiles."""
         fmt = Format.from_path(path)
         if fmt is Format.Manifest:
             manifest_data = [OriginalEntry.to_dict(e) for e in entries]
             json_data = json.dumps(manifest_data, sort_keys=True, indent=4) + "\n"
         if fmt is Format.Lock:
             lock_data = dict((e.checkout_path, OriginalEntry.to_dict(e)) for e in entries)
+            if version >= LOCK_VERSION_3:
+                lock_data = {"version": version, "packages": lock_data}
             json_data = json.dumps(lock_data, sort_keys=True, indent=4) + "\n"
         path.write_text(json_data)
 
@@ -87,28 +173,83 @@ class RepoEntries:
         # than the filesystem
         return RepoEntries.parse(text, path, "")
 
+    @staticmethod
+    def read_lock(path: Path) -> Tuple[int, List[RepoEntry]]:
+        """The version of the lockfile at path, and its entries"""
+        return RepoEntries._parse(path.read_text(), path, "")
+
+    @staticmethod
+    def lock_version(data) -> int:
+        """
+        >>> RepoEntries.lock_version({"foo": {"name": "foo", "commit": "a1", "source": "x"}})
+        2
+        >>> RepoEntries.lock_version({"version": 3, "packages": {}})
+        3
+        """
+        if isinstance(data, dict) and isinstance(data.get("version"), int):
+            return data["version"]
+        return LOCK_VERSION_2
+
+    @staticmethod
+    def duplicates(names) -> set:
+        """
+        The names that occur more than once, in one pass
+
+        >>> sorted(RepoEntries.duplicates(['a', 'b', 'a', 'c', 'b', 'a']))
+        ['a', 'b']
+        >>> RepoEntries.duplicates(['a', 'b'])
+        set()
+        """
+        seen = set()  # type: set
+        dup = set()  # type: set
+        for name in names:
+            if name in seen:
+                dup.add(name)
+            seen.add(name)
+        return dup
+
     @staticmethod
     def parse(text: str, path: Path, rev: str) -> List[RepoEntry]:
+        return RepoEntries._parse(text, path, rev)[1]
+
+    @staticmethod
+    def _from_dict(data: dict, path: Path, rev: str) -> RepoEntry:
+        try:
+            return OriginalEntry.from_dict(data)
+        except FormatError as e:
+            raise FormatError("{} in {}:{}".format(e, path, rev))
+
+    @staticmethod
+    def _parse(text: str, path: Path, rev: str) -> Tuple[int, List[RepoEntry]]:
         try:
             fromtext = json.loads(text)
         except json.JSONDecodeError as e:
-            print("Failed to parse json in {}:{}: {}".format(path, rev, e.msg))
-            sys.exit(1)
+            raise FormatError("Failed to parse json in {}:{}: {}".format(path, rev, e.msg))
 
         entries = []
+        version = LOCK_VERSION_2
         fmt = Format.from_path(path)
         if fmt is Format.Manifest:
             for entry in fromtext:
-                entries.append(OriginalEntry.from_dict(entry))
+                entries.append(RepoEntries._from_dict(entry, path, rev))
         if fmt is Format.Lock:
+            version = RepoEntries.lock_version(fromtext)
+            if version not in LOCK_VERSIONS:
+                raise FormatError("{} is lockfile version {}, which this wit cannot read".format(
+                    path, version))
+            if version >= LOCK_VERSION_3:
+                fromtext = fromtext["packages"]
             for _, entry in fromtext.items():
-                entries.append(OriginalEntry.from_dict(entry))
+                entries.append(RepoEntries._from_dict(entry, path, rev))
+
+        dup = RepoEntries.duplicates(entry.checkout_path for entry in entries)
+        if dup:
+            raise FormatError("Two repositories have same checkout path in {}:{}: {}".format(
+                path, rev, dup))
+
+        return version, entries
 
-        # Check for duplicates
-        names = [entry.checkout_path for entry in entries]
-        if len(names) != len(set(names)):
-            dup = set([x for x in names if names.count(x) > 1])
-            print("Two repositories have same checkout path in {}:{}: {}".format(path, rev, dup))
-            sys.exit(1)
 
-        return entries
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set  # noqa: F401
+from .backend import Backend
+from .common import atomic_write_json, load_json
+from .repo_entries import OriginalEntry
+from .witlogger import getLogger
+
+log = getLogger()
+
+FULL_HASH = re.compile(r'^[0-9a-f]{40}$')
+
+# Repository queries whose answers for full commit hashes can never change, with the number
+# of hashes they must be given (is_ancestor with one compares against HEAD) and how to keep
+# the answers in JSON. has_commit is not one of them: gc prunes commits that became
+# unreachable without replacing the repository, and a stale answer would skip their fetch.
+CACHED = {
+    'get_commit': (1, lambda v: v, lambda v: v),
+    'commit_to_time': (1, lambda v: v, lambda v: v),
+    'is_ancestor': (2, lambda v: v, lambda v: v),
+    'tree_id': (1, lambda v: v, lambda v: v),
+    'manifest_id': (1, lambda v: v, lambda v: v),
+    'repo_entries_from_commit': (1, lambda entries: [OriginalEntry.to_dict(e) for e in entries],
+                                 lambda data: [OriginalEntry.from_dict(d) for d in data]),
+}
+
+
+class ResolveCache:
+    """
+    What resolution learnt about full commit hashes: their commit times, trees, the
+    dependencies they declare and which are ancestors of which. None of that can
+    change, so it is kept in .wit/resolve-cache.json and a later resolve only asks git about
+    commits it has not seen, which after 'update-pkg' or 'update-dep' are the ones below the
+    changed dependency. Branch names and other movable revisions always go to git.
+
+    Facts are kept per package along with the inode of its repository, and dropped if the
+    repository is replaced. Only the facts used by the latest resolve are written back.
+    """
+    FILE = "resolve-cache.json"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None  # type: Optional[Dict[str, dict]]
+        self._used = {}  # type: Dict[str, Set[str]]
+        # what the file holds, to leave it alone when nothing changed
+        self._text = None  # type: Optional[str]
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = load_json(self.path)
+            self._text = _dumps(self._data)
+        return self._data
+
+    def _facts(self, repo) -> Optional[dict]:
+        try:
+            identity = os.stat(str(repo.path)).st_ino
+        except OSError:
+            return None
+        entry = self._load().get(repo.name)
+        if entry is None or entry['identity'] != identity:
+            entry = {'identity': identity, 'facts': {}}
+            self._data[repo.name] = entry  # type: ignore
+        return entry['facts']
+
+    def lookup(self, repo, method, args, compute):
+        """The answer to repo.method(*args), from the cache if args are all full hashes"""
+        arity, dump, load = CACHED[method]
+        if len(args) != arity or not all(isinstance(a, str) and FULL_HASH.match(a) for a in args):
+            return compute()
+        key = ' '.join([method, *args])
+        # compute() may ask the cache again, so it is never called with the lock held
+        with self._lock:
+            facts = self._facts(repo)
+            if facts is not None:
+                self._used.setdefault(repo.name, set()).add(key)
+                if key in facts:
+                    return load(facts[key])
+        value = compute()
+        if facts is None:
+            return value
+        with self._lock:
+            self._facts(repo)[key] = dump(value)  # type: ignore
+        return value
+
+    def seed(self, repo, revision, resolution):
+        """
+        Take what a version 3 lockfile recorded about revision as facts, so that the first
+        resolve of a restored workspace does not ask git about its locked commits again
+        """
+        if not (isinstance(revision, str) and FULL_HASH.match(revision)):
+            return
+        facts = {'get_commit': revision,
+                 'tree_id': resolution.tree, 'manifest_id': resolution.manifest,
+                 'repo_entries_from_commit': resolution.dependencies}
+        if resolution.time is not None:
+            facts['commit_to_time'] = str(resolution.time)
+        with self._lock:
+            known = self._facts(repo)
+            if known is None:
+                return
+            for method, value in facts.items():
+                key = ' '.join([method, revision])
+                known[key] = CACHED[method][1](value)
+                self._used.setdefault(repo.name, set()).add(key)
+
+    def save(self):
+        with self._lock:
+            data = self._load()
+            kept = {}
+            for name, keys in self._used.items():
+                if name in data:
+                    facts = data[name]['facts']
+                    kept[name] = {'identity': data[name]['identity'],
+                                  'facts': {k: facts[k] for k in sorted(keys) if k in facts}}
+            self._used = {}
+        if _dumps(kept) == self._text:
+            return
+        try:
+            self._text = atomic_write_json(self.path, kept, indent=None)
+        except OSError as e:
+            log.debug("Unable to write resolve cache [{}]: {}".format(self.path, e))
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, sort_keys=True) + "\n"
+
+
+class CachingBackend(Backend):
+    """Opens repositories whose queries about full commit hashes go through a ResolveCache"""
+
+    def __init__(self, backend: Backend, cache: ResolveCache):
+        self.backend = backend
+        self.cache = cache
+
+    def open(self, name, wsroot: Path):
+        repo = self.backend.open(name, wsroot)
+        # a backend may hand out the same object again, see daemon.SnapshotBackend
+        if not hasattr(repo, 'resolve_cache'):
+            for method in CACHED:
+                setattr(repo, method, _cached(repo, method, getattr(repo, method)))
+        setattr(repo, 'resolve_cache', self.cache)
+        return repo
+
+    def is_repo(self, path) -> bool:
+        return self.backend.is_repo(path)
+
+    def size_hint(self, name, wsroot: Path, source):
+        return self.backend.size_hint(name, wsroot, source)
+
+
+def _cached(repo, method, fn):
+    def cached(*args, **kwargs):
+        if kwargs:
+            return fn(*args, **kwargs)
+        return repo.resolve_cache.lookup(repo, method, args, lambda: fn(*args))
+    return cached
+
+
+_caches = {}  # type: Dict[Path, ResolveCache]
+_caches_lock = threading.Lock()
+
+
+def resolve_cache(wsroot: Path) -> ResolveCache:
+    """The cache of the workspace at wsroot"""
+    with _caches_lock:
+        if wsroot not in _caches:
+            _caches[wsroot] = ResolveCache(wsroot / '.wit' / ResolveCache.FILE)
+        return _caches[wsroot]
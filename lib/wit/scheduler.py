@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+from typing import List, Optional, Set  # noqa: F401
+from .common import WitUserError
+from .profile import profiler
+from .witlogger import getLogger
+
+log = getLogger()
+
+# parallel git jobs to start with before adapting to observed throughput
+_initial_jobs = 4
+
+
+class JobCancelled(Exception):
+    """Raised inside a job whose scope was cancelled before or while it ran"""
+    pass
+
+
+class CancelScope:
+    """
+    Tracks the git child processes started on behalf of a group of parallel jobs
+    so that they can all be stopped at once.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._procs = set()  # type: Set
+
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            log.debug("Terminating [{}]".format(' '.join(proc.args)))
+            _terminate(proc)
+
+    def register(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+        # the scope may have been cancelled between starting proc and registering it
+        if self.cancelled():
+            _terminate(proc)
+
+    def unregister(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+
+def _terminate(proc):
+    try:
+        proc.terminate()
+    except OSError:
+        # already exited
+        pass
+
+
+_local = threading.local()
+
+
+def current_scope() -> Optional[CancelScope]:
+    """The CancelScope of the job running on this thread, if any"""
+    return getattr(_local, 'scope', None)
+
+
+class AdaptiveLimit:
+    """
+    Additive-increase/multiplicative-decrease controller for the number of jobs in flight.
+
+    The limit starts small and doubles after every round of successful jobs (a round is as
+    many completions as the current limit) until the first sign of congestion, then grows by
+    one per round. It is halved when a job fails for reasons other than user error, shrinks
+    by one when the last increase made throughput worse, and does not grow while the CPUs
+    are saturated. It never exceeds 'maximum', which is the -j option.
+    """
+
+    def __init__(self, maximum=None, initial=_initial_jobs):
+        self.maximum = maximum or sys.maxsize
+        self.current = max(1, min(initial, self.maximum))
+        self._threshold = self.maximum
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._completed = 0
+        self._round_start = time.monotonic()
+        self._last_throughput = None  # type: Optional[float]
+        self._grew = False
+        log.debug("Starting with {} parallel git jobs (max {})".format(
+            self.current, maximum or "unbounded"))
+
+    def acquire(self, scope: CancelScope) -> bool:
+        """Wait for a free slot. Returns False if the scope was cancelled meanwhile."""
+        with self._cond:
+            while self._in_flight >= self.current:
+                if scope.cancelled():
+                    return False
+                self._cond.wait(0.1)
+            if scope.cancelled():
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, ok: Optional[bool]):
+        """Free a slot. ok is None when the job says nothing about the remote's capacity."""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+            if ok is True:
+                self._on_success()
+            elif ok is False:
+                self._on_congestion()
+
+    def _on_success(self):
+        self._completed += 1
+        if self._completed < self.current:
+            return
+        now = time.monotonic()
+        throughput = self._completed / max(now - self._round_start, 1e-6)
+        self._completed = 0
+        self._round_start = now
+
+        if (self._grew and self._last_throughput is not None
+                and throughput < self._last_throughput * 0.9):
+            # more jobs got less done, the remote or the disk is saturated
+            self._threshold = self.current - 1
+            self._set(self.current - 1, "throughput dropped")
+        elif _cpu_saturated():
+            self._grew = False
+        elif self.current < self._threshold:
+            self._set(min(self.current * 2, self._threshold), "slow start")
+        else:
+            self._set(self.current + 1, "probing")
+        self._last_throughput = throughput
+
+    def _on_congestion(self):
+        self._threshold = max(1, self.current // 2)
+        self._completed = 0
+        self._round_start = time.monotonic()
+        self._set(self._threshold, "git job failed")
+
+    def _set(self, limit, reason):
+        limit = max(1, min(limit, self.maximum))
+        self._grew = limit > self.current
+        if limit != self.current:
+            log.verbose("Parallel git jobs: {} -> {} ({})".format(self.current, limit, reason))
+            self.current = limit
+            self._cond.notify_all()
+
+
+def _cpu_saturated() -> bool:
+    try:
+        return os.getloadavg()[0] >= (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        # getloadavg is not available on every platform
+        return False
+
+
+def run_parallel(fn, items, limit: AdaptiveLimit, fail_fast=False, costs=None):
+    """
+    Call fn on every item, keeping at most limit.current calls in flight, and return the
+    exceptions raised in the order of the items that raised them.
+
+    If costs (estimated durations, one per item) are given, the most expensive items are
+    started first. This longest-processing-time-first order keeps a big job that happens to
+    come last from running alone at the end.
+
+    With fail_fast, the first exception cancels the remaining work: jobs that have not
+    started are skipped and the git processes of running jobs are terminated.
+    """
+    items = list(items)
+    scope = CancelScope()
+    results = [None] * len(items)  # type: List[Optional[Exception]]
+    order = list(range(len(items)))
+    if costs is not None:
+        order.sort(key=lambda i: -costs[i])
+    next_index = iter(order)
+    index_lock = threading.Lock()
+
+    operations = profiler.current_stack()
+
+    def do(index) -> Optional[bool]:
+        _local.scope = scope
+        try:
+            with profiler.inherit(operations):
+                fn(items[index])
+        except Exception as e:
+            if isinstance(e, JobCancelled) and scope.cancelled():
+                return None
+            results[index] = e
+            if fail_fast and not scope.cancelled():
+                log.debug("Cancelling outstanding jobs after error: {}".format(e))
+                scope.cancel()
+            # a bad source or revision is the user's problem, not the remote's
+            return None if isinstance(e, WitUserError) else False
+        finally:
+            _local.scope = None
+        return True
+
+    def worker():
+        while limit.acquire(scope):
+            with index_lock:
+                index = next(next_index, None)
+            if index is None:
+                limit.release(None)
+                return
+            limit.release(do(index))
+
+    # workers of a background thread are named after it, see daemon.captured_output
+    parent = threading.current_thread()
+    prefix = '' if parent is threading.main_thread() else parent.name + '/'
+    threads = [threading.Thread(target=worker, name="{}wit-worker-{}".format(prefix, n))
+               for n in range(min(limit.maximum, len(items)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return [e for e in results if e is not None]
@@ -1,2 +1,29 @@
 # This is the version reported by 'wit --version' when running outside a git repository
 __version__ = "0.14.dev0"
+
+
+def get_version():
+    """
+    The version written to _version.py when wit was installed (or by 'make version'),
+    else 'git describe' of the source checkout wit runs from, else __version__
+    """
+    try:
+        from ._version import version  # type: ignore
+        return version
+    except ImportError:
+        pass
+    return get_git_version() or __version__
+
+
+def get_git_version():
+    # not an official release, use git to get an explicit version
+    import os
+    import re
+    import subprocess
+    path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    if not os.path.exists(os.path.join(path, '.git')):
+        return None
+    proc = subprocess.run(['git', '-C', path, 'describe', '--tags', '--dirty'],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    version = proc.stdout.decode('utf-8').rstrip()
+    return re.sub(r"^v", "", version)
@@ -1,17 +1,27 @@
 #!/usr/bin/env python3
 
-import sys
+import os
 import shutil
-import threading
-import queue
+import time
+from collections import OrderedDict, namedtuple
 from pathlib import Path
-from pprint import pformat
+from typing import Dict, List, Set  # noqa: F401
+from .bundle import BundleIndex
 from .manifest import Manifest
 from .dependency import Dependency, sources_conflict_check
 from .lock import LockFile
-from .common import WitUserError, error
+from .backend import get_backend, set_backend
+from .env import use_resolve_cache
+from .offline import NotAvailableOffline
+from .package import Package
+from .prefetch import PrefetchLog
+from .resolvecache import CachingBackend, resolve_cache
+from .common import WitUserError
 from .witlogger import getLogger
 from .gitrepo import GitCommitNotFound
+from .history import history
+from .profile import profiler
+from .scheduler import AdaptiveLimit, run_parallel
 
 log = getLogger()
 
@@ -58,16 +68,33 @@ class PackageNotInWorkspaceError(WitUserError):
     pass
 
 
+# What WorkSpace.status found: the locked packages checked out at their locked commit with no
+# changes, the (package, ["new commits", "modified content", "untracked content"]) that are
+# not, the paths of git repositories in the workspace that are not locked, and the locked
+# packages that are missing or that 'wit update --only' left in .wit/
+WorkspaceStatus = namedtuple('WorkspaceStatus', ['clean', 'dirty', 'untracked', 'missing',
+                                                 'staged'])
+
+
+# A dependency popped after its package already had a winner, which must be an ancestor of the
+# winner's revision. epoch is the number of winners whose dependencies had been queued by then.
+AncestryCheck = namedtuple('AncestryCheck', ['package', 'matching', 'dep', 'epoch'])
+
+
 class WorkSpace:
     MANIFEST = "wit-workspace.json"
     LOCK = "wit-lock.json"
 
-    def __init__(self, root, repo_paths, jobs=None):
+    def __init__(self, root, repo_paths, jobs=None, fail_fast=False):
         self.root = root
         self.repo_paths = repo_paths
         self.manifest = self._load_manifest()
         self.lock = self._load_lockfile()
         self.jobs = jobs
+        # Shared by every parallel clone of this run so that it adapts across calls
+        self.clone_limit = AdaptiveLimit(jobs)
+        # Stop at the first resolution error instead of finishing outstanding clones
+        self.fail_fast = fail_fast
 
     def id(self):
         return "[root]"
@@ -76,7 +103,7 @@ class WorkSpace:
         return "root"
 
     @classmethod
-    def create(cls, name, repo_paths, jobs):
+    def create(cls, name, repo_paths, jobs, fail_fast=False):
         """Create a wit workspace on disk with the appropriate json files"""
         root = Path.cwd() / name
         manifest_path = cls._manifest_path(root)
@@ -84,15 +111,13 @@ class WorkSpace:
             log.info("Using existing directory [{}]".format(str(root)))
 
             if manifest_path.exists():
-                log.error("Manifest file [{}] already exists.".format(manifest_path))
-                sys.exit(1)
+                raise WitUserError("Manifest file [{}] already exists.".format(manifest_path))
         else:
             log.info("Creating new workspace [{}]".format(str(root)))
             try:
                 root.mkdir()
             except Exception as e:
-                log.error("Unable to create workspace [{}]: {}".format(str(root), e))
-                sys.exit(1)
+                raise WitUserError("Unable to create workspace [{}]: {}".format(str(root), e))
 
         dotwit = root/'.wit'
         if dotwit.exists():
@@ -104,38 +129,38 @@ class WorkSpace:
         manifest = Manifest([])
         manifest.write(manifest_path)
 
-        lockfile = LockFile([])
+        lockfile = LockFile([], LockFile.version_to_write())
         lockfile.write(cls._lockfile_path(root))
 
-        return WorkSpace(root, repo_paths, jobs)
+        return WorkSpace(root, repo_paths, jobs, fail_fast)
 
     @classmethod
-    def restore(cls, root):
+    def restore(cls, root, jobs=None, fail_fast=False, bundles=None):
         # constructing WorkSpace will parse the lock file
-        ws = WorkSpace(root, [])
-
-        def do_clone(pkg, root, errors):
-            try:
-                pkg.load(root, True)
+        ws = WorkSpace(root, [], jobs, fail_fast)
+        index = BundleIndex.read(bundles) if bundles is not None else None
+        cache = resolve_cache(root) if use_resolve_cache else None
+
+        def do_clone(pkg):
+            bundle = index.lookup(pkg.name) if index is not None else None
+            if bundle is not None:
+                pkg.unbundle(root, bundle)
+            # only fetches if the bundle lacked the locked commit
+            pkg.load(root, True)
+            if pkg.materialized:
                 pkg.checkout(root)
-            except Exception as e:
-                errors.put(e)
-
-        errors = queue.Queue()
-        threads = list()
-        for pkg in ws.lock.packages:
-            t = threading.Thread(target=do_clone, args=(pkg, root, errors))
-            threads.append(t)
-            t.start()
-
-        for t in threads:
-            t.join()
-
-        if not errors.empty():
-            while not errors.empty():
-                e = errors.get()
-                log.error("Unable to create workspace [{}]: {}".format(str(root), e))
-            sys.exit(1)
+            # a version 3 lockfile already says what resolution would ask git about the commit
+            if cache is not None and pkg.resolution is not None and pkg.repo is not None:
+                cache.seed(pkg.repo, pkg.revision, pkg.resolution)
+
+        costs = history.estimate([pkg.transfer_job(root, pkg.source) for pkg in ws.lock.packages])
+        errors = run_parallel(do_clone, ws.lock.packages, ws.clone_limit, fail_fast, costs)
+        history.save()
+        if cache is not None:
+            cache.save()
+        if errors:
+            raise WitUserError("\n".join("Unable to create workspace [{}]: {}".format(str(root), e)
+                                         for e in errors))
 
         return ws
 
@@ -160,23 +185,59 @@ class WorkSpace:
         return WorkSpace._lockfile_path(self.root)
 
     @staticmethod
-    def find(start, repo_paths, jobs):
+    def find(start, repo_paths, jobs, fail_fast=False):
+        return WorkSpace(WorkSpace.find_root(start), repo_paths, jobs, fail_fast)
+
+    @staticmethod
+    def find_root(start) -> Path:
+        """The root of the workspace start is in"""
         cwd = start.resolve()
         for p in ([cwd] + list(cwd.parents)):
             manifest_path = WorkSpace._manifest_path(p)
             log.debug("Checking [{}]".format(manifest_path))
             if Path(manifest_path).is_file():
                 log.debug("Found workspace at [{}]".format(p))
-                return WorkSpace(p, repo_paths, jobs)
+                return p
 
         raise FileNotFoundError("Couldn't find workspace file")
 
+    @profiler.operation('resolve')
     def resolve(self, download=False):
-        source_map, packages, queue = \
-            self.resolve_deps(self.root, self.repo_paths, download, {}, {}, [])
+        packages, errors = self.resolve_graph(download)
+        self.warn_local_changes(packages)
+        return packages, errors
 
-        errors = list()
-        dep_errors = list()
+    def resolve_graph(self, download=False):
+        """The packages the manifest resolves to, by name, and any resolution errors"""
+        try:
+            if not use_resolve_cache or not (self.root / '.wit').is_dir():
+                return self._resolve_graph(download)
+            cache = resolve_cache(self.root)
+            backend = get_backend()
+            set_backend(CachingBackend(backend, cache))
+            try:
+                return self._resolve_graph(download)
+            finally:
+                set_backend(backend)
+                cache.save()
+        finally:
+            if download:
+                history.save()
+
+    def _resolve_graph(self, download):
+        source_map, packages, queue, errors = \
+            self.resolve_deps(self.root, self.repo_paths, download, {}, {}, [])
+        if errors:
+            return {}, errors
+
+        # Whether a dependency is an ancestor of its package's winner cannot change what else
+        # gets resolved, so the checks are collected and run together in parallel, at the end
+        # or, when downloading, before the next winner can start a clone. The errors returned
+        # are the ones checking each in turn would have stopped on, see _ancestry_result.
+        checks = []  # type: List[AncestryCheck]
+        failures = []  # type: List[AncestryCheck]
+        dep_errors = []  # type: List[Exception]
+        winners = 0
         while queue:
             commit_time, dep = queue.pop()
             log.debug("{} {}".format(commit_time, dep))
@@ -184,21 +245,76 @@ class WorkSpace:
             name = dep.package.name
             if name in packages and packages[name].revision is not None:
                 package = packages[name]
-                if not package.repo.is_ancestor(dep.specified_revision, package.revision):
-                    errors.append(NotAncestorError(package.find_matching_dependent(), dep))
+                checks.append(AncestryCheck(package, package.find_matching_dependent(), dep,
+                                            winners))
                 continue
 
+            if download:
+                failures += self._failed_ancestry_checks(checks)
+                checks = []
+                if failures and self.fail_fast:
+                    break
+
             packages[dep.name] = dep.package
             packages[dep.name].revision = dep.resolved_rev()
             packages[dep.name].set_source(dep.source)
 
             source_map, packages, queue, dep_errors = \
                 dep.resolve_deps(self.root, self.repo_paths, download, source_map,
-                                 packages, queue, self.jobs)
-
-            if len(errors + dep_errors) > 0:
-                return {}, errors + dep_errors
-
+                                 packages, queue, self.clone_limit, self.fail_fast)
+            winners += 1
+
+            if failures or dep_errors:
+                break
+
+        failures += self._failed_ancestry_checks(checks)
+        return self._ancestry_result(packages, failures, dep_errors, winners)
+
+    def _failed_ancestry_checks(self, checks) -> List[AncestryCheck]:
+        """The checks whose dependency is not an ancestor of its package's winner, in order"""
+        # many dependents pin the same commit, which needs no check, or the same few commits
+        pending = OrderedDict()  # type: OrderedDict
+        for check in checks:
+            if check.dep.specified_revision != check.package.revision:
+                key = (check.package.name, check.dep.specified_revision)
+                pending[key] = (check.package, check.dep.specified_revision)
+        results = {}
+
+        def do(key):
+            package, revision = pending[key]
+            results[key] = package.repo.is_ancestor(revision, package.revision)
+
+        # local and mostly waiting on git, so one per CPU rather than the adaptive clone limit
+        cpus = os.cpu_count() or 1
+        errors = run_parallel(do, pending, AdaptiveLimit(cpus, initial=cpus))
+        if errors:
+            raise errors[0]
+        return [c for c in checks
+                if not results.get((c.package.name, c.dep.specified_revision), True)]
+
+    def _ancestry_result(self, packages, failures, dep_errors, winners):
+        """
+        What resolution returns given the failed ancestry checks. Checked one at a time, the
+        first failure is the only error with fail_fast. Otherwise the next winner's
+        dependencies are still queued, and resolution stops with the failures of the checks
+        made before that winner, plus its dependency errors. Failures after the last winner
+        are returned along with the packages.
+        """
+        if not failures:
+            return ({}, dep_errors) if dep_errors else (packages, [])
+        errors = [NotAncestorError(c.matching, c.dep) for c in failures]  # type: List[Exception]
+        if self.fail_fast:
+            return {}, errors[:1]
+        epoch = failures[0].epoch
+        errors = errors[:len([c for c in failures if c.epoch == epoch])]
+        if epoch == winners:
+            return packages, errors
+        if epoch + 1 == winners:
+            errors += dep_errors
+        return {}, errors
+
+    def warn_local_changes(self, packages):
+        """Point out checked out packages whose manifest is not the one that was resolved"""
         for pkg in packages.values():
             if not pkg.repo or pkg.repo.path.parts[-2] == '.wit':
                 continue
@@ -213,13 +329,17 @@ class WorkSpace:
             if pkg.repo.modified_manifest():
                 log.warn("disregarding uncommitted changes to the '{}' manifest".format(pkg.name))
 
-        return packages, errors + dep_errors
-
     def resolve_deps(self, wsroot, repo_paths, download, source_map, packages, queue):
         source_map = source_map.copy()
         queue = queue.copy()
+        errors = []  # type: List[Exception]
         for dep in self.manifest.dependencies:
-            dep.load(packages, repo_paths, wsroot, download)
+            try:
+                dep.load(packages, repo_paths, wsroot, download)
+            except NotAvailableOffline as e:
+                # report everything that is missing, not just the first
+                errors.append(e)
+                continue
 
             sources_conflict_check(dep, source_map)
 
@@ -230,27 +350,172 @@ class WorkSpace:
 
         queue.sort(key=lambda tup: tup[0])
 
-        return source_map, packages, queue
+        return source_map, packages, queue, errors
+
+    @profiler.operation('bundle')
+    def bundle(self, directory: Path):
+        """
+        Write a git bundle of each locked package's commit, and everything it reaches, to
+        directory along with a BundleIndex, for 'wit restore --from-bundles'.
+        Returns the names of the packages bundled and the errors.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        index = BundleIndex(directory)
+
+        def do_bundle(pkg):
+            pkg.load(self.root, False)
+            if pkg.repo is None:
+                raise PackageNotInWorkspaceError(
+                    "'{}' does not have its locked commit '{}' on disk. Run 'wit update' first."
+                    "".format(pkg.name, pkg.revision))
+            pkg.repo.bundle(index.bundle_path(pkg.name), pkg.revision)
+            index.add(pkg.name, pkg.source, pkg.revision)
+            log.verbose("Bundled {}".format(pkg.name))
+
+        errors = run_parallel(do_bundle, self.lock.packages, self.clone_limit, self.fail_fast)
+        index.write()
+        return sorted(index.entries), errors
+
+    @profiler.operation('prefetch')
+    def prefetch(self, max_age=None, backend=None):
+        """
+        Fetch the remote of every package already on disk, in the workspace or in .wit/,
+        into refs/wit-prefetch/ so that a later update finds the commits it needs locally.
+        Packages prefetched less than max_age seconds ago are skipped. Repositories are
+        opened through backend, by default the one in use.
+        Returns the names of the packages prefetched and the errors.
+        """
+        backend = backend or get_backend()
+        prefetched = PrefetchLog(self.root / '.wit' / PrefetchLog.FILE)
+        sources = OrderedDict()  # type: Dict[str, str]
+        for pkg in self.lock.packages:
+            sources.setdefault(pkg.name, pkg.source)
+        for dep in self.manifest.dependencies:
+            sources.setdefault(dep.name, dep.source)
 
-    def checkout(self, packages):
+        jobs = []
+        seen = set()  # type: Set[str]
+        now = time.time()
+        for repo_root in (self.root, self.root / '.wit'):
+            if not repo_root.is_dir():
+                continue
+            for path in sorted(repo_root.iterdir()):
+                name = path.name
+                # in the workspace itself, only what the lockfile or manifest names is a package
+                if (name in seen or not path.is_dir()
+                        or (repo_root == self.root and name not in sources)):
+                    continue
+                seen.add(name)
+                last = prefetched.last(name)
+                if max_age is not None and last is not None and now - last < max_age:
+                    log.verbose("Skipping {}, prefetched {:.0f}s ago".format(name, now - last))
+                    continue
+                repo = backend.open(name, repo_root)
+                source = Package(name, self.repo_paths).resolve_source(
+                    sources.get(name) or repo.get_remote())
+                jobs.append((name, repo, source))
+
+        def do_prefetch(job):
+            name, repo, source = job
+            transfer = repo.prefetch(source, name)
+            if transfer is not None:
+                history.record(source, transfer.kind, transfer.seconds, transfer.size)
+            prefetched.record(name, source, time.time())
+            log.verbose("Prefetched {}".format(name))
+
+        costs = history.estimate([(source, 'fetch', None) for _, _, source in jobs])
+        errors = run_parallel(do_prefetch, jobs, self.clone_limit, self.fail_fast, costs)
+        history.save()
+        return [name for name, _, _ in jobs], errors
+
+    def status(self) -> 'WorkspaceStatus':
+        """Compare the locked packages with what is checked out, see WorkspaceStatus"""
+        from .gitrepo import GitRepo
+        st = WorkspaceStatus([], [], [], [], [])
+        seen_paths = {}
+        for package in self.lock.packages:
+            if not package.materialized:
+                st.staged.append(package)
+                continue
+            package.load(self.root, False)
+            if package.repo is None:
+                st.missing.append(package)
+                continue
+            seen_paths[package.repo.path] = True
+
+            lock_commit = package.revision
+            latest_commit = package.repo.get_head_commit()
+
+            new_commits = lock_commit != latest_commit
+
+            if new_commits or not package.repo.clean():
+                status = []
+                if new_commits:
+                    status.append("new commits")
+                if package.repo.modified():
+                    status.append("modified content")
+                if package.repo.untracked():
+                    status.append("untracked content")
+                st.dirty.append((package, status))
+            else:
+                st.clean.append(package)
+
+        for path in self.root.iterdir():
+            if path not in seen_paths and path.is_dir() and GitRepo.is_git_repo(path):
+                st.untracked.append(path)
+            seen_paths[path] = True
+        return st
+
+    @profiler.operation('checkout')
+    def checkout(self, packages, only=None):
+        """
+        Check out the resolved packages and write the lockfile. With only, a list of package
+        names, packages outside their dependency closure that are not checked out already
+        stay in .wit/ and are locked as not materialized.
+        """
+        wanted = self.closure(packages, only) if only else None
         lock_packages = []
         for name in packages:
             package = packages[name]
-            package.checkout(self.root)
+            if wanted is None or name in wanted or (self.root / name).exists():
+                locked = self.lock.get_package(name)
+                package.checkout(self.root, locked is not None and locked.sparse is not None)
+                package.materialized = True
+            else:
+                log.verbose("Leaving '{}' in .wit/".format(name))
+                package.materialized = False
             lock_packages.append(package)
 
-        new_lock = LockFile(lock_packages)
+        new_lock = LockFile(lock_packages, LockFile.version_to_write(self.lock))
         new_lock_path = WorkSpace._lockfile_path(self.root)
         new_lock.write(new_lock_path)
         self.lock = new_lock
 
+    @staticmethod
+    def closure(packages, names) -> Set[str]:
+        """The names of the named resolved packages and of all they depend on, transitively"""
+        unknown = [name for name in names if name not in packages]
+        if unknown:
+            raise PackageNotInWorkspaceError(
+                "Not resolved in this workspace: {}".format(", ".join(unknown)))
+        closure = set()  # type: Set[str]
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name in closure:
+                continue
+            closure.add(name)
+            todo.extend(dep.name for dep in packages[name].get_dependencies()
+                        if dep.name in packages)
+        return closure
+
     def add_dependency(self, tag) -> None:
         """ Resolve a dependency then add it to the wit-workspace.json """
         from .main import dependency_from_tag
         dep = dependency_from_tag(self.root, tag)
 
         if self.manifest.contains_dependency(dep.name):
-            error("Manifest already contains package {}".format(dep.name))
+            raise WitUserError("Manifest already contains package {}".format(dep.name))
 
         packages = {pkg.name: pkg for pkg in self.lock.packages}
         dep.load(packages, self.repo_paths, self.root, True)
@@ -278,9 +543,9 @@ class WorkSpace:
 
         # check if the package is missing from the wit-workspace.json
         if manifest_dep is None:
-            log.error("Package {} not in wit-workspace.json".format(req_dep.name))
-            log.error("Did you mean to run 'wit add-pkg' or 'wit update-dep'?")
-            sys.exit(1)
+            raise PackageNotInWorkspaceError(
+                "Package {} not in wit-workspace.json\n"
+                "Did you mean to run 'wit add-pkg' or 'wit update-dep'?".format(req_dep.name))
 
         # load their Package
         packages = {pkg.name: pkg for pkg in self.lock.packages}
@@ -320,6 +585,7 @@ class WorkSpace:
 
     # Enable prettyish-printing of the class
     def __repr__(self):
+        from pprint import pformat
         return pformat(vars(self), indent=4, width=1)
 
 
@@ -0,0 +1,94 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+into_test_dir
+
+# commit at a fixed time so that resolution pops dependencies in a known order
+commit_at() {
+    GIT_COMMITTER_DATE="@$2 +0000" git -C $1 commit -m "$1 at $2"
+}
+
+# xyz and abc each have two branches, neither an ancestor of the other
+for repo in xyz abc; do
+    mkdir $repo
+    git -C $repo init
+    touch $repo/zero
+    git -C $repo add -A
+    commit_at $repo 100
+    git -C $repo checkout -b branch_a
+    touch $repo/a
+    git -C $repo add -A
+    commit_at $repo 200
+    git -C $repo checkout master
+    git -C $repo checkout -b branch_b
+    touch $repo/b
+    git -C $repo add -A
+    commit_at $repo 300
+done
+xyz_a=$(git -C xyz rev-parse branch_a)
+xyz_b=$(git -C xyz rev-parse branch_b)
+abc_a=$(git -C abc rev-parse branch_a)
+abc_b=$(git -C abc rev-parse branch_b)
+
+# old is resolved after both conflicts were found
+mkdir old
+git -C old init
+touch old/file
+git -C old add -A
+commit_at old 150
+old_commit=$(git -C old rev-parse HEAD)
+
+mkdir foo
+git -C foo init
+cat << EOF | jq . > foo/wit-manifest.json
+[
+    { "commit": "$xyz_b", "name": "xyz", "source": "$PWD/xyz" },
+    { "commit": "$abc_b", "name": "abc", "source": "$PWD/abc" }
+]
+EOF
+git -C foo add -A
+commit_at foo 400
+foo_commit=$(git -C foo rev-parse HEAD)
+
+mkdir bar
+git -C bar init
+cat << EOF | jq . > bar/wit-manifest.json
+[
+    { "commit": "$xyz_a", "name": "xyz", "source": "$PWD/xyz" },
+    { "commit": "$abc_a", "name": "abc", "source": "$PWD/abc" },
+    { "commit": "$old_commit", "name": "old", "source": "$PWD/old" },
+    { "commit": "$foo_commit", "name": "foo", "source": "$PWD/foo" }
+]
+EOF
+git -C bar add -A
+commit_at bar 500
+
+prereq off
+
+# fails with the errors below, but leaves a workspace
+wit --no-fail-fast init myws -a $PWD/bar
+cd myws
+
+wit --no-fail-fast update > update1.out
+check "wit update should fail" [ $? -ne 0 ]
+check "wit update should report both ancestry errors" [ $(grep -c "Ancestry error" update1.out) -eq 2 ]
+
+wit --no-fail-fast update > update2.out
+cmp -s update1.out update2.out
+check "ancestry errors should be reported in the same order every time" [ $? -eq 0 ]
+
+wit --no-fail-fast status > status.out
+grep "Ancestry error" -A3 status.out > status.errors
+grep "Ancestry error" -A3 update1.out > update.errors
+cmp -s status.errors update.errors
+check "wit status should report the errors of wit update" [ $? -eq 0 ]
+
+wit --fail-fast update > fail_fast.out
+check "wit update --fail-fast should fail" [ $? -ne 0 ]
+check "wit update --fail-fast should report one ancestry error" [ $(grep -c "Ancestry error" fail_fast.out) -eq 1 ]
+
+report
+finish
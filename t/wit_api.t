@@ -0,0 +1,74 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'lib'
+lib_commit=$(git -C lib rev-parse HEAD)
+make_repo 'app'
+cat > app/wit-manifest.json << EOT
+[{"name": "lib", "source": "$PWD/lib", "commit": "$lib_commit"}]
+EOT
+git -C app add -A
+git -C app commit -m "depend on lib"
+
+wit init myws -a $PWD/app
+cd myws
+
+prereq off
+
+api() {
+    PYTHONPATH="$wit_root/lib" python3 -c "import sys
+from wit.api import Workspace
+from wit.common import WitUserError
+$1" > api_out 2>&1
+}
+
+api "ws = Workspace.open('app')
+print(' '.join(sorted(p.name for p in ws.lock())))
+st = ws.status()
+print('clean', ' '.join(sorted(st.clean)))
+print('nodes', len(ws.graph().nodes))
+print('resolved', len(ws.resolve().packages))"
+check "the API should run" [ $? -eq 0 ]
+grep -qx "app lib" api_out
+check "lock() should list the locked packages" [ $? -eq 0 ]
+grep -qx "clean app lib" api_out
+check "status() should find both packages clean" [ $? -eq 0 ]
+grep -qx "nodes 3" api_out
+check "graph() should have root and both packages" [ $? -eq 0 ]
+grep -qx "resolved 2" api_out
+check "resolve() should resolve both packages" [ $? -eq 0 ]
+
+api "ws = Workspace.open('.')
+print(ws.status().dirty)
+with open('lib/file', 'w') as f:
+    f.write('changed')
+print(ws.status().dirty)
+import subprocess
+subprocess.check_call(['git', '-C', 'lib', 'commit', '-qam', 'change'])
+print(ws.status().dirty)"
+grep -qx "{}" api_out && grep -qx "{'lib': \['modified content'\]}" api_out
+check "a loaded workspace should see changes between calls" [ $? -eq 0 ]
+grep -qx "{'lib': \['new commits'\]}" api_out
+check "a loaded workspace should reload when a package gets new commits" [ $? -eq 0 ]
+git -C lib reset -q --hard HEAD~1
+
+api "try:
+    Workspace.open('/')
+except WitUserError:
+    print('raised')"
+check "opening outside a workspace should raise" [ "$(cat api_out)" = "raised" ]
+
+cp wit-lock.json lock.bak
+echo "{" > wit-lock.json
+api "try:
+    Workspace.open('.').lock()
+except WitUserError:
+    print('raised')"
+check "a corrupt lockfile should raise rather than exit" [ "$(cat api_out)" = "raised" ]
+mv lock.bak wit-lock.json
+
+report
+finish
@@ -0,0 +1,43 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+make_repo 'bar'
+wit init myws -a $PWD/foo -a $PWD/bar
+
+prereq off
+
+cd myws
+wit bundle create ../bundles > out 2>&1
+check "wit bundle create should succeed" [ $? -eq 0 ]
+check "foo should be bundled" [ -f ../bundles/foo.bundle ]
+check "bar should be bundled" [ -f ../bundles/bar.bundle ]
+foo_commit=$(jq -r '.foo.commit' ../bundles/wit-bundles.json)
+foo_locked=$(jq -r '.foo.commit' wit-lock.json)
+check "the index should record the locked commit" [ "$foo_commit" = "$foo_locked" ]
+cd ..
+
+# foo's remote is out of reach, bar moves past its bundle
+mv foo foo.away
+echo "new" > bar/file
+git -C bar commit -q -am "commit2"
+bar_new=$(git -C bar rev-parse HEAD)
+jq ".bar.commit = \"$bar_new\"" myws/wit-lock.json > lock.tmp
+mv lock.tmp myws/wit-lock.json
+
+wit -vv restore -n ws2 -w myws --from-bundles bundles > log 2>&1
+check "wit restore --from-bundles should succeed" [ $? -eq 0 ]
+foo_head=$(git -C ws2/foo rev-parse HEAD)
+check "foo should be restored from its bundle" [ "$foo_head" = "$foo_locked" ]
+foo_origin=$(git -C ws2/foo remote get-url origin)
+check "foo's origin should be its source" [ "$foo_origin" = "$PWD/foo" ]
+bar_head=$(git -C ws2/bar rev-parse HEAD)
+check "bar should be at the commit its bundle lacked" [ "$bar_head" = "$bar_new" ]
+grep -q "Executing \[git clone" log
+check "nothing should be cloned" [ $? -ne 0 ]
+
+report
+finish
@@ -0,0 +1,52 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+export WIT_CACHE_DIR=$PWD/cache
+
+make_repo 'foo'
+foo_commit=$(git -C foo rev-parse HEAD)
+make_repo 'bar'
+bar_commit=$(git -C bar rev-parse HEAD)
+
+# parent depends on foo then bar
+mkdir parent
+git -C parent init
+echo "[{\"commit\":\"$foo_commit\",\"name\":\"foo\",\"source\":\"$PWD/foo\"},
+       {\"commit\":\"$bar_commit\",\"name\":\"bar\",\"source\":\"$PWD/bar\"}]" | jq '.' >> parent/wit-manifest.json
+git -C parent add -A
+git -C parent commit -m "commit1"
+
+prereq off
+
+wit init ws1 -a $PWD/parent
+check "wit init should succeed" [ $? -eq 0 ]
+
+history=$WIT_CACHE_DIR/clone-history.json
+check "clone history should be recorded" [ -f $history ]
+foo_clone=$(jq -r ".[\"$PWD/foo\"].clone.seconds" $history)
+check "foo clone duration should be recorded" [ "$foo_clone" != "null" ]
+bar_size=$(jq -r ".[\"$PWD/bar\"].clone.bytes" $history)
+check "bar clone size should be recorded" [ "$bar_size" != "null" ]
+
+# Pretend bar is much slower to clone than foo
+jq ".[\"$PWD/bar\"].clone.seconds = 1000" $history > history.tmp
+mv history.tmp $history
+
+wit -j 1 init ws2 -a $PWD/parent > out2 2>&1
+check "wit init should succeed with history" [ $? -eq 0 ]
+first=$(grep -a -E "^Cloned (foo|bar)$" out2 | head -1 | cut -d" " -f2)
+check "the longest clone should start first" [ "$first" = "bar" ]
+
+# And now the other way around
+jq ".[\"$PWD/foo\"].clone.seconds = 2000" $history > history.tmp
+mv history.tmp $history
+
+wit -j 1 init ws3 -a $PWD/parent > out3 2>&1
+first=$(grep -a -E "^Cloned (foo|bar)$" out3 | head -1 | cut -d" " -f2)
+check "the longest clone should start first after the history changes" [ "$first" = "foo" ]
+
+report
+finish
@@ -0,0 +1,26 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+make_repo 'bar'
+
+prereq off
+
+wit -vv -j 2 init ws -a $PWD/foo -a $PWD/bar > out 2>&1
+check "wit init should succeed" [ $? -eq 0 ]
+
+grep -q "Starting with 2 parallel git jobs (max 2)" out
+check "-j should bound the initial clone concurrency" [ $? -eq 0 ]
+
+wit -vv init ws2 -a $PWD/foo > out2 2>&1
+grep -q "Starting with 4 parallel git jobs (max 64)" out2
+check "clone concurrency should start below the default -j" [ $? -eq 0 ]
+
+check "foo should be cloned" [ -d ws/foo ]
+check "bar should be cloned" [ -d ws/bar ]
+
+report
+finish
@@ -0,0 +1,120 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+foo_commit=$(git -C foo rev-parse HEAD)
+
+mkdir bar
+git -C bar init
+echo "[{\"commit\":\"$foo_commit\",\"name\":\"foo\",\"source\":\"$PWD/foo\"}]" | jq '.' >> bar/wit-manifest.json
+git -C bar add -A
+git -C bar commit -m "commit1"
+
+wit init myws -a $PWD/bar
+cd myws
+
+# what status and inspect print without a daemon
+wit status > status_expected
+wit inspect --tree > tree_expected
+
+prereq off
+
+wit daemon --idle-timeout 60 > ../daemon.log 2>&1 &
+for i in $(seq 50); do
+    [ -S .wit/daemon.sock ] && break
+    sleep 0.1
+done
+check "wit daemon should listen on .wit/daemon.sock" [ -S .wit/daemon.sock ]
+
+wit -vv status > status_log 2>&1
+check "wit status through the daemon should succeed" [ $? -eq 0 ]
+grep -q "Answered by the wit daemon" status_log
+check "wit status should be answered by the daemon" [ $? -eq 0 ]
+
+wit status > status_daemon
+cmp -s status_expected status_daemon
+check "the daemon should print the same status" [ $? -eq 0 ]
+
+wit inspect --tree > tree_daemon
+cmp -s tree_expected tree_daemon
+check "the daemon should print the same tree" [ $? -eq 0 ]
+
+wit -vv status > status_log 2>&1
+git_commands=$(grep -c "Executing \[git" status_log)
+check "a repeated status should run few git commands ($git_commands)" [ $git_commands -le 4 ]
+
+# uncommitted changes are never cached
+echo change >> foo/file
+wit status > status_daemon
+grep -q "foo (modified content)" status_daemon
+check "the daemon should see uncommitted changes" [ $? -eq 0 ]
+
+# a new commit invalidates the cached state
+git -C foo commit -q -am "commit2"
+wit status > status_daemon
+grep -q "foo (new commits)" status_daemon
+check "the daemon should see new commits" [ $? -eq 0 ]
+
+# a commit on a nested branch only touches refs/heads/feature/
+git -C bar checkout -q -b feature/x
+wit status > status_daemon
+git -C bar commit -q --allow-empty -m "commit2"
+wit status > status_daemon
+grep -q "bar (new commits)" status_daemon
+check "the daemon should see new commits on nested branches" [ $? -eq 0 ]
+
+WIT_DAEMON=0 wit -vv status > status_log 2>&1
+grep -q "Answered by the wit daemon" status_log
+check "WIT_DAEMON=0 should run in-process" [ $? -ne 0 ]
+
+wit daemon --stop
+check "wit daemon --stop should succeed" [ $? -eq 0 ]
+wait
+check "the socket should be removed" [ ! -e .wit/daemon.sock ]
+
+wit status > status_after
+check "wit status should run in-process once the daemon stopped" [ $? -eq 0 ]
+
+# a background prefetch opens its own repositories and logs outside of requests
+PYTHONPATH="$wit_root/lib" python3 -c "import threading
+from pathlib import Path
+from wit.backend import get_backend, set_backend
+from wit.daemon import PREFETCH_THREAD, SnapshotBackend, captured_output
+from wit.scheduler import AdaptiveLimit, run_parallel
+from wit.witlogger import getLogger
+from wit.workspace import WorkSpace
+log = getLogger()
+
+class Recording:
+    def __init__(self, backend):
+        self.backend, self.opened = backend, []
+    def open(self, name, wsroot):
+        self.opened.append(name)
+        return self.backend.open(name, wsroot)
+
+plain = Recording(get_backend())
+set_backend(SnapshotBackend(get_backend()))
+
+def prefetch():
+    log.info('from the prefetch thread')
+    run_parallel(lambda i: log.info('from a prefetch worker'), [1], AdaptiveLimit(1))
+    WorkSpace(Path.cwd(), []).prefetch(backend=plain)
+
+with captured_output() as out:
+    log.info('from the request')
+    t = threading.Thread(target=prefetch, name=PREFETCH_THREAD)
+    t.start()
+    t.join()
+print('CAPTURED', out.getvalue().replace(chr(10), '|'))
+print('OPENED', ' '.join(sorted(plain.opened)))
+" > prefetch_out 2>&1
+grep -qx "CAPTURED from the request|" prefetch_out
+check "prefetch logs should stay out of a request's output" [ $? -eq 0 ]
+grep -qx "OPENED bar foo" prefetch_out
+check "prefetch should open repositories through the backend it is given" [ $? -eq 0 ]
+
+report
+finish
@@ -0,0 +1,38 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+foo_commit=$(git -C foo rev-parse HEAD)
+
+# bar depends on a missing repo, listed before foo
+mkdir bar
+git -C bar init
+echo "[{\"commit\":\"$foo_commit\",\"name\":\"missing\",\"source\":\"$PWD/missing\"},
+       {\"commit\":\"$foo_commit\",\"name\":\"foo\",\"source\":\"$PWD/foo\"}]" | jq '.' >> bar/wit-manifest.json
+git -C bar add -A
+git -C bar commit -m "commit1"
+
+prereq off
+
+# With a single clone job, fail-fast never starts cloning foo
+wit -j 1 --fail-fast init ws1 -a $PWD/bar > out1 2>&1
+check "fail-fast init should fail" [ $? -ne 0 ]
+grep -q "Bad remote" out1
+check "fail-fast should report the bad remote" [ $? -eq 0 ]
+check "fail-fast should not clone foo" [ ! -d ws1/.wit/foo ]
+check "fail-fast should not leave a partial clone" [ ! -d ws1/.wit/missing ]
+
+wit -j 1 --no-fail-fast init ws2 -a $PWD/bar > out2 2>&1
+check "init should fail" [ $? -ne 0 ]
+grep -q "Bad remote" out2
+check "error should report the bad remote" [ $? -eq 0 ]
+check "outstanding clones should finish without fail-fast" [ -d ws2/.wit/foo ]
+
+CI=true wit -j 1 init ws3 -a $PWD/bar > out3 2>&1
+check "fail-fast should be the default in CI" [ ! -d ws3/.wit/foo ]
+
+report
+finish
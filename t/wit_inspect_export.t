@@ -0,0 +1,52 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+# app depends on an older commit of leaf than the workspace does
+make_repo 'leaf'
+old_leaf=$(git -C leaf rev-parse HEAD)
+echo "more" > leaf/file
+git -C leaf add -A
+git -C leaf commit -m "second commit"
+make_repo 'app'
+cat > app/wit-manifest.json << EOT
+[{"name": "leaf", "source": "$PWD/leaf", "commit": "$old_leaf"}]
+EOT
+git -C app add -A
+git -C app commit -m "depend on leaf"
+
+wit init myws -a $PWD/app -a $PWD/leaf
+cd myws
+
+prereq off
+
+# root, app, leaf and the older leaf app asks for; root to app and leaf, app to the older
+# leaf, which resolves to leaf
+wit inspect --dot > graph.dot
+check "wit inspect --dot should succeed" [ $? -eq 0 ]
+edges=$(grep -c -- "->" graph.dot)
+check "the DOT graph should have each edge once" [ "$edges" -eq 4 ]
+
+wit inspect --json > graph.json
+check "wit inspect --json should succeed" [ $? -eq 0 ]
+nodes=$(jq '.nodes | length' graph.json)
+check "the JSON graph should have four nodes" [ "$nodes" -eq 4 ]
+edges=$(jq '.edges | length' graph.json)
+check "the JSON graph should have four edges" [ "$edges" -eq 4 ]
+target=$(jq -r '.edges[] | select(.kind == "resolves") | .target' graph.json)
+leaf_id=$(jq -r '.nodes[] | select(.kind == "package" and (.label | startswith("leaf::"))) | .id' graph.json)
+check "the older leaf should resolve to the leaf package" [ "$target" = "$leaf_id" ]
+
+mkdir sub
+(cd sub && wit inspect --graphml -o graph.graphml)
+check "wit inspect --graphml -o should succeed" [ $? -eq 0 ]
+check "the GraphML graph should be written to the file" [ -f sub/graph.graphml ]
+nodes=$(grep -c "<node " sub/graph.graphml)
+check "the GraphML graph should have four nodes" [ "$nodes" -eq 4 ]
+edges=$(grep -c "<edge " sub/graph.graphml)
+check "the GraphML graph should have four edges" [ "$edges" -eq 4 ]
+
+report
+finish
@@ -0,0 +1,48 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+# top depends on left and right, which both depend on shared, which depends on leaf
+make_repo 'leaf'
+make_repo 'shared'
+cat > shared/wit-manifest.json << EOT
+[{"name": "leaf", "source": "$PWD/leaf", "commit": "$(git -C leaf rev-parse HEAD)"}]
+EOT
+git -C shared add -A
+git -C shared commit -m "depend on leaf"
+for side in left right; do
+    make_repo $side
+    cat > $side/wit-manifest.json << EOT
+[{"name": "shared", "source": "$PWD/shared", "commit": "$(git -C shared rev-parse HEAD)"}]
+EOT
+    git -C $side add -A
+    git -C $side commit -m "depend on shared"
+done
+make_repo 'top'
+cat > top/wit-manifest.json << EOT
+[
+    {"name": "left", "source": "$PWD/left", "commit": "$(git -C left rev-parse HEAD)"},
+    {"name": "right", "source": "$PWD/right", "commit": "$(git -C right rev-parse HEAD)"}
+]
+EOT
+git -C top add -A
+git -C top commit -m "depend on left and right"
+
+wit init myws -a $PWD/top
+cd myws
+
+prereq off
+
+wit inspect --tree > out
+check "wit inspect --tree should succeed" [ $? -eq 0 ]
+shared=$(grep -c "shared::" out)
+check "shared should be listed under both of its dependents" [ "$shared" -eq 2 ]
+leaf=$(grep -c "leaf::" out)
+check "shared should only be expanded where it first appears" [ "$leaf" -eq 1 ]
+grep -q "^│  └─shared::" out
+check "shared should first appear under left" [ $? -eq 0 ]
+
+report
+finish
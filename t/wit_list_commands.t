@@ -0,0 +1,44 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+wit --list-commands > commands
+check "wit --list-commands should succeed" [ $? -eq 0 ]
+
+for command in init restore add-pkg update-pkg add-dep update-dep status update inspect foreach; do
+    grep -q "^$command	" commands
+    check "$command should be listed" [ $? -eq 0 ]
+done
+
+# every listed command should be one the parser accepts
+for command in $(cut -f1 commands); do
+    wit $command -h > /dev/null 2>&1
+    check "wit $command -h should succeed" [ $? -eq 0 ]
+done
+
+wit --version > version
+check "wit --version should succeed" [ $? -eq 0 ]
+grep -q "^wit " version
+check "wit --version should print the version" [ $? -eq 0 ]
+
+# the fast path must not load the resolver or the parser
+loaded_modules() {
+    PYTHONPATH="$wit_root/lib" python3 -c "import atexit, runpy, sys
+atexit.register(lambda: sys.stderr.write('\\n'.join(sorted(sys.modules)) + '\\n'))
+sys.argv = ['wit', '$1']
+runpy.run_module('wit', run_name='__main__')" > /dev/null 2> modules
+}
+
+loaded_modules --version
+check "wit --version should run from python" [ $? -eq 0 ]
+grep -q "^wit.workspace$" modules
+check "wit --version should not import wit.workspace" [ $? -ne 0 ]
+
+loaded_modules --list-commands
+grep -q "^argparse$" modules
+check "wit --list-commands should not import argparse" [ $? -ne 0 ]
+grep -q "^wit.commands$" modules
+check "wit --list-commands should be answered by wit.commands" [ $? -eq 0 ]
+
+report
+finish
@@ -0,0 +1,34 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+wit init reference -a $PWD/foo
+
+prereq off
+
+# a reference would make git copy the objects again with --dissociate
+WIT_WORKSPACE_REFERENCE=$PWD/reference wit -vv init myws -a $PWD/foo > log 2>&1
+check "wit init should succeed" [ $? -eq 0 ]
+grep -q "Executing \[git clone --no-checkout $PWD/foo" log
+check "a local source should be cloned without --reference" [ $? -eq 0 ]
+linked=$(find myws/foo/.git/objects -type f -links +1 | wc -l)
+check "the objects of a local source should be hardlinked" [ "$linked" -gt 0 ]
+
+WIT_LOCAL_CLONE=shared wit -vv init sharedws -a $PWD/foo > log 2>&1
+check "wit init with shared clones should succeed" [ $? -eq 0 ]
+grep -q "Executing \[git clone --shared" log
+check "a local source should be cloned with --shared" [ $? -eq 0 ]
+grep -q "Executing \[git repack -a -d\]" log
+check "a shared clone should be repacked at checkout" [ $? -eq 0 ]
+check "a checked out package should not borrow objects" [ ! -f sharedws/foo/.git/objects/info/alternates ]
+git -C sharedws/foo fsck > /dev/null 2>&1
+check "a checked out package should stand alone" [ $? -eq 0 ]
+
+WIT_LOCAL_CLONE=bogus wit init badws -a $PWD/foo > out 2>&1
+check "an unknown WIT_LOCAL_CLONE should be refused" [ $? -ne 0 ]
+
+report
+finish
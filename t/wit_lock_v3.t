@@ -0,0 +1,62 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'zleaf'
+zleaf_commit=$(git -C zleaf rev-parse HEAD)
+make_repo 'mid'
+cat > mid/wit-manifest.json << EOT
+[{"name": "zleaf", "source": "$PWD/zleaf", "commit": "$zleaf_commit"}]
+EOT
+git -C mid add -A
+git -C mid commit -m "depend on zleaf"
+mid_commit=$(git -C mid rev-parse HEAD)
+
+prereq off
+
+WIT_LOCK_VERSION=3 wit init myws -a $PWD/mid > out 2>&1
+check "wit init with a version 3 lockfile should succeed" [ $? -eq 0 ]
+cd myws
+version=$(jq '.version' wit-lock.json)
+check "the lockfile should be version 3" [ "$version" = "3" ]
+dep=$(jq -r '.packages.mid.dependencies[0].name' wit-lock.json)
+check "the lockfile should record dependency edges" [ "$dep" = "zleaf" ]
+tree=$(jq -r '.packages.mid.tree' wit-lock.json)
+check "the lockfile should record the tree" [ "$tree" = "$(git -C mid rev-parse $mid_commit^{tree})" ]
+manifest=$(jq -r '.packages.mid.manifest' wit-lock.json)
+check "the lockfile should record the manifest blob" [ "$manifest" = "$(git -C mid rev-parse $mid_commit:wit-manifest.json)" ]
+time=$(jq -r '.packages.zleaf.time' wit-lock.json)
+check "the lockfile should record the commit time" [ "$time" = "$(git -C zleaf log -n1 --format=%ct)" ]
+
+wit update > out 2>&1
+version=$(jq '.version' wit-lock.json)
+check "wit update should keep writing version 3" [ "$version" = "3" ]
+
+wit -vv foreach --topo pwd > out 2>&1
+check "wit foreach --topo should succeed" [ $? -eq 0 ]
+order=$(grep "^Entering" out | cut -d"'" -f2 | tr -d "\n")
+check "dependencies should come first" [ "$order" = "zleafmid" ]
+grep -q "Executing \[git show" out
+check "the order should come from the lockfile alone" [ $? -ne 0 ]
+
+wit status > out 2>&1
+check "wit status should read a version 3 lockfile" [ $? -eq 0 ]
+
+cd ..
+wit restore -n restored -w myws > out 2>&1
+check "wit restore from a version 3 lockfile should succeed" [ $? -eq 0 ]
+cd restored
+wit -vv status > out 2>&1
+check "wit status in the restored workspace should succeed" [ $? -eq 0 ]
+grep -q "Executing \[git show" out
+check "the first resolve after restore should not read manifests from git" [ $? -ne 0 ]
+cd ../myws
+
+WIT_LOCK_VERSION=2 wit update > out 2>&1
+version=$(jq '.version' wit-lock.json)
+check "WIT_LOCK_VERSION=2 should write the unversioned format" [ "$version" = "null" ]
+
+report
+finish
@@ -0,0 +1,57 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+wit init myws -a $PWD/foo
+
+echo "new" > foo/file
+git -C foo commit -am "commit2"
+git -C foo tag v2
+foo_commit=$(git -C foo rev-parse HEAD)
+
+cd myws
+origin_before=$(git -C foo rev-parse origin/master)
+
+prereq off
+
+wit prefetch
+check "wit prefetch should succeed" [ $? -eq 0 ]
+
+prefetched=$(git -C foo rev-parse refs/wit-prefetch/heads/master)
+check "the remote branch should be prefetched" [ "$prefetched" = "$foo_commit" ]
+
+prefetched=$(git -C foo rev-parse refs/wit-prefetch/tags/v2)
+check "remote tags should be prefetched" [ "$prefetched" = "$foo_commit" ]
+
+origin_after=$(git -C foo rev-parse origin/master)
+check "origin/master should be left alone" [ "$origin_after" = "$origin_before" ]
+
+git -C foo rev-parse -q --verify refs/tags/v2 > /dev/null
+check "local tags should be left alone" [ $? -ne 0 ]
+
+jq -e '.foo.time' .wit/prefetch.json > /dev/null
+check "the prefetch time should be recorded" [ $? -eq 0 ]
+
+wit -v prefetch --max-age 3600 > out 2>&1
+grep -q "Skipping foo" out
+check "--max-age should skip recently prefetched packages" [ $? -eq 0 ]
+
+# the prefetched commit is found locally
+wit --profile update-pkg foo::$foo_commit > out 2> profile
+check "wit update-pkg should succeed" [ $? -eq 0 ]
+grep -q "^fetch " profile
+check "wit update-pkg should not fetch" [ $? -ne 0 ]
+
+wit --profile update > out 2> profile
+check "wit update should succeed" [ $? -eq 0 ]
+grep -q "^fetch " profile
+check "wit update should not fetch" [ $? -ne 0 ]
+
+checked_out=$(git -C foo rev-parse HEAD)
+check "foo should be checked out to the prefetched commit" [ "$checked_out" = "$foo_commit" ]
+
+report
+finish
@@ -0,0 +1,39 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+wit init myws -a $PWD/foo
+cd myws
+
+prereq off
+
+wit --profile status > out 2> profile
+check "wit --profile status should succeed" [ $? -eq 0 ]
+
+grep -q "^git profile: [0-9]* commands" profile
+check "profile summary should be printed" [ $? -eq 0 ]
+
+grep -q "^rev-parse " profile
+check "profile should have a row per git subcommand" [ $? -eq 0 ]
+
+grep -q "^foo " profile
+check "profile should have a row per package" [ $? -eq 0 ]
+
+grep -q "^resolve " profile
+check "profile should have a row per wit operation" [ $? -eq 0 ]
+
+grep -q "^GitRepo.get_commit " profile
+check "profile should report cache hit rates" [ $? -eq 0 ]
+
+grep -q "git profile" out
+check "profile should not be mixed into the command output" [ $? -ne 0 ]
+
+wit status 2> no_profile
+grep -q "git profile" no_profile
+check "profile should only be printed with --profile" [ $? -ne 0 ]
+
+report
+finish
@@ -0,0 +1,82 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+# Pygit2Repo must answer every query exactly as GitRepo does
+if ! python3 -c "import pygit2" 2> /dev/null; then
+    echo "pygit2 is not installed, skipping"
+    exit 0
+fi
+
+prereq on
+
+into_test_dir
+
+# leaf is added by a tag
+make_repo 'leaf'
+git -C leaf tag v1
+echo "two" > leaf/file
+git -C leaf commit -am "commit2"
+
+# other is moved to a branch its clone only knows as origin/feature
+make_repo 'other'
+git -C other checkout -b feature
+echo "feature" > other/file
+git -C other commit -am "feature"
+git -C other checkout master
+
+# top is added by an abbreviated hash and depends on sub by a submodule pointer only
+make_repo 'sub'
+make_repo 'top'
+git -C top -c protocol.file.allow=always submodule add $PWD/sub
+git -C top commit -m "add submodule"
+top_short=$(git -C top rev-parse --short HEAD)
+
+prereq off
+
+root=$PWD
+
+for backend in 1 0; do
+    mkdir backend$backend
+    cd backend$backend
+    export WIT_PYGIT2=$backend
+    wit init ws -a $root/top::$top_short -a $root/leaf::v1 -a $root/other > init.log 2>&1
+    check "wit init with WIT_PYGIT2=$backend should succeed" [ $? -eq 0 ]
+    # the only line naming the workspace
+    sed "s|/backend$backend/ws|/ws|" init.log > init.out
+    cd ws
+    wit update-pkg other::feature > ../update_pkg.out 2>&1
+    check "wit update-pkg with WIT_PYGIT2=$backend should succeed" [ $? -eq 0 ]
+    wit update > ../update.out 2>&1
+    check "wit update with WIT_PYGIT2=$backend should succeed" [ $? -eq 0 ]
+    wit status > ../status.out 2>&1
+    wit inspect --tree > ../tree.out 2>&1
+    wit inspect --json > ../json.out 2>&1
+    cp wit-workspace.json wit-lock.json ..
+    PYTHONPATH="$wit_root/lib:$PYTHONPATH" python3 -c "
+from pathlib import Path
+from wit.gitrepo import GitBackend
+print(type(GitBackend().open('top', Path('.'))).__name__)" > ../backend.out
+    cd ../..
+done
+unset WIT_PYGIT2
+
+grep -qx Pygit2Repo backend1/backend.out
+check "WIT_PYGIT2=1 should use Pygit2Repo" [ $? -eq 0 ]
+grep -qx GitRepo backend0/backend.out
+check "WIT_PYGIT2=0 should use GitRepo" [ $? -eq 0 ]
+
+grep -q "sub" backend0/tree.out
+check "the submodule should be a dependency" [ $? -eq 0 ]
+leaf_commit=$(jq -r '.[] | select(.name=="leaf") | .commit' backend0/wit-workspace.json)
+check "the tag should be resolved" [ "$leaf_commit" = "$(git -C leaf rev-parse v1)" ]
+other_commit=$(jq -r '.[] | select(.name=="other") | .commit' backend0/wit-workspace.json)
+check "the remote branch should be resolved" [ "$other_commit" = "$(git -C other rev-parse feature)" ]
+
+for file in init.out update_pkg.out update.out status.out tree.out json.out wit-workspace.json wit-lock.json; do
+    cmp -s backend1/$file backend0/$file
+    check "$file should not depend on WIT_PYGIT2" [ $? -eq 0 ]
+done
+
+report
+finish
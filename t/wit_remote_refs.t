@@ -0,0 +1,43 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+foo_source=$PWD/foo
+wit init myws -a $foo_source
+cd myws
+
+# wit records commits, but hand-written manifests can name branches
+jq '.[0].commit = "master"' wit-workspace.json > manifest.tmp
+mv manifest.tmp wit-workspace.json
+
+prereq off
+
+wit -vv update > log 2>&1
+check "wit update should succeed" [ $? -eq 0 ]
+ls_remotes=$(grep -c "Executing \[git ls-remote $foo_source\]" log)
+check "the remote should be listed once" [ "$ls_remotes" -eq 1 ]
+grep -q "Executing \[git fetch" log
+check "an up to date branch should not be fetched" [ $? -ne 0 ]
+check "the listing should be kept in .wit" [ -f .wit/remote-refs.json ]
+
+# move the branch on the remote
+echo "new" > ../foo/file
+git -C ../foo commit -q -am "commit2"
+
+wit -vv update > log 2>&1
+check "wit update should succeed after the remote moved" [ $? -eq 0 ]
+grep -q "Executing \[git fetch" log
+check "a branch that moved on its remote should be fetched" [ $? -eq 0 ]
+
+# with a TTL, later runs use the kept listing
+WIT_REMOTE_REFS_TTL=3600 wit update > out 2>&1
+WIT_REMOTE_REFS_TTL=3600 wit -vv update > log 2>&1
+check "wit update should succeed with a TTL" [ $? -eq 0 ]
+grep -q "Executing \[git ls-remote $foo_source\]" log
+check "a listing within its TTL should be reused" [ $? -ne 0 ]
+
+report
+finish
@@ -0,0 +1,42 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'leaf'
+leaf_commit=$(git -C leaf rev-parse HEAD)
+make_repo 'mid'
+cat > mid/wit-manifest.json << EOT
+[{"name": "leaf", "source": "$PWD/leaf", "commit": "$leaf_commit"}]
+EOT
+git -C mid add -A
+git -C mid commit -m "depend on leaf"
+make_repo 'other'
+
+wit init myws -a $PWD/mid -a $PWD/other
+cd myws
+
+prereq off
+
+check "resolution should be cached" [ -f .wit/resolve-cache.json ]
+grep -q "has_commit" .wit/resolve-cache.json
+check "whether a repository has a commit should not be cached" [ $? -ne 0 ]
+
+wit -vv update > log 2>&1
+check "wit update should succeed" [ $? -eq 0 ]
+grep -q "Executing \[git show" log
+check "an unchanged workspace should not read manifests again" [ $? -ne 0 ]
+
+echo "new" > ../other/file
+git -C ../other commit -q -am "commit2"
+wit update-pkg other::$(git -C ../other rev-parse HEAD) > out 2>&1
+wit -vv update > log 2>&1
+check "wit update after update-pkg should succeed" [ $? -eq 0 ]
+other_queries=$(grep "Executing \[git \(show\|log\|merge-base\)" log | grep -c "/other\]")
+check "the changed package should be queried" [ "$other_queries" -gt 0 ]
+rest_queries=$(grep "Executing \[git \(show\|log\|merge-base\)" log | grep -vc "/other\]")
+check "unchanged packages should not be queried" [ "$rest_queries" -eq 0 ]
+
+report
+finish
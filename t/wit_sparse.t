@@ -0,0 +1,63 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+mkdir hw
+git -C hw init
+mkdir hw/rtl hw/scripts hw/docs
+for d in rtl scripts docs; do echo $d > hw/$d/file; done
+git -C hw add -A
+git -C hw commit -m "commit1"
+hw_commit=$(git -C hw rev-parse HEAD)
+
+make_repo 'app'
+cat > app/wit-manifest.json << EOT
+[{"name": "hw", "source": "$PWD/hw", "commit": "$hw_commit", "sparse": ["scripts"]}]
+EOT
+git -C app add -A
+git -C app commit -m "depend on hw"
+
+wit init myws
+cd myws
+cat > wit-workspace.json << EOT
+[{"name": "hw", "source": "$PWD/../hw", "commit": "$hw_commit", "sparse": ["rtl"]}]
+EOT
+
+prereq off
+
+wit update > out 2>&1
+check "wit update should succeed" [ $? -eq 0 ]
+check "a sparse path should be checked out" [ -f hw/rtl/file ]
+check "other directories should not be checked out" [ ! -e hw/docs ]
+
+wit add-pkg $PWD/../app > out 2>&1
+wit update > out 2>&1
+check "wit update with a second dependent should succeed" [ $? -eq 0 ]
+check "the first dependent's path should stay" [ -f hw/rtl/file ]
+check "the second dependent's path should be added" [ -f hw/scripts/file ]
+check "paths nobody asked for should stay out" [ ! -e hw/docs ]
+sparse=$(jq -c '.hw.sparse' wit-lock.json)
+check "the lockfile should record the merged paths" [ "$sparse" = '["rtl","scripts"]' ]
+
+jq '(.[] | select(.name == "hw")) |= del(.sparse)' wit-workspace.json > manifest.tmp
+mv manifest.tmp wit-workspace.json
+wit update > out 2>&1
+check "wit update without sparse paths should succeed" [ $? -eq 0 ]
+check "a dependent without paths should get the whole tree" [ -f hw/docs/file ]
+
+git -C hw sparse-checkout set docs > out 2>&1
+wit update > out 2>&1
+check "wit update should succeed with the user's own sparse checkout" [ $? -eq 0 ]
+check "a sparse checkout wit did not set up should be left alone" [ ! -e hw/rtl ]
+
+jq '(.[] | select(.name == "hw")) |= (.sparse = "rtl")' wit-workspace.json > manifest.tmp
+mv manifest.tmp wit-workspace.json
+wit update > out 2>&1
+check "wit update should reject sparse paths that are not a list" [ $? -ne 0 ]
+grep -q "must be a list of paths" out
+check "the error should say what is wrong with the sparse paths" [ $? -eq 0 ]
+
+report
+finish
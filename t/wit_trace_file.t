@@ -0,0 +1,36 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+foo_commit=$(git -C foo rev-parse HEAD)
+
+mkdir bar
+git -C bar init
+echo "[{\"commit\":\"$foo_commit\",\"name\":\"foo\",\"source\":\"$PWD/foo\"}]" | jq '.' >> bar/wit-manifest.json
+git -C bar add -A
+git -C bar commit -m "commit1"
+
+prereq off
+
+wit --trace-file trace.json init myws -a $PWD/bar
+check "wit init with --trace-file should succeed" [ $? -eq 0 ]
+
+jq -e '.traceEvents | length > 0' trace.json
+check "trace file should contain events" [ $? -eq 0 ]
+
+for phase in resolve load clone checkout "write lock" "wit init"; do
+    jq -e --arg p "$phase" '[.traceEvents[] | select(.ph == "X" and .name == $p)] | length > 0' trace.json
+    check "trace should have a '$phase' span" [ $? -eq 0 ]
+done
+
+jq -e '[.traceEvents[] | select(.name == "git clone" and .args.repo == "foo")] | length == 1' trace.json
+check "trace should have a span per git command" [ $? -eq 0 ]
+
+jq -e '[.traceEvents[] | select(.ph == "M") | .args.name | select(startswith("wit-worker"))] | length > 0' trace.json
+check "parallel clones should run on named worker tracks" [ $? -eq 0 ]
+
+report
+finish
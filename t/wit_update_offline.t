@@ -0,0 +1,52 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'foo'
+make_repo 'bar'
+wit init myws -a $PWD/foo -a $PWD/bar
+cd myws
+
+# commits made after the workspace last fetched
+echo "new" > ../foo/file
+git -C ../foo commit -q -am "commit2"
+foo_new=$(git -C ../foo rev-parse HEAD)
+echo "new" > ../bar/file
+git -C ../bar commit -q -am "commit2"
+bar_new=$(git -C ../bar rev-parse HEAD)
+
+# the remotes are out of reach from here on
+mv ../foo ../foo.away
+mv ../bar ../bar.away
+jq ".[0].commit = \"$foo_new\" | .[1].commit = \"$bar_new\"" wit-workspace.json > manifest.tmp
+mv manifest.tmp wit-workspace.json
+
+prereq off
+
+wit -vv update --offline > log 2>&1
+check "wit update --offline should fail when commits are missing" [ $? -ne 0 ]
+grep -q "'foo' needs '$foo_new'" log
+check "the missing foo commit should be listed" [ $? -eq 0 ]
+grep -q "'bar' needs '$bar_new'" log
+check "the missing bar commit should be listed" [ $? -eq 0 ]
+grep -q "Executing \[git \(fetch\|clone\|ls-remote\)" log
+check "nothing should be fetched, cloned or listed" [ $? -ne 0 ]
+
+# repo paths count as local
+mkdir ../mirror
+mv ../foo.away ../mirror/foo
+mv ../bar.away ../mirror/bar
+wit --repo-path $(cd ../mirror && pwd) -vv update --offline > log 2>&1
+check "wit update --offline should succeed from repo paths" [ $? -eq 0 ]
+grep -q "Executing \[git fetch --all\]" log
+check "other remotes should not be fetched" [ $? -ne 0 ]
+foo_head=$(git -C foo rev-parse HEAD)
+check "foo should be checked out at the new commit" [ "$foo_head" = "$foo_new" ]
+
+wit status --offline > out 2>&1
+check "wit status --offline should succeed" [ $? -eq 0 ]
+
+report
+finish
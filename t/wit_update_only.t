@@ -0,0 +1,55 @@
+#!/bin/sh
+
+. $(dirname $0)/test_util.sh
+
+prereq on
+
+make_repo 'lib'
+lib_commit=$(git -C lib rev-parse HEAD)
+make_repo 'app'
+cat > app/wit-manifest.json << EOT
+[{"name": "lib", "source": "$PWD/lib", "commit": "$lib_commit"}]
+EOT
+git -C app add -A
+git -C app commit -m "depend on lib"
+make_repo 'other'
+
+wit init myws -a $PWD/app -a $PWD/other --no-update
+cd myws
+
+prereq off
+
+wit update --only app > out 2>&1
+check "wit update --only should succeed" [ $? -eq 0 ]
+check "the named package should be checked out" [ -d app ]
+check "its dependencies should be checked out" [ -d lib ]
+check "other packages should not be checked out" [ ! -d other ]
+check "other packages should stay in .wit" [ -d .wit/other ]
+materialized=$(jq '.other.materialized' wit-lock.json)
+check "the lockfile should mark other as not materialized" [ "$materialized" = "false" ]
+materialized=$(jq '.lib.materialized' wit-lock.json)
+check "the lockfile should not mark checked out packages" [ "$materialized" = "null" ]
+
+wit status > out 2>&1
+check "wit status should succeed" [ $? -eq 0 ]
+grep -A1 "only in .wit" out | grep -q "other"
+check "wit status should list other as only in .wit" [ $? -eq 0 ]
+grep -q "new commits" out
+check "wit status should not report other as dirty" [ $? -ne 0 ]
+
+wit foreach pwd > out 2>&1
+check "wit foreach should succeed" [ $? -eq 0 ]
+grep -q "Entering 'other'" out
+check "wit foreach should skip other" [ $? -ne 0 ]
+
+wit update --only nonesuch > out 2>&1
+check "wit update --only with an unknown package should fail" [ $? -ne 0 ]
+
+wit update > out 2>&1
+check "wit update should succeed" [ $? -eq 0 ]
+check "wit update should check out everything" [ -d other ]
+materialized=$(jq '.other.materialized' wit-lock.json)
+check "the lockfile should no longer mark other" [ "$materialized" = "null" ]
+
+report
+finish